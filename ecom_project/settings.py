@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     'users',
     'products',
     'orders',
+    'jobs',
 ]
 
 MIDDLEWARE = [
@@ -67,6 +68,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "products.context_processors.cart",
             ],
         },
     },
@@ -89,6 +91,18 @@ DATABASES = {
     }
 }
 
+# Cache
+# Local memory works for development and tests. In production point this at a
+# shared backend (Redis/Memcached) so every worker sees the same cached catalog
+# fragments, facet counts and version stamps.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "shopx-default",
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -139,12 +153,19 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 
+# Processes validating each uploaded product import (1 validates in the request process)
+PRODUCT_IMPORT_WORKERS = int(os.environ.get('PRODUCT_IMPORT_WORKERS', 2))
+
+
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'product_list'
 LOGOUT_REDIRECT_URL = 'product_list'
 
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Mail is queued in the outbox and delivered by `manage.py send_outbox`. For local
+# development set EMAIL_BACKEND=django.core.mail.backends.console.EmailBackend, or
+# the filebased backend to write messages under EMAIL_FILE_PATH.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', os.path.join(BASE_DIR, 'sent_emails'))
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -0,0 +1,36 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Job, OutboundEmail
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_at', 'finished_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'unique_key')
+    readonly_fields = ('locked_by', 'locked_until', 'last_error', 'created_at', 'finished_at')
+    actions = ['retry_jobs']
+
+    @admin.action(description="Retry selected jobs now")
+    def retry_jobs(self, request, queryset):
+        retried = queryset.exclude(status=Job.RUNNING).update(
+            status=Job.PENDING, attempts=0, run_at=timezone.now(), finished_at=None
+        )
+        self.message_user(request, f"Queued {retried} jobs for retry.")
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subject', 'status', 'attempts', 'send_after', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'dedupe_key')
+    readonly_fields = ('locked_by', 'locked_until', 'last_error', 'created_at', 'sent_at')
+    actions = ['retry_emails']
+
+    @admin.action(description="Retry selected dead or pending emails now")
+    def retry_emails(self, request, queryset):
+        retried = queryset.filter(status__in=[OutboundEmail.DEAD, OutboundEmail.PENDING]).update(
+            status=OutboundEmail.PENDING, attempts=0, send_after=timezone.now()
+        )
+        self.message_user(request, f"Queued {retried} emails for delivery.")
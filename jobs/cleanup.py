@@ -0,0 +1,15 @@
+def delete_in_batches(queryset, batch_size=1000):
+    """
+    Deletes the queryset's rows a primary-key batch at a time, so a large
+    purge never holds locks across the whole table. Returns how many rows of
+    the queryset's model were removed (cascaded rows are not counted).
+    """
+    model = queryset.model
+    removed = 0
+    while True:
+        batch = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if batch:
+            removed += model.objects.filter(pk__in=batch).delete()[1].get(model._meta.label, 0)
+        # A short batch was the last one
+        if len(batch) < batch_size:
+            return removed
@@ -0,0 +1,63 @@
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from jobs.queue import claim, execute, purge_finished
+
+PURGE_INTERVAL = 60 * 60
+
+
+def _run(job):
+    # Pool threads keep their own connections; drop any that went stale while idle
+    close_old_connections()
+    try:
+        return execute(job)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Runs queued background jobs on a thread pool until stopped (or until the queue is empty with --once)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--visibility-timeout', type=int, default=300, help="Seconds before an unfinished job is retried elsewhere.")
+        parser.add_argument('--once', action='store_true', help="Exit when no job is due.")
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        timeout = timedelta(seconds=options['visibility_timeout'])
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+
+        succeeded = failed = 0
+        last_purge = 0
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='jobs') as pool:
+            try:
+                while not stopping.is_set():
+                    if time.monotonic() - last_purge > PURGE_INTERVAL:
+                        purge_finished()
+                        last_purge = time.monotonic()
+
+                    jobs = claim(workers, timeout)
+                    if not jobs:
+                        if options['once']:
+                            break
+                        stopping.wait(options['poll_interval'])
+                        continue
+
+                    for ok in pool.map(_run, jobs):
+                        if ok:
+                            succeeded += 1
+                        else:
+                            failed += 1
+            except KeyboardInterrupt:
+                pass
+
+        self.stdout.write(self.style.SUCCESS(f"Ran {succeeded + failed} jobs ({failed} failed)."))
@@ -0,0 +1,47 @@
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from jobs.outbox import BATCH_SIZE, purge_sent, send_pending
+
+PURGE_INTERVAL = 60 * 60
+
+# Messages sent per drain before checking for a stop request, so SIGTERM is
+# honoured under steady load
+DRAIN_LIMIT = 1000
+
+
+class Command(BaseCommand):
+    help = "Delivers queued outbound email, keeping one SMTP connection open while there is work."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the outbox is empty.")
+        parser.add_argument('--once', action='store_true', help="Exit when the outbox is empty.")
+
+    def handle(self, *args, **options):
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+
+        sent = failed = 0
+        last_purge = 0
+        try:
+            while not stopping.is_set():
+                if time.monotonic() - last_purge > PURGE_INTERVAL:
+                    purge_sent()
+                    last_purge = time.monotonic()
+
+                # Opens the connection only when there is mail and closes it once idle
+                batch_sent, batch_failed = send_pending(limit=DRAIN_LIMIT, batch_size=options['batch_size'])
+                sent += batch_sent
+                failed += batch_failed
+                if not batch_sent + batch_failed:
+                    if options['once']:
+                        break
+                    stopping.wait(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"Sent {sent} emails ({failed} failed attempts)."))
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:15
+
+from django.db import migrations, models
+
+
+def extend_queued_retries(apps, schema_editor):
+    # Mail still waiting gets the new retry budget too
+    OutboundEmail = apps.get_model("jobs", "OutboundEmail")
+    OutboundEmail.objects.filter(
+        status__in=["Pending", "Sending"], max_attempts=5
+    ).update(max_attempts=12)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("jobs", "0002_outbound_email"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="outboundemail",
+            name="max_attempts",
+            field=models.PositiveIntegerField(default=12),
+        ),
+        migrations.RunPython(extend_queued_retries, migrations.RunPython.noop),
+    ]
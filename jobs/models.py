@@ -0,0 +1,94 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    One unit of background work, stored in the main database so it commits
+    (or rolls back) together with the request that enqueued it.
+    """
+    PENDING = 'Pending'
+    RUNNING = 'Running'
+    DONE = 'Done'
+    FAILED = 'Failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+
+    # Visibility timeout: a Running job whose lock has lapsed is handed to another worker
+    locked_until = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=32, blank=True, db_index=True)
+
+    # Deduplicates jobs waiting to run; cleared once a worker claims the job
+    unique_key = models.CharField(max_length=200, null=True, blank=True, unique=True)
+
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['run_at']
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_due_idx'),
+            models.Index(fields=['status', 'locked_until'], name='job_lock_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+
+class OutboundEmail(models.Model):
+    """
+    Transactional mail waiting for delivery by `manage.py send_outbox`, so
+    requests never wait on the SMTP relay. Messages that keep failing end up
+    Dead (dead-lettered) for inspection and manual retry.
+    """
+    PENDING = 'Pending'
+    SENDING = 'Sending'
+    SENT = 'Sent'
+    DEAD = 'Dead'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (DEAD, 'Dead'),
+    )
+
+    to = models.JSONField()  # list of recipient addresses
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=12)
+    send_after = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=32, blank=True, db_index=True)
+
+    # Makes queueing idempotent, e.g. one confirmation per order
+    dedupe_key = models.CharField(max_length=200, null=True, blank=True, unique=True)
+
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['send_after']
+        indexes = [
+            models.Index(fields=['status', 'send_after'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
@@ -0,0 +1,188 @@
+import logging
+import uuid
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .cleanup import delete_in_batches
+from .models import OutboundEmail
+from .queue import backoff
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+
+# How long a claimed message stays invisible to other senders
+VISIBILITY_TIMEOUT = timedelta(minutes=2)
+
+# Sent messages are kept this long for support lookups
+RETENTION = timedelta(days=30)
+
+# Retry delay doubles from a minute up to an hour, so with the default
+# max_attempts (12) a message rides out about six hours of relay downtime
+# before it is dead-lettered
+BACKOFF_BASE = 60
+BACKOFF_CAP = 60 * 60
+
+
+def queue_email(to, subject, body, from_email=None, dedupe_key=None):
+    """
+    Adds a message to the outbox; delivery happens in the send_outbox worker.
+    With dedupe_key, queueing the same message again is a no-op.
+    """
+    fields = {
+        'to': [to] if isinstance(to, str) else list(to),
+        'subject': subject,
+        'body': body,
+        'from_email': from_email or settings.DEFAULT_FROM_EMAIL,
+    }
+    if dedupe_key is None:
+        return OutboundEmail.objects.create(**fields)
+    message, _ = OutboundEmail.objects.get_or_create(dedupe_key=dedupe_key, defaults=fields)
+    return message
+
+
+def queue_emails(messages, batch_size=1000):
+    """
+    Bulk version of queue_email for fan-out jobs: `messages` is an iterable of
+    dicts with to, subject, body and optionally from_email/dedupe_key. Rows
+    whose dedupe_key is already queued are skipped.
+    """
+    rows = (
+        OutboundEmail(
+            to=[message['to']] if isinstance(message['to'], str) else list(message['to']),
+            subject=message['subject'],
+            body=message['body'],
+            from_email=message.get('from_email') or settings.DEFAULT_FROM_EMAIL,
+            dedupe_key=message.get('dedupe_key'),
+        )
+        for message in messages
+    )
+    # Chunked here so a large generator is never materialized at once
+    while batch := list(islice(rows, batch_size)):
+        OutboundEmail.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def _due(now):
+    return Q(status=OutboundEmail.PENDING, send_after__lte=now) | Q(status=OutboundEmail.SENDING, locked_until__lte=now)
+
+
+def claim(limit=BATCH_SIZE, visibility_timeout=VISIBILITY_TIMEOUT):
+    """Leases up to `limit` due messages with a guarded UPDATE (same scheme as jobs.queue.claim)."""
+    now = timezone.now()
+    candidates = list(
+        OutboundEmail.objects.filter(_due(now)).order_by('send_after', 'pk').values_list('pk', flat=True)[:limit]
+    )
+    if not candidates:
+        return []
+    token = uuid.uuid4().hex
+    OutboundEmail.objects.filter(_due(now), pk__in=candidates).update(
+        status=OutboundEmail.SENDING,
+        locked_by=token,
+        locked_until=now + visibility_timeout,
+        attempts=F('attempts') + 1,
+    )
+    return list(OutboundEmail.objects.filter(locked_by=token, status=OutboundEmail.SENDING))
+
+
+def _failed(message, error):
+    now = timezone.now()
+    fields = {'locked_until': None, 'last_error': error}
+    if message.attempts >= message.max_attempts:
+        fields['status'] = OutboundEmail.DEAD
+        logger.error("Dead-lettered email %s after %s attempts: %s", message.pk, message.attempts, error)
+    else:
+        fields.update(status=OutboundEmail.PENDING, send_after=now + backoff(message.attempts, BACKOFF_BASE, BACKOFF_CAP))
+    OutboundEmail.objects.filter(pk=message.pk, locked_by=message.locked_by).update(**fields)
+
+
+class RelayUnavailable(Exception):
+    """The mail relay could not be reached; carries the counts of the interrupted batch."""
+
+    def __init__(self, sent, failed):
+        super().__init__(f"mail relay unavailable after {sent} sent, {failed} failed")
+        self.sent = sent
+        self.failed = failed
+
+
+def _release(messages, error):
+    """Hands claimed messages that were never attempted back to the outbox with backoff."""
+    for message in messages:
+        _failed(message, error)
+    return len(messages)
+
+
+def deliver(messages, connection):
+    """
+    Sends claimed messages over an already-open connection, recording each
+    outcome. Returns (sent, failed). If the connection cannot be reopened
+    after a failure, the rest of the batch goes back to pending with backoff
+    and RelayUnavailable is raised.
+    """
+    messages = list(messages)
+    sent = failed = 0
+    for index, message in enumerate(messages):
+        email = EmailMessage(message.subject, message.body, message.from_email, message.to, connection=connection)
+        try:
+            email.send(fail_silently=False)
+        except Exception as exc:
+            failed += 1
+            _failed(message, f"{type(exc).__name__}: {exc}")
+            # A broken session poisons the rest of the batch; reconnect for the next message
+            connection.close()
+            try:
+                connection.open()
+            except Exception as exc:
+                failed += _release(messages[index + 1:], f"{type(exc).__name__}: {exc}")
+                logger.warning("Mail relay unreachable, batch returned to the outbox: %s", exc)
+                raise RelayUnavailable(sent, failed) from exc
+            continue
+        sent += 1
+        OutboundEmail.objects.filter(pk=message.pk, locked_by=message.locked_by).update(
+            status=OutboundEmail.SENT, sent_at=timezone.now(), locked_until=None, last_error=''
+        )
+    return sent, failed
+
+
+def send_pending(limit=None, batch_size=BATCH_SIZE, connection=None):
+    """
+    Drains due messages batch after batch over one connection, opened only
+    if there is something to send. Stops early, with the unsent messages
+    back in the outbox, when the relay cannot be reached. Returns (sent, failed).
+    """
+    sent = failed = 0
+    own_connection = connection is None
+    try:
+        while limit is None or sent + failed < limit:
+            batch = claim(batch_size if limit is None else min(batch_size, limit - sent - failed))
+            if not batch:
+                break
+            if connection is None:
+                connection = get_connection(fail_silently=False)
+                try:
+                    connection.open()
+                except Exception as exc:
+                    failed += _release(batch, f"{type(exc).__name__}: {exc}")
+                    logger.warning("Mail relay unreachable, batch returned to the outbox: %s", exc)
+                    break
+            try:
+                batch_sent, batch_failed = deliver(batch, connection)
+            except RelayUnavailable as exc:
+                sent += exc.sent
+                failed += exc.failed
+                break
+            sent += batch_sent
+            failed += batch_failed
+    finally:
+        if own_connection and connection is not None:
+            connection.close()
+    return sent, failed
+
+
+def purge_sent(older_than=RETENTION, batch_size=1000):
+    cutoff = timezone.now() - older_than
+    return delete_in_batches(OutboundEmail.objects.filter(status=OutboundEmail.SENT, sent_at__lt=cutoff), batch_size)
@@ -0,0 +1,140 @@
+import logging
+import random
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .cleanup import delete_in_batches
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 5
+
+# How long a claimed job stays invisible to other workers
+VISIBILITY_TIMEOUT = timedelta(minutes=5)
+
+# Retry delay doubles per attempt (10s, 20s, 40s, ...) up to an hour, with jitter
+BACKOFF_BASE = 10
+BACKOFF_CAP = 60 * 60
+
+# Finished jobs are kept this long for inspection in the admin
+RETENTION = timedelta(days=7)
+
+_registry = {}
+
+
+def task(name, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Registers a handler under a job name. Jobs are delivered at least once (a
+    worker may die after the work but before recording it), so handlers must
+    be idempotent. The payload is passed as keyword arguments.
+    """
+    def decorator(func):
+        _registry[name] = (func, max_attempts)
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, delay=None, unique_key=None):
+    """
+    Adds a job. Call it inside the transaction that makes the work necessary,
+    so the job exists exactly when that transaction commits. With unique_key,
+    a job already waiting under the same key is reused instead.
+    """
+    if name not in _registry:
+        raise LookupError(f"No task registered as {name!r}")
+    fields = {
+        'name': name,
+        'payload': payload or {},
+        'max_attempts': _registry[name][1],
+        'run_at': timezone.now() + (delay or timedelta()),
+    }
+    if unique_key is None:
+        return Job.objects.create(**fields)
+    job, _ = Job.objects.get_or_create(unique_key=unique_key, defaults=fields)
+    return job
+
+
+def _due(now):
+    return Q(status=Job.PENDING, run_at__lte=now) | Q(status=Job.RUNNING, locked_until__lte=now)
+
+
+def claim(limit, visibility_timeout=VISIBILITY_TIMEOUT):
+    """
+    Leases up to `limit` due jobs. The guarded UPDATE only takes rows that are
+    still due, so concurrent workers never claim the same job, and it needs no
+    SKIP LOCKED (works on SQLite and MySQL alike).
+    """
+    now = timezone.now()
+    candidates = list(Job.objects.filter(_due(now)).order_by('run_at', 'pk').values_list('pk', flat=True)[:limit])
+    if not candidates:
+        return []
+    token = uuid.uuid4().hex
+    Job.objects.filter(_due(now), pk__in=candidates).update(
+        status=Job.RUNNING,
+        locked_by=token,
+        locked_until=now + visibility_timeout,
+        attempts=F('attempts') + 1,
+        unique_key=None,
+    )
+    return list(Job.objects.filter(locked_by=token, status=Job.RUNNING))
+
+
+def backoff(attempts, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    delay = min(base * 2 ** (attempts - 1), cap)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def execute(job):
+    """Runs one claimed job and records the outcome. Returns True on success."""
+    handler = _registry.get(job.name)
+    try:
+        if handler is None:
+            raise LookupError(f"No task registered as {job.name!r}")
+        if job.attempts > job.max_attempts:
+            # Lease lapsed repeatedly: the handler keeps killing or hanging its worker
+            raise RuntimeError(f"Gave up after {job.max_attempts} attempts")
+        handler[0](**job.payload)
+    except Exception:
+        logger.exception("Job %s failed", job)
+        _record_failure(job, traceback.format_exc())
+        return False
+
+    # Guarded by the lease token in case the job was re-leased meanwhile
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+        status=Job.DONE, locked_until=None, finished_at=timezone.now(), last_error=''
+    )
+    return True
+
+
+def _record_failure(job, error):
+    now = timezone.now()
+    fields = {'locked_until': None, 'last_error': error}
+    if job.attempts >= job.max_attempts:
+        fields.update(status=Job.FAILED, finished_at=now)
+    else:
+        fields.update(status=Job.PENDING, run_at=now + backoff(job.attempts))
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(**fields)
+
+
+def run_pending(limit=100):
+    """Drains due jobs in the calling thread. Returns how many ran."""
+    ran = 0
+    while ran < limit:
+        jobs = claim(min(limit - ran, 10))
+        if not jobs:
+            break
+        for job in jobs:
+            execute(job)
+        ran += len(jobs)
+    return ran
+
+
+def purge_finished(older_than=RETENTION, batch_size=1000):
+    """Deletes Done jobs past the retention window in batches. Failed jobs are kept for review."""
+    cutoff = timezone.now() - older_than
+    return delete_in_batches(Job.objects.filter(status=Job.DONE, finished_at__lt=cutoff), batch_size)
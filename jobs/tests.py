@@ -0,0 +1,180 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core import mail
+from django.core.management import call_command
+from django.core.mail.backends.base import BaseEmailBackend
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import Job, OutboundEmail
+from .outbox import BACKOFF_BASE, BACKOFF_CAP, queue_email, send_pending
+from .queue import backoff, claim, enqueue, execute, purge_finished, run_pending, task
+
+calls = []
+
+
+@task('tests.record', max_attempts=2)
+def record(value):
+    calls.append(value)
+
+
+@task('tests.explode', max_attempts=2)
+def explode():
+    raise RuntimeError('boom')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_jobs_run_once_and_are_marked_done(self):
+        enqueue('tests.record', {'value': 1})
+        enqueue('tests.record', {'value': 2}, delay=timedelta(hours=1))
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(run_pending(), 0)
+        self.assertEqual(calls, [1])
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 1)
+
+    def test_unique_key_deduplicates_waiting_jobs(self):
+        first = enqueue('tests.record', {'value': 1}, unique_key='once')
+        self.assertEqual(enqueue('tests.record', {'value': 2}, unique_key='once'), first)
+        run_pending()
+        # Claimed jobs give up the key so the work can be queued again
+        enqueue('tests.record', {'value': 3}, unique_key='once')
+        self.assertEqual(Job.objects.count(), 2)
+
+    def test_failures_back_off_then_give_up(self):
+        job = enqueue('tests.explode')
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('boom', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_lapsed_lease_is_reclaimed_by_another_worker(self):
+        enqueue('tests.record', {'value': 1})
+        abandoned = claim(1)[0]
+        self.assertEqual(claim(1), [])
+
+        Job.objects.filter(pk=abandoned.pk).update(locked_until=timezone.now())
+        retry = claim(1)[0]
+        self.assertNotEqual(retry.locked_by, abandoned.locked_by)
+        # The first worker's late result is discarded; the new lease completes the job
+        execute(abandoned)
+        self.assertEqual(Job.objects.get().status, Job.RUNNING)
+        execute(retry)
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    def test_purge_deletes_old_done_jobs_in_batches(self):
+        old = timezone.now() - timedelta(days=30)
+        for value in range(5):
+            enqueue('tests.record', {'value': value})
+        run_pending()
+        Job.objects.update(finished_at=old)
+        kept = enqueue('tests.explode')
+        with self.assertNumQueries(6):
+            # A lookup and a delete per batch; the short third batch ends the sweep
+            self.assertEqual(purge_finished(batch_size=2), 5)
+        self.assertEqual(list(Job.objects.values_list('pk', flat=True)), [kept.pk])
+
+
+class FailingBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionRefusedError('relay down')
+
+
+class UnreachableBackend(FailingBackend):
+    def open(self):
+        raise ConnectionRefusedError('relay down')
+
+
+class DroppingBackend(FailingBackend):
+    """Connects once, then the relay goes away mid-batch."""
+    opened = 0
+
+    def open(self):
+        DroppingBackend.opened += 1
+        if DroppingBackend.opened > 1:
+            raise ConnectionRefusedError('relay down')
+
+
+class OutboxTests(TestCase):
+    def test_queued_mail_is_delivered_over_one_connection(self):
+        for i in range(3):
+            queue_email('shopper@example.com', f'Hello {i}', 'Body')
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open') as opened:
+            self.assertEqual(send_pending(batch_size=2), (3, 0))
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual([m.subject for m in mail.outbox], ['Hello 0', 'Hello 1', 'Hello 2'])
+        self.assertEqual(OutboundEmail.objects.filter(status=OutboundEmail.SENT).count(), 3)
+
+    def test_dedupe_key_queues_once(self):
+        queue_email('a@example.com', 'Order', 'Body', dedupe_key='order:1')
+        queue_email('a@example.com', 'Order', 'Body', dedupe_key='order:1')
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+    @override_settings(EMAIL_BACKEND='jobs.tests.FailingBackend')
+    def test_failing_mail_is_retried_then_dead_lettered(self):
+        message = queue_email('a@example.com', 'Hi', 'Body')
+        OutboundEmail.objects.filter(pk=message.pk).update(max_attempts=2)
+        self.assertEqual(send_pending(), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboundEmail.PENDING)
+        self.assertIn('relay down', message.last_error)
+
+        OutboundEmail.objects.filter(pk=message.pk).update(send_after=timezone.now())
+        with self.assertLogs('jobs.outbox', 'ERROR'):
+            send_pending()
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboundEmail.DEAD)
+
+    def test_retries_outlast_hours_of_relay_downtime(self):
+        message = queue_email('a@example.com', 'Hi', 'Body')
+        with mock.patch('jobs.queue.random.uniform', return_value=0.8):
+            shortest = sum(
+                (backoff(attempt, BACKOFF_BASE, BACKOFF_CAP) for attempt in range(1, message.max_attempts)),
+                timedelta(),
+            )
+        self.assertGreater(shortest, timedelta(hours=4))
+
+    def assertReturnedForRetry(self, messages):
+        for message in messages:
+            message.refresh_from_db()
+            self.assertEqual(message.status, OutboundEmail.PENDING)
+            self.assertGreater(message.send_after, timezone.now())
+            self.assertIn('relay down', message.last_error)
+
+    @override_settings(EMAIL_BACKEND='jobs.tests.UnreachableBackend')
+    def test_unreachable_relay_returns_the_batch_with_backoff(self):
+        messages = [queue_email('a@example.com', f'Hi {i}', 'Body') for i in range(3)]
+        with self.assertLogs('jobs.outbox', 'WARNING'):
+            self.assertEqual(send_pending(batch_size=2), (0, 2))
+        self.assertReturnedForRetry(messages[:2])
+        # Not claimed: the drain stopped at the first unreachable batch
+        self.assertEqual(OutboundEmail.objects.get(pk=messages[2].pk).attempts, 0)
+
+    @override_settings(EMAIL_BACKEND='jobs.tests.DroppingBackend')
+    def test_failed_reconnect_returns_the_rest_of_the_batch(self):
+        DroppingBackend.opened = 0
+        messages = [queue_email('a@example.com', f'Hi {i}', 'Body') for i in range(3)]
+        with self.assertLogs('jobs.outbox', 'WARNING'):
+            self.assertEqual(send_pending(), (0, 3))
+        self.assertReturnedForRetry(messages)
+        self.assertEqual(OutboundEmail.objects.filter(status=OutboundEmail.SENDING).count(), 0)
+
+    def test_command_drains_through_send_pending(self):
+        for i in range(3):
+            queue_email('shopper@example.com', f'Hello {i}', 'Body')
+        out = StringIO()
+        call_command('send_outbox', '--once', '--batch-size', '2', stdout=out)
+        self.assertIn('Sent 3 emails (0 failed attempts)', out.getvalue())
+        self.assertEqual(len(mail.outbox), 3)
@@ -13,6 +13,12 @@ class OrderAdmin(admin.ModelAdmin):
     list_filter = ('status', 'created_at')
     search_fields = ('user__username', 'id')
     inlines = [OrderItemInline]
+    actions = ['cancel_pending_orders']
+
+    @admin.action(description="Cancel selected pending orders and restore stock")
+    def cancel_pending_orders(self, request, queryset):
+        cancelled = queryset.cancel_pending()
+        self.message_user(request, f"Cancelled {cancelled} pending orders.")
 
 
 @admin.register(OrderItem)
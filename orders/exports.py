@@ -0,0 +1,131 @@
+import csv
+import json
+from datetime import date
+
+from django.db.models import Q
+
+from .models import OrderItem
+
+CHUNK_SIZE = 2000
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+CSV_HEADER = [
+    'order_id', 'created_at', 'status', 'is_paid', 'payment_method',
+    'customer', 'full_name', 'email', 'order_total',
+    'product_id', 'product', 'vendor', 'quantity', 'price', 'line_total',
+]
+
+
+class ExportError(ValueError):
+    pass
+
+
+def _parse_date(value, name):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ExportError(f"Invalid {name} date {value!r}; use YYYY-MM-DD.")
+
+
+def export_items(start=None, end=None, status=None, vendor=None):
+    """
+    Order lines to export, joined to the order, customer, product and vendor,
+    in order_id order so lines of one order stay together. A vendor only ever
+    sees their own lines.
+    """
+    start, end = _parse_date(start, 'start'), _parse_date(end, 'end')
+    items = OrderItem.objects.select_related('order__user', 'product__vendor')
+    if start:
+        items = items.filter(order__created_at__date__gte=start)
+    if end:
+        items = items.filter(order__created_at__date__lte=end)
+    if status:
+        items = items.filter(order__status=status)
+    if vendor is not None:
+        items = items.filter(product__vendor=vendor)
+    return items.order_by('order_id', 'id')
+
+
+def _order_fields(order, include_total):
+    return {
+        'order_id': order.id,
+        'created_at': order.created_at.isoformat(),
+        'status': order.status,
+        'is_paid': order.is_paid,
+        'payment_method': order.payment_method,
+        'customer': order.user.username,
+        'full_name': order.full_name,
+        'email': order.email,
+        # Other vendors' lines are hidden from a vendor, so the order total would mislead
+        'order_total': str(order.total_price) if include_total else '',
+    }
+
+
+def _item_fields(item):
+    return {
+        'product_id': item.product_id,
+        'product': item.product.name,
+        'vendor': item.product.vendor.username if item.product.vendor else '',
+        'quantity': item.quantity,
+        'price': str(item.price),
+        'line_total': str(item.get_total_price()),
+    }
+
+
+def _rows(items):
+    """
+    Iterates an export_items() queryset one CHUNK_SIZE query at a time, seeking
+    past the last (order_id, id) seen. mysqlclient buffers the whole result of
+    .iterator(), so keyset chunks are what keeps a large export streaming.
+    """
+    last = None
+    while True:
+        chunk = items
+        if last is not None:
+            chunk = chunk.filter(Q(order_id__gt=last.order_id) | Q(order_id=last.order_id, id__gt=last.id))
+        rows = list(chunk[:CHUNK_SIZE])
+        yield from rows
+        if len(rows) < CHUNK_SIZE:
+            return
+        last = rows[-1]
+
+
+class _Echo:
+    """File-like object whose write() returns the line, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(items, include_total=True):
+    """One CSV row per order line, header first."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for item in _rows(items):
+        row = {**_order_fields(item.order, include_total), **_item_fields(item)}
+        yield writer.writerow([row[column] for column in CSV_HEADER])
+
+
+def jsonl_lines(items, include_total=True):
+    """One JSON object per order with its lines nested under "items"."""
+    current = None
+    for item in _rows(items):
+        if current is None or current['order_id'] != item.order_id:
+            if current is not None:
+                yield json.dumps(current) + '\n'
+            current = {**_order_fields(item.order, include_total), 'items': []}
+        current['items'].append(_item_fields(item))
+    if current is not None:
+        yield json.dumps(current) + '\n'
+
+
+def export_lines(fmt, items, include_total=True):
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown export format {fmt!r}; choose from {', '.join(FORMATS)}.")
+    return (csv_lines if fmt == 'csv' else jsonl_lines)(items, include_total)
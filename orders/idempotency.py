@@ -0,0 +1,136 @@
+import time
+import uuid
+from datetime import timedelta
+from functools import wraps
+
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.utils import timezone
+
+from jobs.cleanup import delete_in_batches
+from .models import IdempotencyKey
+
+KEY_HEADER = 'Idempotency-Key'
+KEY_FIELD = 'idempotency_key'
+KEY_MAX_LENGTH = 64
+
+# How long a stored response is replayed
+KEY_TTL = timedelta(hours=24)
+
+# A key still unanswered after this long belongs to a crashed request and may be retaken
+IN_FLIGHT_TIMEOUT = timedelta(seconds=60)
+
+# How long a duplicate waits for the first request to finish before giving up with 409
+REPLAY_WAIT = 5.0
+REPLAY_POLL = 0.2
+
+
+def new_key():
+    """Token for hidden form fields."""
+    return uuid.uuid4().hex
+
+
+def _owner(request):
+    if request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    if request.session.session_key is None:
+        request.session.save()
+    return f"session:{request.session.session_key}"
+
+
+def _claim(owner, scope, key):
+    """Returns (record, claimed). Claimed means this request should run the view."""
+    now = timezone.now()
+    fields = {
+        'status_code': None, 'content_type': '', 'location': '', 'body': '',
+        'created_at': now, 'expires_at': now + KEY_TTL,
+    }
+    record, created = IdempotencyKey.objects.get_or_create(owner=owner, scope=scope, key=key, defaults=fields)
+    if created:
+        return record, True
+
+    # Expired, or abandoned mid-request: take it over with a guarded update
+    retaken = IdempotencyKey.objects.filter(pk=record.pk).filter(
+        Q(expires_at__lte=now) | Q(status_code__isnull=True, created_at__lte=now - IN_FLIGHT_TIMEOUT)
+    ).update(**fields)
+    return record, bool(retaken)
+
+
+def _wait_for_response(record):
+    deadline = time.monotonic() + REPLAY_WAIT
+    while record.status_code is None and time.monotonic() < deadline:
+        time.sleep(REPLAY_POLL)
+        record.refresh_from_db(fields=['status_code', 'content_type', 'location', 'body'])
+    return record.status_code is not None
+
+
+def release_key(request):
+    """
+    Marks the current request as failed. Its key is freed instead of storing
+    the response, so a retry (say, after fixing the cart) runs the view again
+    rather than replaying the error. Use it for failures reported as a
+    redirect; error status codes are never stored anyway.
+    """
+    request.idempotency_released = True
+
+
+def _store(record, response):
+    if response.status_code >= 400 or response.streaming:
+        # Only successes are replayed; let the client retry for real
+        record.delete()
+        return
+    IdempotencyKey.objects.filter(pk=record.pk).update(
+        status_code=response.status_code,
+        content_type=response.get('Content-Type', ''),
+        location=response.get('Location', ''),
+        body='' if response.has_header('Location') else response.content.decode(response.charset),
+    )
+
+
+def _replay(record):
+    response = HttpResponse(record.body, status=record.status_code, content_type=record.content_type or None)
+    if record.location:
+        response['Location'] = record.location
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(scope):
+    """
+    Makes a view safe to retry. When the request carries an Idempotency-Key
+    header or an idempotency_key form field, the first successful response is
+    stored and replayed for repeats of the same key; a repeat arriving while
+    the first is still running waits for it. Requests without a key run normally.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get(KEY_HEADER) or request.POST.get(KEY_FIELD)
+            if not key:
+                return view(request, *args, **kwargs)
+            if len(key) > KEY_MAX_LENGTH:
+                return HttpResponseBadRequest("Idempotency key too long.")
+
+            record, claimed = _claim(_owner(request), scope, key)
+            if not claimed:
+                if _wait_for_response(record):
+                    return _replay(record)
+                return HttpResponse("This request is already being processed.", status=409)
+
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                record.delete()
+                raise
+            if getattr(request, 'idempotency_released', False):
+                record.delete()
+            else:
+                _store(record, response)
+            return response
+        return wrapper
+    return decorator
+
+
+def purge_expired(batch_size=1000):
+    """Deletes expired keys in batches. Returns how many were removed."""
+    return delete_in_batches(IdempotencyKey.objects.filter(expires_at__lte=timezone.now()), batch_size)
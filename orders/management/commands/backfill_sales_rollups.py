@@ -0,0 +1,16 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from orders.rollups import rebuild_sales
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the vendor daily sales rollups from order history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date.fromisoformat, help="Only rebuild days from YYYY-MM-DD on.")
+
+    def handle(self, *args, **options):
+        written = rebuild_sales(since=options['since'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} daily sales rows."))
@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from orders.models import CANCEL_BATCH_SIZE, Order
+
+
+class Command(BaseCommand):
+    help = "Cancels unpaid Pending orders older than --hours and restores their stock."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=48)
+        parser.add_argument('--batch-size', type=int, default=CANCEL_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale = Order.objects.filter(status='Pending', is_paid=False, created_at__lt=cutoff)
+        cancelled = stale.cancel_pending(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Cancelled {cancelled} stale pending orders."))
@@ -0,0 +1,41 @@
+import gzip
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from orders.exports import FORMATS, ExportError, export_items, export_lines
+
+
+class Command(BaseCommand):
+    help = "Writes orders with their items to a gzip-compressed CSV or JSONL file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--start', help="First order date, YYYY-MM-DD.")
+        parser.add_argument('--end', help="Last order date, YYYY-MM-DD.")
+        parser.add_argument('--status')
+        parser.add_argument('--vendor', help="Vendor username; exports only their lines.")
+        parser.add_argument('--output', help="Defaults to orders-<date>.<format>.gz")
+
+    def handle(self, *args, **options):
+        fmt = options['format']
+        vendor = None
+        if options['vendor']:
+            vendor = User.objects.filter(username=options['vendor']).first()
+            if vendor is None:
+                raise CommandError(f"No user named {options['vendor']!r}.")
+        output = options['output'] or f"orders-{timezone.localdate():%Y%m%d}.{fmt}.gz"
+
+        try:
+            items = export_items(options['start'], options['end'], options['status'], vendor)
+            lines = export_lines(fmt, items, include_total=vendor is None)
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        written = 0
+        with gzip.open(output, 'wt', encoding='utf-8', newline='') as handle:
+            for line in lines:
+                handle.write(line)
+                written += 1
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} lines to {output}."))
@@ -0,0 +1,101 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_vendor_sales(apps, schema_editor):
+    OrderItem = apps.get_model("orders", "OrderItem")
+    VendorSalesDaily = apps.get_model("orders", "VendorSalesDaily")
+
+    line_total = ExpressionWrapper(
+        F("price") * F("quantity"),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+    rows = (
+        OrderItem.objects.exclude(order__status="Cancelled")
+        .filter(product__vendor__isnull=False)
+        .annotate(day=TruncDate("order__created_at"))
+        .order_by()
+        .values("day", "product_id", "product__vendor_id")
+        .annotate(
+            units=Sum("quantity"),
+            revenue=Sum(line_total),
+            orders=Count("order_id", distinct=True),
+        )
+    )
+    VendorSalesDaily.objects.bulk_create(
+        (
+            VendorSalesDaily(
+                vendor_id=row["product__vendor_id"],
+                product_id=row["product_id"],
+                date=row["day"],
+                units=row["units"],
+                revenue=row["revenue"],
+                orders=row["orders"],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0003_idempotency_keys"),
+        ("products", "0006_stock_holds"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VendorSalesDaily",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("units", models.IntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                ("orders", models.IntegerField(default=0)),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sales_rollups",
+                        to="products.product",
+                    ),
+                ),
+                (
+                    "vendor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sales_rollups",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["vendor", "date"], name="sales_vendor_date_idx"
+                    )
+                ],
+                "unique_together": {("product", "date")},
+            },
+        ),
+        migrations.RunPython(backfill_vendor_sales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0004_vendor_sales_daily"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="order",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
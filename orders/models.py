@@ -1,7 +1,46 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Sum
 from django.contrib.auth.models import User
+from django.utils import timezone
+from products.inventory import restore_stock
 from products.models import Product
 
+CANCEL_BATCH_SIZE = 1000
+
+
+class OrderQuerySet(models.QuerySet):
+    def cancel_pending(self, batch_size=CANCEL_BATCH_SIZE):
+        """
+        Cancels the Pending orders in this queryset and restores their stock.
+        Each batch locks its orders, flips the status with one UPDATE and
+        restores stock with grouped F() updates in a single transaction.
+        Returns the number of orders cancelled.
+        """
+        from .rollups import record_sales  # rollups imports this module
+
+        ids = list(self.filter(status='Pending').order_by('pk').values_list('pk', flat=True))
+        cancelled = 0
+        for start in range(0, len(ids), batch_size):
+            with transaction.atomic():
+                # Re-check under lock: another request may have cancelled or paid meanwhile
+                batch = list(
+                    Order.objects.select_for_update()
+                    .filter(pk__in=ids[start:start + batch_size], status='Pending')
+                    .values_list('pk', flat=True)
+                )
+                if not batch:
+                    continue
+                Order.objects.filter(pk__in=batch).update(status='Cancelled', updated_at=timezone.now())
+                restore_stock(
+                    OrderItem.objects.filter(order_id__in=batch)
+                    .order_by().values('product_id')
+                    .annotate(units=Sum('quantity'))
+                    .values_list('product_id', 'units')
+                )
+                record_sales(batch, sign=-1)
+                cancelled += len(batch)
+        return cancelled
+
 
 class Order(models.Model):
     # More granular tracking for the Order Module
@@ -37,15 +76,24 @@ class Order(models.Model):
     payment_id = models.CharField(max_length=100, blank=True, null=True)
     payment_method = models.CharField(max_length=50, default='COD') # e.g., Stripe, PayPal, COD
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
 
     def __str__(self):
         return f"Order #{self.id} - {self.user.username}"
 
+    def cancel(self):
+        """Cancels this order if it is still Pending. Returns whether it was cancelled."""
+        if not Order.objects.filter(pk=self.pk).cancel_pending():
+            return False
+        self.status = 'Cancelled'
+        return True
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(
@@ -67,4 +115,49 @@ class OrderItem(models.Model):
         return f"{self.product.name} ({self.quantity})"
 
     def get_total_price(self):
-        return self.price * self.quantity
\ No newline at end of file
+        return self.price * self.quantity
+
+class IdempotencyKey(models.Model):
+    """
+    First response to a client-supplied idempotency key, replayed for retries
+    and double submits instead of running the transaction again.
+    """
+    owner = models.CharField(max_length=80)  # "user:<id>" or "session:<key>"
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=64)
+
+    # Null while the first request is still running
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    location = models.CharField(max_length=500, blank=True)
+    body = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('owner', 'scope', 'key')
+
+
+# Vendor Analytics Module
+class VendorSalesDaily(models.Model):
+    """
+    Per-product daily sales of non-cancelled orders, keyed by the day the
+    order was placed. Maintained by orders.rollups as orders are placed and
+    cancelled; rebuild with `manage.py backfill_sales_rollups`.
+    """
+    vendor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sales_rollups')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales_rollups')
+    date = models.DateField()
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'date')
+        indexes = [
+            models.Index(fields=['vendor', 'date'], name='sales_vendor_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} on {self.date}: {self.units} units"
@@ -0,0 +1,115 @@
+from datetime import timedelta
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import OrderItem, VendorSalesDaily
+
+BATCH_SIZE = 1000
+
+LINE_TOTAL = ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def daily_sales(items):
+    """Groups order items into (day, product, vendor) rollup rows with one aggregate query."""
+    return (
+        items.filter(product__vendor__isnull=False)
+        .annotate(day=TruncDate('order__created_at'))
+        .order_by()
+        .values('day', 'product_id', 'product__vendor_id')
+        .annotate(units=Sum('quantity'), revenue=Sum(LINE_TOTAL), orders=Count('order_id', distinct=True))
+    )
+
+
+def _add(row, sign):
+    deltas = {
+        'units': F('units') + sign * row['units'],
+        'revenue': F('revenue') + sign * row['revenue'],
+        'orders': F('orders') + sign * row['orders'],
+    }
+    lookup = {'product_id': row['product_id'], 'date': row['day']}
+    if VendorSalesDaily.objects.filter(**lookup).update(**deltas):
+        return
+    try:
+        with transaction.atomic():
+            VendorSalesDaily.objects.create(
+                vendor_id=row['product__vendor_id'],
+                units=sign * row['units'], revenue=sign * row['revenue'], orders=sign * row['orders'],
+                **lookup,
+            )
+    except IntegrityError:
+        # Another checkout created the day's row first
+        VendorSalesDaily.objects.filter(**lookup).update(**deltas)
+
+
+def record_sales(order_ids, sign=1):
+    """
+    Folds orders into the daily rollups (sign=-1 takes cancelled orders back
+    out). One grouped read, then one F() upsert per product and day touched,
+    applied in a fixed order to keep concurrent checkouts from deadlocking.
+    """
+    rows = daily_sales(OrderItem.objects.filter(order_id__in=order_ids))
+    with transaction.atomic():
+        for row in sorted(rows, key=lambda row: (row['product_id'], row['day'])):
+            _add(row, sign)
+
+
+def rebuild_sales(since=None):
+    """Recomputes rollups from scratch (optionally from a date on). Returns rows written."""
+    items = OrderItem.objects.exclude(order__status='Cancelled')
+    existing = VendorSalesDaily.objects.all()
+    if since is not None:
+        items = items.filter(order__created_at__date__gte=since)
+        existing = existing.filter(date__gte=since)
+
+    rows = (
+        VendorSalesDaily(
+            vendor_id=row['product__vendor_id'], product_id=row['product_id'], date=row['day'],
+            units=row['units'], revenue=row['revenue'], orders=row['orders'],
+        )
+        for row in daily_sales(items).iterator(chunk_size=BATCH_SIZE)
+    )
+    written = 0
+    with transaction.atomic():
+        existing.delete()
+        while batch := list(islice(rows, BATCH_SIZE)):
+            VendorSalesDaily.objects.bulk_create(batch)
+            written += len(batch)
+    return written
+
+
+def vendor_summary(vendor, days=30, top=5):
+    """
+    Dashboard figures read from the rollups: lifetime totals, a day-by-day
+    revenue series for the last `days` days (zero-filled) and the top sellers
+    over the same window.
+    """
+    rollups = VendorSalesDaily.objects.filter(vendor=vendor)
+    totals = rollups.aggregate(revenue=Sum('revenue'), units=Sum('units'))
+
+    today = timezone.localdate()
+    start = today - timedelta(days=days - 1)
+    recent = rollups.filter(date__gte=start)
+    by_day = dict(recent.order_by().values('date').annotate(total=Sum('revenue')).values_list('date', 'total'))
+    series = [(start + timedelta(days=i), by_day.get(start + timedelta(days=i)) or 0) for i in range(days)]
+    peak = max((revenue for _, revenue in series), default=0) or 1
+
+    top_sellers = (
+        recent.order_by().values('product_id', 'product__name')
+        .annotate(units=Sum('units'), revenue=Sum('revenue'))
+        .filter(units__gt=0)
+        .order_by('-revenue')[:top]
+    )
+
+    return {
+        'total_revenue': totals['revenue'] or 0,
+        'units_sold': totals['units'] or 0,
+        'revenue_series': [
+            {'date': day, 'revenue': revenue, 'percent': round(100 * revenue / peak)}
+            for day, revenue in series
+        ],
+        'top_sellers': list(top_sellers),
+    }
@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.template.loader import render_to_string
+
+from jobs.outbox import queue_email
+from jobs.queue import enqueue, task
+from .models import Order
+
+# One recommendations refresh picks up every order placed in this window
+RECOMMENDATIONS_DELAY = timedelta(minutes=5)
+
+
+@task('orders.order_placed')
+def order_placed(order_id):
+    """Follow-up work for a committed order. Safe to repeat for the same order."""
+    order = Order.objects.filter(pk=order_id).exclude(status='Cancelled').first()
+    if order is None:
+        return
+
+    queue_email(
+        order.email,
+        f"ShopX Order #{order.id} Confirmed",
+        render_to_string('orders/emails/order_confirmation.txt', {
+            'order': order,
+            'items': order.items.select_related('product'),
+        }),
+        dedupe_key=f'order_confirmation:{order.id}',
+    )
+    enqueue(
+        'products.refresh_recommendations',
+        delay=RECOMMENDATIONS_DELAY,
+        unique_key='products:refresh_recommendations',
+    )
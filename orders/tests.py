@@ -1,3 +1,415 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test import Client, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from jobs.models import Job, OutboundEmail
+from jobs.queue import run_pending
+from products.caching import card_version_key, get_version
+from products.inventory import InsufficientStock, decrement_stock, expire_holds
+from products.models import CartLine, Category, Product, StockHold, StoredCart
+from .exports import export_items, export_lines
+from .models import IdempotencyKey, Order, OrderItem, VendorSalesDaily
+
+
+def fill_cart(user, quantities):
+    """Replaces the user's stored cart with {product: quantity}."""
+    cart, _ = StoredCart.objects.get_or_create(user=user)
+    cart.lines.all().delete()
+    CartLine.objects.bulk_create(
+        CartLine(cart=cart, product=product, quantity=quantity)
+        for product, quantity in quantities.items()
+    )
+
+
+class PlaceOrderTests(TestCase):
+    """place_order takes stock with guarded updates and rolls back as a whole."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='pass12345')
+        category = Category.objects.create(name='Cables')
+        cls.plenty = Product.objects.create(category=category, name='USB Cable', description='1m', price='4.50', stock=10)
+        cls.scarce = Product.objects.create(category=category, name='HDMI Cable', description='2m', price='9.00', stock=1)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def fill_cart(self, quantities):
+        # Whoever the client is logged in as
+        fill_cart(User.objects.get(pk=self.client.session['_auth_user_id']), quantities)
+
+    def place(self, quantities):
+        self.fill_cart(quantities)
+        return self.client.post(reverse('place_order'), {
+            'full_name': 'Buyer', 'email': 'buyer@example.com', 'address': '1 Main St',
+        })
+
+    def test_successful_order_takes_stock_and_creates_items(self):
+        response = self.place({self.plenty: 3, self.scarce: 1})
+        self.assertRedirects(response, reverse('order_history'), fetch_redirect_response=False)
+        order = Order.objects.get()
+        self.assertEqual(order.items.count(), 2)
+        self.plenty.refresh_from_db()
+        self.scarce.refresh_from_db()
+        self.assertEqual((self.plenty.stock, self.scarce.stock), (7, 0))
+
+        # Follow-up work is queued with the order rather than run inline
+        self.assertEqual(Job.objects.get().payload, {'order_id': order.id})
+        run_pending()
+        self.assertTrue(Job.objects.filter(name='products.refresh_recommendations', status=Job.PENDING).exists())
+        confirmation = OutboundEmail.objects.get(dedupe_key=f'order_confirmation:{order.id}')
+        self.assertIn('USB Cable x 3', confirmation.body)
+
+    def test_short_line_rolls_back_the_whole_order(self):
+        response = self.place({self.plenty: 3, self.scarce: 2})
+        self.assertRedirects(response, reverse('cart'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.plenty.refresh_from_db()
+        self.assertEqual(self.plenty.stock, 10)
+
+    def test_checkout_holds_stock_against_other_shoppers(self):
+        rival = User.objects.create_user('rival', password='pass12345')
+        self.client.force_login(rival)
+        self.fill_cart({self.scarce: 1})
+        self.assertEqual(self.client.get(reverse('checkout')).status_code, 200)
+        self.assertEqual(StockHold.objects.get(user=rival).quantity, 1)
+
+        # The last unit is reserved, so another shopper can neither hold nor buy it
+        self.client.force_login(self.user)
+        self.fill_cart({self.scarce: 1})
+        self.assertRedirects(self.client.get(reverse('checkout')), reverse('cart'), fetch_redirect_response=False)
+        self.place({self.scarce: 1})
+        self.assertFalse(Order.objects.exists())
+
+        # The holder can, and their hold is released
+        self.client.force_login(rival)
+        self.place({self.scarce: 1})
+        self.assertEqual(Order.objects.get().user, rival)
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_expired_holds_are_ignored_and_swept(self):
+        rival = User.objects.create_user('rival', password='pass12345')
+        StockHold.objects.create(user=rival, product=self.scarce, quantity=1, expires_at=timezone.now())
+        self.place({self.scarce: 1})
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(expire_holds(batch_size=1), 1)
+        self.assertFalse(StockHold.objects.exists())
+
+
+class CancelOrderTests(TestCase):
+    """Cancellation restores stock with grouped F() updates, singly or in bulk."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='pass12345')
+        category = Category.objects.create(name='Lamps')
+        cls.desk = Product.objects.create(category=category, name='Desk Lamp', description='LED', price='30.00', stock=0)
+        cls.floor = Product.objects.create(category=category, name='Floor Lamp', description='Tall', price='80.00', stock=0)
+
+    def order(self, quantities, status='Pending'):
+        order = Order.objects.create(
+            user=self.user, full_name='Buyer', email='buyer@example.com', address='1 Main St',
+            total_price='0.00', status=status,
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, price=product.price, quantity=quantity)
+            for product, quantity in quantities.items()
+        )
+        return order
+
+    def stock(self):
+        return list(Product.objects.order_by('pk').values_list('stock', flat=True))
+
+    def test_cancel_view_restores_stock_once(self):
+        order = self.order({self.desk: 2, self.floor: 1})
+        self.client.force_login(self.user)
+        self.client.post(reverse('cancel_order', args=[order.id]))
+        self.client.post(reverse('cancel_order', args=[order.id]))
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'Cancelled')
+        self.assertEqual(self.stock(), [2, 1])
+
+    def test_bulk_cancel_skips_non_pending_orders(self):
+        for _ in range(3):
+            self.order({self.desk: 1, self.floor: 2})
+        self.order({self.desk: 5}, status='Shipped')
+        self.assertEqual(Order.objects.cancel_pending(batch_size=2), 3)
+        self.assertEqual(self.stock(), [3, 6])
+        self.assertEqual(Order.objects.filter(status='Shipped').count(), 1)
+
+
+class IdempotencyTests(TestCase):
+    """Replayed keys return the stored response without running the view again."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='pass12345')
+        cls.product = Product.objects.create(
+            category=Category.objects.create(name='Mugs'),
+            name='Coffee Mug', description='Ceramic', price='12.00', stock=10,
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_double_submitted_checkout_places_one_order(self):
+        fill_cart(self.user, {self.product: 2})
+        form = {'full_name': 'Buyer', 'email': 'buyer@example.com', 'address': '1 Main St', 'idempotency_key': 'abc123'}
+
+        first = self.client.post(reverse('place_order'), form)
+        fill_cart(self.user, {self.product: 2})
+        second = self.client.post(reverse('place_order'), form)
+
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(second.status_code, first.status_code)
+        self.assertEqual(second['Location'], first['Location'])
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 8)
+
+    def test_failed_checkout_is_not_replayed(self):
+        form = {'full_name': 'Buyer', 'email': 'buyer@example.com', 'address': '1 Main St', 'idempotency_key': 'retry-me'}
+        fill_cart(self.user, {self.product: 11})
+        failed = self.client.post(reverse('place_order'), form)
+        self.assertRedirects(failed, reverse('cart'), fetch_redirect_response=False)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        # The shopper fixes the cart and resubmits the same form: it runs for real
+        fill_cart(self.user, {self.product: 2})
+        retried = self.client.post(reverse('place_order'), form)
+        self.assertRedirects(retried, reverse('order_history'), fetch_redirect_response=False)
+        self.assertNotIn('Idempotent-Replayed', retried)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_retried_ajax_add_to_cart_adds_once(self):
+        headers = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest', 'HTTP_IDEMPOTENCY_KEY': 'click-1'}
+        url = reverse('add_to_cart', args=[self.product.id])
+        self.assertEqual(self.client.get(url, **headers).json()['cart_count'], 1)
+        self.assertEqual(self.client.get(url, **headers).json()['cart_count'], 1)
+        headers['HTTP_IDEMPOTENCY_KEY'] = 'click-2'
+        self.assertEqual(self.client.get(url, **headers).json()['cart_count'], 2)
+        self.assertEqual(CartLine.objects.get(cart__user=self.user, product=self.product).quantity, 2)
+
+
+class VendorSalesRollupTests(TestCase):
+    """Daily vendor rollups follow orders placed and cancelled, and match a rebuild."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user('vendor', password='pass12345')
+        cls.vendor.profile.role = 'Vendor'
+        cls.vendor.profile.save()
+        cls.buyer = User.objects.create_user('buyer', password='pass12345')
+        category = Category.objects.create(name='Plants')
+        cls.fern = Product.objects.create(category=category, vendor=cls.vendor, name='Fern', description='Green', price='15.00', stock=50)
+        cls.cactus = Product.objects.create(category=category, vendor=cls.vendor, name='Cactus', description='Spiky', price='8.00', stock=50)
+
+    def place(self, quantities):
+        self.client.force_login(self.buyer)
+        fill_cart(self.buyer, quantities)
+        self.client.post(reverse('place_order'), {'full_name': 'B', 'email': 'b@example.com', 'address': 'X'})
+        return Order.objects.latest('id')
+
+    def rollups(self):
+        return sorted(VendorSalesDaily.objects.values_list('product__name', 'units', 'revenue', 'orders'))
+
+    def test_rollups_follow_orders_and_cancellations(self):
+        self.place({self.fern: 2, self.cactus: 1})
+        doomed = self.place({self.fern: 1})
+        self.assertEqual(self.rollups(), [('Cactus', 1, Decimal('8.00'), 1), ('Fern', 3, Decimal('45.00'), 2)])
+
+        doomed.cancel()
+        live = self.rollups()
+        self.assertEqual(live, [('Cactus', 1, Decimal('8.00'), 1), ('Fern', 2, Decimal('30.00'), 1)])
+
+        call_command('backfill_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), live)
+
+    def test_dashboard_reads_rollups(self):
+        self.place({self.fern: 2, self.cactus: 1})
+        self.client.force_login(self.vendor)
+        response = self.client.get(reverse('vendor_dashboard'))
+        self.assertEqual(response.context['total_revenue'], Decimal('38.00'))
+        self.assertEqual(response.context['units_sold'], 3)
+        self.assertEqual([row['product__name'] for row in response.context['top_sellers']], ['Fern', 'Cactus'])
+        self.assertEqual(response.context['revenue_series'][-1]['percent'], 100)
+
+
+class OrderExportTests(TestCase):
+    """Exports stream order lines, scoped to the requesting vendor."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user('vendor', password='pass12345')
+        cls.vendor.profile.role = 'Vendor'
+        cls.vendor.profile.save()
+        cls.admin = User.objects.create_user('admin', password='pass12345', is_staff=True)
+        buyer = User.objects.create_user('buyer', password='pass12345')
+        category = Category.objects.create(name='Books')
+        mine = Product.objects.create(category=category, vendor=cls.vendor, name='Novel', description='Fiction', price='10.00', stock=5)
+        theirs = Product.objects.create(category=category, name='Atlas', description='Maps', price='25.00', stock=5)
+        for status in ('Pending', 'Shipped'):
+            order = Order.objects.create(user=buyer, full_name='B', email='b@example.com', address='X', total_price='45.00', status=status)
+            OrderItem.objects.create(order=order, product=mine, price='10.00', quantity=2)
+            OrderItem.objects.create(order=order, product=theirs, price='25.00', quantity=1)
+
+    def export(self, user, **params):
+        self.client.force_login(user)
+        response = self.client.get(reverse('export_orders'), params)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_vendor_csv_contains_only_their_lines(self):
+        rows = list(csv.DictReader(self.export(self.vendor).splitlines()))
+        self.assertEqual([row['product'] for row in rows], ['Novel', 'Novel'])
+        self.assertEqual({row['order_total'] for row in rows}, {''})
+
+    def test_staff_jsonl_nests_items_per_order(self):
+        lines = self.export(self.admin, format='jsonl', status='Shipped').splitlines()
+        self.assertEqual(len(lines), 1)
+        order = json.loads(lines[0])
+        self.assertEqual((order['status'], order['order_total'], len(order['items'])), ('Shipped', '45.00', 2))
+
+    def test_lines_are_read_in_keyset_chunks(self):
+        with mock.patch('orders.exports.CHUNK_SIZE', 3), self.assertNumQueries(2):
+            lines = list(export_lines('jsonl', export_items()))
+        self.assertEqual([len(json.loads(line)['items']) for line in lines], [2, 2])
+
+        with mock.patch('orders.exports.CHUNK_SIZE', 1), self.assertNumQueries(5):
+            rows = list(csv.DictReader(export_lines('csv', export_items())))
+        self.assertEqual([row['product'] for row in rows], ['Novel', 'Atlas', 'Novel', 'Atlas'])
+
+    def test_bad_filters_are_rejected(self):
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(reverse('export_orders'), {'start': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_orders'), {'format': 'xml'}).status_code, 400)
+
+    def test_command_writes_gzip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'orders.csv.gz')
+            call_command('export_orders', '--output', path, stdout=StringIO())
+            with gzip.open(path, 'rt') as handle:
+                self.assertEqual(len(handle.read().splitlines()), 5)
+
+
+class ConcurrentStockDecrementTests(TransactionTestCase):
+    """Many simultaneous checkouts for one product never oversell it."""
+
+    THREADS = 12
+    STOCK = 5
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            category=Category.objects.create(name='Drops'),
+            name='Limited Sneaker', description='Drop', price='150.00', stock=self.STOCK,
+        )
+
+    def buy(self, barrier, outcomes):
+        product = Product.objects.get(pk=self.product.pk)
+        barrier.wait()
+        try:
+            for _ in range(50):
+                try:
+                    with transaction.atomic():
+                        decrement_stock([(product, 1)])
+                    outcomes.append('sold')
+                    return
+                except InsufficientStock:
+                    outcomes.append('rejected')
+                    return
+                except OperationalError:
+                    # SQLite serializes writers ("database is locked"); retry
+                    time.sleep(0.01)
+            outcomes.append('gave up')
+        finally:
+            connection.close()
+
+    def test_stock_never_goes_negative(self):
+        barrier = threading.Barrier(self.THREADS)
+        outcomes = []
+        threads = [threading.Thread(target=self.buy, args=(barrier, outcomes)) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(outcomes.count('sold'), self.STOCK)
+        self.assertEqual(outcomes.count('rejected'), self.THREADS - self.STOCK)
+
+
+class ConcurrentPlaceOrderTests(TransactionTestCase):
+    """Two buyers racing through checkout for the last unit get exactly one order between them."""
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(
+            category=Category.objects.create(name='Drops'),
+            name='Last Sneaker', description='Drop', price='150.00', stock=1,
+        )
+        self.clients = []
+        for name in ('first', 'second'):
+            user = User.objects.create_user(name, password='pass12345')
+            fill_cart(user, {self.product: 1})
+            client = Client()
+            client.force_login(user)
+            self.clients.append(client)
+
+    def checkout(self, client, barrier, outcomes):
+        barrier.wait()
+        try:
+            for _ in range(50):
+                try:
+                    response = client.post(reverse('place_order'), {
+                        'full_name': 'Buyer', 'email': 'buyer@example.com', 'address': '1 Main St',
+                    })
+                except OperationalError:
+                    response = None
+                # Unread messages pile up in the session; the last one is this attempt's
+                notes = [str(message) for message in get_messages(response.wsgi_request)] if response else []
+                # SQLite serializes writers ("database is locked"), which the view reports as unexpected; retry
+                if not notes or 'unexpected' in notes[-1]:
+                    time.sleep(0.01)
+                    continue
+                outcomes.append('done')
+                return
+            outcomes.append('gave up')
+        finally:
+            connection.close()
+
+    def test_only_one_buyer_gets_the_last_unit(self):
+        card_version = get_version(card_version_key(self.product.pk))
+        barrier = threading.Barrier(len(self.clients))
+        outcomes = []
+        threads = [threading.Thread(target=self.checkout, args=(client, barrier, outcomes)) for client in self.clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes, ['done', 'done'])
+        # Judged by the rows, not the redirects: a retry after a lock error can land on a cart already bought
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OrderItem.objects.get().quantity, 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+        # The sale went through queryset updates, so the product's card is invalidated explicitly
+        self.assertGreater(get_version(card_version_key(self.product.pk)), card_version)
@@ -5,6 +5,7 @@ urlpatterns = [
     path('checkout/', views.checkout, name='checkout'),
     path('place-order/', views.place_order, name='place_order'),
     path('history/', views.order_history, name='order_history'),
+    path('export/', views.export_orders, name='export_orders'),
     path('<int:order_id>/', views.order_detail, name='order_detail'),
     path('<int:order_id>/cancel/', views.cancel_order, name='cancel_order'),
 ]
@@ -1,34 +1,55 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.utils import timezone
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db import transaction
 
+from .exports import FORMATS, ExportError, export_items, export_lines
+from .idempotency import idempotent, new_key, release_key
 from .models import Order, OrderItem
-from products.models import Product
-from products.cart import Cart  # Importing Cart class to centralize logic
+from .rollups import record_sales
+from products.inventory import HOLD_TTL, decrement_stock, hold_stock, release_holds
+from products.cart import get_cart  # One memoized cart snapshot per request
+from products.pagination import keyset_paginate, next_page_url, load_more_response
+from jobs.queue import enqueue
+
+ORDERS_PER_PAGE = 10
 
 @login_required
 def checkout(request):
-    cart = Cart(request)
+    cart = get_cart(request)
 
     if len(cart) == 0:
         messages.warning(request, "Your cart is empty.")
         return redirect('product_list')
 
+    # Reserve the cart while the shopper fills in their details
+    short = hold_stock(request.user, ((item['product'], item['quantity']) for item in cart))
+    if short:
+        for product, available in short:
+            messages.error(request, f"Only {available} of {product.name} left. Please update your cart.")
+        return redirect('cart')
+
     return render(request, 'orders/checkout.html', {
         'cart': cart,
-        'total_price': cart.get_total_price()
+        'total_price': cart.get_total_price(),
+        'hold_minutes': int(HOLD_TTL.total_seconds() // 60),
+        # Lets a double-submitted form replay the first result instead of ordering twice
+        'idempotency_key': new_key(),
     })
 
 
 @login_required
+@idempotent('place_order')
 def place_order(request):
     if request.method != "POST":
         return redirect('checkout')
 
-    cart = Cart(request)
+    cart = get_cart(request)
 
     if len(cart) == 0:
+        release_key(request)
         messages.error(request, "Your cart is empty.")
         return redirect('product_list')
 
@@ -38,6 +59,7 @@ def place_order(request):
 
     # Use total price directly from the Cart logic
     total_price = cart.get_total_price()
+    lines = list(cart)
 
     try:
         with transaction.atomic():
@@ -52,37 +74,37 @@ def place_order(request):
                 is_paid=False  # Payment Module requirement
             )
 
-            # Process items and validate stock
-            for item in cart:
-                product = item['product']
-                quantity = item['quantity']
-
-                if product.stock < quantity:
-                    # Triggering a manual exception to rollback the transaction
-                    raise ValueError(f"Not enough stock for {product.name}.")
+            # Guarded stock decrement; raises InsufficientStock to roll everything back
+            decrement_stock(((item['product'], item['quantity']) for item in lines), user=request.user)
 
-                # Create order items
-                OrderItem.objects.create(
+            OrderItem.objects.bulk_create([
+                OrderItem(
                     order=order,
-                    product=product,
+                    product=item['product'],
                     price=item['price'],
-                    quantity=quantity
+                    quantity=item['quantity']
                 )
+                for item in lines
+            ])
 
-                # Update stock
-                product.stock -= quantity
-                product.save()
+            release_holds(request.user)
+            record_sales([order.id])
 
-            # Clear the cart after successful DB operations
-            cart.clear()
+            # Durable follow-up work; commits or rolls back with the order itself
+            enqueue('orders.order_placed', {'order_id': order.id}, unique_key=f'order_placed:{order.id}')
 
-            messages.success(request, "Order placed successfully! Please proceed to payment.")
-            return redirect('order_history')
+        # Clear the cart after successful DB operations
+        cart.clear()
+
+        messages.success(request, "Order placed successfully! Please proceed to payment.")
+        return redirect('order_history')
 
     except ValueError as e:
+        release_key(request)
         messages.error(request, str(e))
         return redirect('cart')
     except Exception:
+        release_key(request)
         messages.error(request, "An unexpected error occurred during checkout.")
         return redirect('cart')
 
@@ -90,9 +112,17 @@ def place_order(request):
 @login_required
 def order_history(request):
     # Ordering by latest created to satisfy UI requirements
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    orders = Order.objects.filter(user=request.user)
+    page = keyset_paginate(orders, request.GET.get('cursor'), ORDERS_PER_PAGE)
+
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return load_more_response(request, page, 'orders/includes/order_cards.html', {
+            'orders': page
+        })
+
     return render(request, 'orders/order_history.html', {
-        'orders': orders
+        'orders': page,
+        'next_url': next_page_url(request, page)
     })
 
 
@@ -108,19 +138,44 @@ def order_detail(request, order_id):
 def cancel_order(request, order_id):
     order = get_object_or_404(Order, id=order_id, user=request.user)
 
-    if order.status != 'Pending':
+    if not order.cancel():
         messages.error(request, "Only pending orders can be cancelled.")
         return redirect('order_detail', order_id=order.id)
 
-    with transaction.atomic():
-        # Restore stock
-        for item in order.items.all():
-            product = item.product
-            product.stock += item.quantity
-            product.save()
+    messages.success(request, "Order cancelled. Stock has been restored.")
+    return redirect('order_detail', order_id=order.id)
 
-        order.status = 'Cancelled'
-        order.save()
 
-    messages.success(request, "Order cancelled. Stock has been restored.")
-    return redirect('order_detail', order_id=order.id)
\ No newline at end of file
+@login_required
+def export_orders(request):
+    """
+    Streams orders as CSV or JSONL. Staff export everything (optionally one
+    ?vendor=<id>); vendors export only lines for their own products.
+    Filters: ?start=&end= (YYYY-MM-DD), ?status=.
+    """
+    if request.user.is_staff:
+        vendor = request.GET.get('vendor') or None
+        if vendor is not None and not vendor.isdigit():
+            return HttpResponseBadRequest("vendor must be a user id.")
+        include_total = vendor is None
+    elif request.user.profile.role == 'Vendor':
+        vendor, include_total = request.user, False
+    else:
+        messages.error(request, "Access denied.")
+        return redirect('product_list')
+
+    fmt = request.GET.get('format', 'csv')
+    try:
+        items = export_items(
+            start=request.GET.get('start'),
+            end=request.GET.get('end'),
+            status=request.GET.get('status'),
+            vendor=vendor,
+        )
+        lines = export_lines(fmt, items, include_total=include_total)
+    except ExportError as e:
+        return HttpResponseBadRequest(str(e))
+
+    response = StreamingHttpResponse(lines, content_type=FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="orders-{timezone.localdate():%Y%m%d}.{fmt}"'
+    return response
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Product
+from .models import CartLine, Category, Product, StockHold, StoredCart
 
 
 @admin.register(Category)
@@ -15,3 +15,29 @@ class ProductAdmin(admin.ModelAdmin):
     list_editable = ('price', 'stock', 'available')
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ('name', 'description')
+    # Maintained from the reviews table; repair with `manage.py rebuild_rating_aggregates`
+    readonly_fields = (
+        'avg_rating', 'review_count',
+        'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+    )
+
+
+@admin.register(StockHold)
+class StockHoldAdmin(admin.ModelAdmin):
+    list_display = ('product', 'user', 'quantity', 'expires_at')
+    list_select_related = ('product', 'user')
+    raw_id_fields = ('product', 'user')
+
+
+class CartLineInline(admin.TabularInline):
+    model = CartLine
+    raw_id_fields = ('product',)
+    extra = 0
+
+
+@admin.register(StoredCart)
+class StoredCartAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'created_at')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    inlines = [CartLineInline]
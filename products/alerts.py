@@ -0,0 +1,132 @@
+from datetime import timedelta
+from itertools import groupby
+
+from django.db import transaction
+from django.template.loader import get_template
+
+from jobs.outbox import queue_emails
+from jobs.queue import enqueue
+from .models import Product, ProductChange
+
+# Changes recorded within this window go out in the same digest
+DIGEST_DELAY = timedelta(minutes=30)
+
+CHANGE_BATCH_SIZE = 5000
+RECIPIENT_CHUNK_SIZE = 2000
+EMAIL_BATCH_SIZE = 1000
+
+_price = Product._meta.get_field('price')
+_stock = Product._meta.get_field('stock')
+
+
+# --- CHANGE CAPTURE ---
+
+def record_changes(transitions):
+    """
+    Records the price drops and restocks among (product_id, old_price,
+    new_price, old_stock, new_stock) transitions and schedules a digest run.
+    An old value of None means it is unknown and that side is skipped. Only
+    products someone has wishlisted are kept, found with one indexed query.
+    Call it in the transaction that writes the new values.
+    """
+    changes = []
+    for product_id, old_price, new_price, old_stock, new_stock in transitions:
+        if old_price is not None and new_price is not None:
+            old_price, new_price = _price.to_python(old_price), _price.to_python(new_price)
+            if new_price < old_price:
+                changes.append(ProductChange(
+                    product_id=product_id, kind=ProductChange.PRICE_DROP, old_price=old_price, new_price=new_price
+                ))
+        if old_stock is not None and new_stock is not None:
+            if _stock.to_python(old_stock) == 0 and _stock.to_python(new_stock) > 0:
+                changes.append(ProductChange(product_id=product_id, kind=ProductChange.BACK_IN_STOCK))
+    if not changes:
+        return 0
+
+    wishlisted = set(
+        Product.wishlisted_by.through.objects
+        .filter(product_id__in={change.product_id for change in changes})
+        .values_list('product_id', flat=True).distinct()
+    )
+    changes = [change for change in changes if change.product_id in wishlisted]
+    if changes:
+        ProductChange.objects.bulk_create(changes, batch_size=EMAIL_BATCH_SIZE)
+        enqueue('products.wishlist_digest', delay=DIGEST_DELAY, unique_key='products:wishlist_digest')
+    return len(changes)
+
+
+# --- DIGESTS ---
+
+def _alerts(changes):
+    """
+    {product_id: alert} for the batch, judged against the product's current
+    row: a drop counts if the price is still below the first price seen in
+    the batch, a restock only if the product is still in stock.
+    """
+    was = {}
+    restocked = set()
+    for change in changes:
+        if change.kind == ProductChange.PRICE_DROP:
+            was.setdefault(change.product_id, change.old_price)
+        else:
+            restocked.add(change.product_id)
+
+    alerts = {}
+    products = Product.objects.filter(pk__in=was.keys() | restocked, available=True).only(
+        'id', 'name', 'slug', 'price', 'stock'
+    )
+    for product in products:
+        old_price = was.get(product.pk)
+        price_drop = old_price is not None and product.price < old_price
+        back_in_stock = product.pk in restocked and product.stock > 0
+        if price_drop or back_in_stock:
+            alerts[product.pk] = {
+                'product': product,
+                'old_price': old_price if price_drop else None,
+                'back_in_stock': back_in_stock,
+            }
+    return alerts
+
+
+def _digests(alerts, batch_id):
+    """Yields one outbox message per user, streaming the wishlist join ordered by user."""
+    template = get_template('products/emails/wishlist_digest.txt')
+    rows = (
+        Product.wishlisted_by.through.objects
+        .filter(product_id__in=list(alerts))
+        .exclude(profile__user__email='')
+        .order_by('profile__user_id', 'product_id')
+        .values_list('profile__user_id', 'profile__user__username', 'profile__user__email', 'product_id')
+        .iterator(chunk_size=RECIPIENT_CHUNK_SIZE)
+    )
+    for (user_id, username, email), group in groupby(rows, key=lambda row: row[:3]):
+        items = [alerts[row[3]] for row in group]
+        yield {
+            'to': email,
+            'subject': "Good news from your ShopX wishlist",
+            'body': template.render({'username': username, 'items': items}),
+            # A retried run rebuilds the same batch; the outbox skips what it already has
+            'dedupe_key': f'wishlist_digest:{batch_id}:{user_id}',
+        }
+
+
+def send_wishlist_digests(batch_size=CHANGE_BATCH_SIZE):
+    """
+    Folds pending ProductChange rows into one digest email per user.
+    Each batch joins its changes against the wishlist table in one streamed
+    query, bulk-inserts the emails into the outbox and deletes the changes,
+    all in one transaction. Returns the number of products alerted on.
+    """
+    alerted = 0
+    while True:
+        with transaction.atomic():
+            changes = list(ProductChange.objects.order_by('pk')[:batch_size])
+            if not changes:
+                return alerted
+            alerts = _alerts(changes)
+            if alerts:
+                queue_emails(_digests(alerts, changes[0].pk), batch_size=EMAIL_BATCH_SIZE)
+            ProductChange.objects.filter(pk__in=[change.pk for change in changes]).delete()
+            alerted += len(alerts)
+        if len(changes) < batch_size:
+            return alerted
@@ -0,0 +1,76 @@
+import time
+
+from django.core.cache import cache
+
+# Version stamps embedded in cache keys; bumping one orphans every entry built on it
+FACET_VERSION_KEY = 'products:facet_version'
+CARD_VERSION_KEY = 'products:card_version'
+
+
+def _seed():
+    """
+    Starting value for a missing stamp: the clock in microseconds. A stamp that
+    was evicted restarts above anything it held before, instead of at a value
+    that older cached entries may still be keyed on.
+    """
+    return time.time_ns() // 1000
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _seed(), None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(keys):
+    """get_version for many keys: one get_many, plus an add for each missing stamp."""
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    for key in missing:
+        cache.add(key, _seed(), None)
+    if missing:
+        versions.update(cache.get_many(missing))
+    return versions
+
+
+def bump_version(key):
+    # incr is atomic in the cache, so concurrent bumps never collapse into one
+    try:
+        cache.incr(key)
+    except ValueError:
+        # add loses to a concurrent seed, which then only needs our increment
+        if not cache.add(key, _seed(), None):
+            cache.incr(key)
+
+
+# --- PRODUCT CARD FRAGMENTS ---
+
+def card_version_key(product_id):
+    return f"{CARD_VERSION_KEY}:{product_id}"
+
+
+def bump_card_version(product_id=None):
+    """Invalidates one product's cached card, or every card when no id is given."""
+    bump_version(card_version_key(product_id) if product_id else CARD_VERSION_KEY)
+
+
+def bump_card_versions(product_ids):
+    """Invalidates many cards: one atomic increment per card."""
+    for product_id in product_ids:
+        bump_version(card_version_key(product_id))
+
+
+def attach_card_versions(products):
+    """
+    Sets product.card_version for the {% cache %} key of each card, combining
+    the global stamp (category changes) with the product's own stamp. One
+    get_many for the whole page once the stamps exist.
+    """
+    keys = {card_version_key(product.pk): product for product in products}
+    stamps = get_versions([CARD_VERSION_KEY, *keys])
+    base = stamps.get(CARD_VERSION_KEY, 0)
+    for key, product in keys.items():
+        product.card_version = f"{base}.{stamps.get(key, 0)}"
+    return products
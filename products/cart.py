@@ -1,77 +1,199 @@
+from datetime import timedelta
 from decimal import Decimal
-from .models import Product
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from jobs.cleanup import delete_in_batches
+from .models import CartLine, StoredCart
+
+# The only cart state kept in the session: the id of an anonymous cart
+SESSION_KEY = 'cart_id'
+
+PURGE_BATCH_SIZE = 1000
+
+# Line changes refresh the cart's updated_at at most this often, so most of
+# them leave the cart row itself alone
+ACTIVITY_RESOLUTION = timedelta(hours=1)
+
 
 class Cart:
+    """
+    Session-style cart interface over the StoredCart/CartLine tables. Every
+    mutation writes just the line it touches; the session row is written
+    once, when an anonymous shopper's cart is created. Use get_cart(request)
+    to share one instance, and its snapshot, across a request.
+    """
+
     def __init__(self, request):
         self.session = request.session
-        cart = self.session.get('cart')
+        self.user = request.user if request.user.is_authenticated else None
+        self._cart_id = None
+        self._items = None
 
-        if not cart:
-            cart = self.session['cart'] = {}
+    def _get_cart_id(self, create=False):
+        if self._cart_id is None:
+            if self.user is not None:
+                self._cart_id = StoredCart.objects.filter(user=self.user).values_list('pk', flat=True).first()
+            else:
+                self._cart_id = self.session.get(SESSION_KEY)
+        if self._cart_id is None and create:
+            if self.user is not None:
+                self._cart_id = StoredCart.objects.get_or_create(user=self.user)[0].pk
+            else:
+                self._cart_id = StoredCart.objects.create().pk
+                self.session[SESSION_KEY] = self._cart_id
+        return self._cart_id
 
-        self.cart = cart
-
-    def __iter__(self):
+    @property
+    def items(self):
         """
-        Enables the cart to be used in loops: {% for item in cart %}.
-        Fetches Product objects from the DB for display.
+        The cart snapshot: one dict per line with product, quantity, price
+        and total_price, built once with a single query joining each line to
+        its product. Prices are the products' live Decimal prices, so the
+        cart page, checkout and the order all agree.
         """
-        product_ids = self.cart.keys()
-        # Fetch actual Product objects from DB
-        products = Product.objects.filter(id__in=product_ids)
-        
-        cart = self.cart.copy()
-        for product in products:
-            cart[str(product.id)]['product'] = product
-
-        for item in cart.values():
-            item['price'] = Decimal(item['price'])
-            item['total_price'] = item['price'] * item['quantity']
-            yield item
+        if self._items is None:
+            if self.user is not None:
+                lines = CartLine.objects.filter(cart__user=self.user)
+            elif self.session.get(SESSION_KEY):
+                lines = CartLine.objects.filter(cart_id=self.session[SESSION_KEY], cart__user__isnull=True)
+            else:
+                lines = CartLine.objects.none()
+            self._items = [
+                _item(line.product, line.quantity)
+                for line in lines.select_related('product__category').order_by('pk')
+            ]
+        return self._items
+
+    def _touch(self):
+        now = timezone.now()
+        StoredCart.objects.filter(pk=self._cart_id, updated_at__lt=now - ACTIVITY_RESOLUTION).update(updated_at=now)
+
+    def _line(self, product):
+        return CartLine.objects.filter(cart_id=self._get_cart_id(), product_id=product.id)
+
+    def _find(self, product):
+        if self._items is None:
+            return None
+        return next((item for item in self._items if item['product'].id == product.id), None)
+
+    def __iter__(self):
+        """Enables the cart to be used in loops: {% for item in cart %}."""
+        return iter(self.items)
 
     def __len__(self):
         """Allows using {{ cart|length }} in templates."""
-        return sum(item['quantity'] for item in self.cart.values())
+        return self.get_total_items()
 
     def add(self, product, quantity=1):
-        product_id = str(product.id)
-
-        if product_id not in self.cart:
-            self.cart[product_id] = {
-                'price': float(product.price), # Keep as float for JSON serialization
-                'quantity': 0,
-            }
+        cart_id = self._get_cart_id(create=True)
+        line = CartLine.objects.filter(cart_id=cart_id, product_id=product.id)
+        if not line.update(quantity=F('quantity') + quantity):
+            if self.user is None and not StoredCart.objects.filter(pk=cart_id, user__isnull=True).exists():
+                # The session outlived its cart (purged or merged elsewhere); start a new one
+                self._cart_id = self._items = None
+                del self.session[SESSION_KEY]
+                return self.add(product, quantity)
+            try:
+                with transaction.atomic():
+                    CartLine.objects.create(cart_id=cart_id, product=product, quantity=quantity)
+            except IntegrityError:
+                # A concurrent request created the line first
+                line.update(quantity=F('quantity') + quantity)
+        self._touch()
 
-        self.cart[product_id]['quantity'] += quantity
-        self.save()
+        # Keep an already-built snapshot in step instead of reloading it
+        item = self._find(product)
+        if item is not None:
+            item.update(_item(item['product'], item['quantity'] + quantity))
+        elif self._items is not None:
+            self._items.append(_item(product, quantity))
 
     def remove(self, product):
-        product_id = str(product.id)
-        if product_id in self.cart:
-            del self.cart[product_id]
-            self.save()
+        if self._get_cart_id() is not None:
+            self._line(product).delete()
+            self._touch()
+            if self._items is not None:
+                self._items = [item for item in self._items if item['product'].id != product.id]
 
     def update(self, product, quantity):
-        product_id = str(product.id)
-        if product_id in self.cart:
-            self.cart[product_id]['quantity'] = quantity
-            self.save()
+        if self._get_cart_id() is not None and self._line(product).update(quantity=quantity):
+            self._touch()
+            item = self._find(product)
+            if item is not None:
+                item.update(_item(item['product'], quantity))
 
     def clear(self):
-        self.session['cart'] = {}
-        self.save()
+        if self._get_cart_id() is not None:
+            CartLine.objects.filter(cart_id=self._cart_id).delete()
+            self._touch()
+        self._items = []
 
     def save(self):
-        self.session.modified = True
+        """Lines are written as they change; kept for callers of the session-based API."""
 
     def get_total_price(self):
-        return sum(
-            Decimal(item['price']) * item['quantity']
-            for item in self.cart.values()
-        )
+        return sum((item['total_price'] for item in self.items), Decimal('0.00'))
 
     def get_total_items(self):
-        return sum(
-            item['quantity']
-            for item in self.cart.values()
-        )
\ No newline at end of file
+        return sum(item['quantity'] for item in self.items)
+
+
+def _item(product, quantity):
+    return {
+        'product': product,
+        'quantity': quantity,
+        'price': product.price,
+        'total_price': product.price * quantity,
+    }
+
+
+def get_cart(request):
+    """The request's Cart, created on first use, so every caller shares one snapshot."""
+    if not hasattr(request, '_cart'):
+        request._cart = Cart(request)
+    return request._cart
+
+
+def merge_anonymous_cart(session, user):
+    """
+    Folds the session's anonymous cart into the user's cart on login:
+    quantities add up for products in both, other lines move across.
+    """
+    cart_id = session.pop(SESSION_KEY, None)
+    if cart_id is None:
+        return
+    with transaction.atomic():
+        anonymous = list(
+            CartLine.objects.filter(cart_id=cart_id, cart__user__isnull=True)
+            .values_list('product_id', 'quantity')
+        )
+        if anonymous:
+            user_cart, _ = StoredCart.objects.get_or_create(user=user)
+            existing = set(
+                CartLine.objects.filter(cart=user_cart, product_id__in=[line[0] for line in anonymous])
+                .values_list('product_id', flat=True)
+            )
+            for product_id, quantity in anonymous:
+                if product_id in existing:
+                    CartLine.objects.filter(cart=user_cart, product_id=product_id).update(
+                        quantity=F('quantity') + quantity
+                    )
+            CartLine.objects.bulk_create([
+                CartLine(cart=user_cart, product_id=product_id, quantity=quantity)
+                for product_id, quantity in anonymous if product_id not in existing
+            ])
+        StoredCart.objects.filter(pk=cart_id, user__isnull=True).delete()
+
+
+def purge_abandoned_carts(batch_size=PURGE_BATCH_SIZE):
+    """
+    Deletes anonymous carts left untouched for longer than the session
+    lifetime, whose session (the only reference to them) has expired with
+    them. Returns the number removed.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.SESSION_COOKIE_AGE)
+    return delete_in_batches(StoredCart.objects.filter(user__isnull=True, updated_at__lt=cutoff), batch_size)
@@ -0,0 +1,6 @@
+from .cart import get_cart
+
+
+def cart(request):
+    """Navbar badge count from the request's shared cart snapshot, read only if a template uses it."""
+    return {'cart_count': lambda: get_cart(request).get_total_items()}
@@ -0,0 +1,176 @@
+import hashlib
+from collections import Counter
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .caching import FACET_VERSION_KEY, get_version
+
+FACET_CACHE_TIMEOUT = 60 * 15
+
+# (slug, label, lower bound inclusive, upper bound exclusive)
+PRICE_BUCKETS = (
+    ('under-50', 'Under $50', None, 50),
+    ('50-200', '$50 – $200', 50, 200),
+    ('200-500', '$200 – $500', 200, 500),
+    ('500-plus', '$500+', 500, None),
+)
+
+
+def price_bucket_q(slug):
+    """Q object for a price bucket slug, or None if the slug is unknown."""
+    for bucket_slug, _, low, high in PRICE_BUCKETS:
+        if bucket_slug == slug:
+            q = Q()
+            if low is not None:
+                q &= Q(price__gte=low)
+            if high is not None:
+                q &= Q(price__lt=high)
+            return q
+    return None
+
+
+def _filter(queryset, category=None, price=None, in_stock=False):
+    if category:
+        queryset = queryset.filter(category__slug=category)
+    if price and price_bucket_q(price) is not None:
+        queryset = queryset.filter(price_bucket_q(price))
+    if in_stock:
+        queryset = queryset.filter(stock__gt=0)
+    return queryset
+
+
+def apply_filters(queryset, filters):
+    return _filter(queryset, **filters)
+
+
+def _in_bucket(price, slug):
+    for bucket_slug, _, low, high in PRICE_BUCKETS:
+        if bucket_slug == slug:
+            return (low is None or price >= low) and (high is None or price < high)
+    return True
+
+
+def _matches(facts, category=None, price=None, in_stock=False):
+    """In-memory twin of _filter for the search index's ProductFacts."""
+    if category and facts.category_slug != category:
+        return False
+    if price and not _in_bucket(facts.price, price):
+        return False
+    return not in_stock or facts.stock > 0
+
+
+def listing_predicate(filters):
+    """Predicate matching what apply_filters leaves of the available products."""
+    return lambda facts: facts.available and _matches(facts, **filters)
+
+
+def _compute_counts(base, filters):
+    """
+    Each facet is counted with every *other* active filter applied, so picking
+    a category still shows how many results the other categories would give.
+    """
+    category, price, in_stock = filters['category'], filters['price'], filters['in_stock']
+
+    by_category = (
+        _filter(base, price=price, in_stock=in_stock)
+        .order_by()
+        .values('category_id')
+        .annotate(total=Count('id'))
+    )
+    by_price = _filter(base, category=category, in_stock=in_stock).aggregate(**{
+        slug: Count('id', filter=price_bucket_q(slug)) for slug, *_ in PRICE_BUCKETS
+    })
+    in_stock_count = _filter(base, category=category, price=price).aggregate(
+        total=Count('id', filter=Q(stock__gt=0))
+    )['total']
+
+    return {
+        'categories': {row['category_id']: row['total'] for row in by_category},
+        'prices': by_price,
+        'in_stock': in_stock_count,
+    }
+
+
+def search_facet_counts(hits, filters):
+    """
+    _compute_counts over the search index's ProductFacts for a query's hits.
+    Counting in memory keeps the hit list out of the SQL, however broad the query.
+    """
+    category, price, in_stock = filters['category'], filters['price'], filters['in_stock']
+
+    by_category = Counter()
+    by_price = dict.fromkeys((slug for slug, *_ in PRICE_BUCKETS), 0)
+    in_stock_count = 0
+    for facts in hits:
+        if _matches(facts, price=price, in_stock=in_stock):
+            by_category[facts.category_id] += 1
+        if _matches(facts, category=category, in_stock=in_stock):
+            for slug in by_price:
+                if _in_bucket(facts.price, slug):
+                    by_price[slug] += 1
+        if facts.stock > 0 and _matches(facts, category=category, price=price):
+            in_stock_count += 1
+
+    return {
+        'categories': dict(by_category),
+        'prices': by_price,
+        'in_stock': in_stock_count,
+    }
+
+
+def facet_counts(base, filters):
+    """
+    Facet counts for the current filter state of the catalog listing, cached per
+    state. The key carries the catalog facet version, so any Product change
+    invalidates it. Searches count their hits with search_facet_counts instead.
+    """
+    state = '|'.join([
+        filters['category'] or '',
+        filters['price'] or '',
+        '1' if filters['in_stock'] else '',
+    ])
+    digest = hashlib.md5(state.encode()).hexdigest()
+    key = f"products:facets:{get_version(FACET_VERSION_KEY)}:{digest}"
+
+    counts = cache.get(key)
+    if counts is None:
+        counts = _compute_counts(base, filters)
+        cache.set(key, counts, FACET_CACHE_TIMEOUT)
+    return counts
+
+
+def build_facets(request, counts, categories):
+    """Attaches counts, toggle URLs and active state for the template."""
+    def url_with(**changes):
+        params = request.GET.copy()
+        params.pop('cursor', None)
+        for name, value in changes.items():
+            if value:
+                params[name] = value
+            else:
+                params.pop(name, None)
+        encoded = params.urlencode()
+        return f"{request.path}?{encoded}" if encoded else request.path
+
+    current = request.GET
+    return {
+        'all_categories_url': url_with(category=None),
+        'categories': [{
+            'name': category.name,
+            'count': counts['categories'].get(category.id, 0),
+            'url': url_with(category=category.slug),
+            'active': current.get('category') == category.slug,
+        } for category in categories],
+        'prices': [{
+            'label': label,
+            'count': counts['prices'][slug],
+            'url': url_with(price=None if current.get('price') == slug else slug),
+            'active': current.get('price') == slug,
+        } for slug, label, *_ in PRICE_BUCKETS],
+        'in_stock': {
+            'count': counts['in_stock'],
+            'url': url_with(in_stock=None if current.get('in_stock') else '1'),
+            'active': bool(current.get('in_stock')),
+        },
+    }
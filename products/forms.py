@@ -17,10 +17,12 @@ class ReviewForm(forms.ModelForm):
 class ProductForm(forms.ModelForm):
     class Meta:
         model = Product
-        fields = ['category', 'name', 'description', 'price', 'stock', 'image']
+        fields = ['category', 'name', 'sku', 'description', 'price', 'stock', 'image']
+        labels = {'sku': 'SKU'}
         
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, vendor=None, **kwargs):
         super(ProductForm, self).__init__(*args, **kwargs)
+        self.vendor = vendor
         for name, field in self.fields.items():
             if name == 'image':
                 field.widget.attrs.update({'class': 'form-control bg-dark text-white border-secondary'})
@@ -29,4 +31,13 @@ class ProductForm(forms.ModelForm):
                     'class': 'form-control bg-dark text-white border-secondary shadow-none',
                     'placeholder': field.label
                 })
-        self.fields['description'].widget.attrs.update({'rows': '4'})
\ No newline at end of file
+        self.fields['description'].widget.attrs.update({'rows': '4'})
+
+    def clean_sku(self):
+        # vendor is not a form field, so the model's (vendor, sku) check is skipped
+        sku = self.cleaned_data.get('sku')
+        if sku and self.vendor is not None:
+            clash = Product.objects.filter(vendor=self.vendor, sku=sku).exclude(pk=self.instance.pk)
+            if clash.exists():
+                raise forms.ValidationError("You already have a product with this SKU.")
+        return sku
@@ -0,0 +1,314 @@
+import codecs
+import csv
+import json
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from functools import partial
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Q
+
+from .alerts import record_changes
+from .caching import FACET_VERSION_KEY, bump_card_version, bump_version
+from .models import Category, Product, slug_base
+from .search import invalidate_all_workers
+
+BATCH_SIZE = 1000
+
+FORMATS = ('csv', 'jsonl')
+
+# Columns a row may set; only sku is required on every row
+FIELDS = ('sku', 'name', 'description', 'price', 'stock', 'category', 'available')
+
+# A new product needs all of these (column: cleaned field); updates may send any subset
+REQUIRED_FOR_CREATE = {'name': 'name', 'price': 'price', 'category': 'category_id'}
+
+MAX_PRICE = Decimal('99999999.99')
+
+NOT_UTF8 = "This line is not valid UTF-8; save the file as UTF-8 and upload it again."
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+FALSE_VALUES = {'0', 'false', 'no', 'n'}
+
+
+@dataclass
+class ImportReport:
+    created: int = 0
+    updated: int = 0
+    errors: list = field(default_factory=list)  # (line, sku, message)
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
+def guess_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+# --- PARSING (streaming) ---
+
+def _decoded_lines(stream, unreadable):
+    """
+    Decodes a binary stream line by line as UTF-8 (BOM optional). Lines that
+    are not valid UTF-8 are passed on with replacement characters and their
+    numbers added to `unreadable`, so one bad line cannot abort the import.
+    """
+    for number, raw in enumerate(stream, start=1):
+        if number == 1 and raw.startswith(codecs.BOM_UTF8):
+            raw = raw[len(codecs.BOM_UTF8):]
+        try:
+            yield raw.decode('utf-8')
+        except UnicodeDecodeError:
+            unreadable.add(number)
+            yield raw.decode('utf-8', errors='replace')
+
+
+def parse_rows(stream, fmt):
+    """
+    Yields (line, row) from a binary stream one record at a time, so memory
+    does not grow with the file. Records that cannot be read yield
+    (line, message) instead of a row dict.
+    """
+    unreadable = set()
+    text = _decoded_lines(stream, unreadable)
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        first = 2
+        for row in reader:
+            # A quoted field can span lines; the record covers first..line_num
+            if unreadable.intersection(range(first, reader.line_num + 1)):
+                row = NOT_UTF8
+            first = reader.line_num + 1
+            yield reader.line_num, row
+    else:
+        for line, raw in enumerate(text, start=1):
+            if line in unreadable:
+                yield line, NOT_UTF8
+                continue
+            if not raw.strip():
+                continue
+            try:
+                row = json.loads(raw)
+            except ValueError:
+                row = None
+            yield line, row if isinstance(row, dict) else None
+
+
+# --- VALIDATION (pure Python, safe to run in worker processes) ---
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def validate_row(categories, item):
+    """
+    Cleans one parsed row without touching the database. Returns
+    (line, sku, fields, errors); fields only holds the columns the row set.
+    """
+    line, row = item
+    if not isinstance(row, dict):
+        return line, '', {}, [row or "Could not parse this line."]
+
+    # JSONL values may be any JSON type; only scalars make sense as columns
+    nested = [name for name in FIELDS if isinstance(row.get(name), (dict, list))]
+    errors = [f"{name} must be a single value, not a list or object." for name in nested]
+    fields = {}
+    sku = '' if 'sku' in nested or _blank(row.get('sku')) else str(row['sku']).strip()
+    if not sku and 'sku' not in nested:
+        errors.append("sku is required.")
+    elif len(sku) > 64:
+        errors.append("sku must be at most 64 characters.")
+
+    for name in FIELDS[1:]:
+        value = row.get(name)
+        if name in nested or _blank(value):
+            continue
+        value = str(value).strip()
+        if name == 'name':
+            if len(value) > 200:
+                errors.append("name must be at most 200 characters.")
+            fields['name'] = value
+        elif name == 'description':
+            fields['description'] = value
+        elif name == 'price':
+            try:
+                price = Decimal(value)
+            except InvalidOperation:
+                errors.append(f"price {value!r} is not a number.")
+                continue
+            if not price.is_finite() or price < 0 or price > MAX_PRICE or price != round(price, 2):
+                errors.append(f"price {value!r} must be between 0 and {MAX_PRICE} with at most 2 decimals.")
+                continue
+            fields['price'] = price
+        elif name == 'stock':
+            if not re.fullmatch(r'\d+', value):
+                errors.append(f"stock {value!r} must be a whole number of 0 or more.")
+                continue
+            fields['stock'] = int(value)
+        elif name == 'category':
+            category_id = categories.get(value.lower())
+            if category_id is None:
+                errors.append(f"Unknown category {value!r}.")
+                continue
+            fields['category_id'] = category_id
+        elif name == 'available':
+            flag = value.lower()
+            if flag not in TRUE_VALUES | FALSE_VALUES:
+                errors.append(f"available {value!r} must be true or false.")
+                continue
+            fields['available'] = flag in TRUE_VALUES
+
+    return line, sku, fields, errors
+
+
+def _validate_chunk(categories, chunk):
+    return [validate_row(categories, item) for item in chunk]
+
+
+def _category_lookup():
+    lookup = {}
+    for category_id, name, slug in Category.objects.values_list('id', 'name', 'slug'):
+        lookup[name.lower()] = category_id
+        lookup[slug.lower()] = category_id
+    return lookup
+
+
+# --- SLUGS ---
+
+def assign_slugs(products):
+    """
+    Gives each product a unique slug with one query for the whole batch:
+    existing slugs sharing a base are fetched together, then "-2", "-3", ...
+    are handed out in memory.
+    """
+    by_base = {}
+    for product in products:
+        by_base.setdefault(slug_base(product.name) or 'product', []).append(product)
+
+    query = Q()
+    for base in by_base:
+        query |= Q(slug=base) | Q(slug__startswith=f'{base}-')
+    exclude = [product.pk for product in products if product.pk]
+    taken = set(Product.objects.filter(query).exclude(pk__in=exclude).values_list('slug', flat=True))
+
+    for base, group in by_base.items():
+        suffix = 1
+        for product in group:
+            slug = base
+            while slug in taken:
+                suffix += 1
+                slug = f'{base}-{suffix}'
+            taken.add(slug)
+            product.slug = slug
+
+
+# --- UPSERT ---
+
+def _apply_batch(vendor, rows, report):
+    """Creates or updates one batch of validated rows in a single transaction."""
+    existing = {
+        product.sku: product
+        for product in Product.objects.filter(vendor=vendor, sku__in=[sku for _, sku, _, _ in rows])
+    }
+    created, updated, renamed, changed_fields, transitions = [], [], [], set(), []
+
+    for line, sku, fields, _ in rows:
+        product = existing.get(sku)
+        if product is None:
+            missing = [column for column, name in REQUIRED_FOR_CREATE.items() if name not in fields]
+            if missing:
+                report.errors.append((line, sku, f"New products need {', '.join(missing)}."))
+                continue
+            product = Product(vendor=vendor, sku=sku, **{'description': '', 'stock': 0, 'available': True, **fields})
+            created.append(product)
+            renamed.append(product)
+            continue
+
+        if 'name' in fields and fields['name'] != product.name:
+            renamed.append(product)
+        if 'price' in fields or 'stock' in fields:
+            transitions.append((
+                product.pk,
+                product.price, fields.get('price', product.price),
+                product.stock, fields.get('stock', product.stock),
+            ))
+        for name, value in fields.items():
+            setattr(product, name, value)
+        changed_fields.update('category' if name == 'category_id' else name for name in fields)
+        updated.append(product)
+
+    with transaction.atomic():
+        if renamed:
+            assign_slugs(renamed)
+            if any(product.pk for product in renamed):
+                changed_fields.add('slug')
+        if updated and changed_fields:
+            Product.objects.bulk_update(updated, sorted(changed_fields))
+        Product.objects.bulk_create(created)
+        # bulk_update skips post_save, so capture price drops and restocks here
+        record_changes(transitions)
+
+    report.created += len(created)
+    report.updated += len(updated)
+
+
+def import_products(vendor, stream, fmt='csv', workers=1):
+    """
+    Streams a CSV/JSONL file of products into the vendor's catalog, matching
+    rows to existing products by sku. Rows are validated in chunks (across
+    `workers` processes when > 1) and written with bulk_create/bulk_update a
+    batch at a time. Bad rows are skipped and listed in the report.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown import format {fmt!r}.")
+
+    report = ImportReport()
+    validate = partial(_validate_chunk, _category_lookup())
+    rows = parse_rows(stream, fmt)
+    seen = {}
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    chunk_size = max(BATCH_SIZE // max(workers, 1), 1)
+
+    try:
+        while batch := list(islice(rows, BATCH_SIZE)):
+            chunks = [batch[start:start + chunk_size] for start in range(0, len(batch), chunk_size)]
+            results = pool.map(validate, chunks) if pool else map(validate, chunks)
+
+            valid = []
+            for chunk in results:
+                for line, sku, fields, errors in chunk:
+                    if not errors and sku in seen:
+                        errors = [f"Duplicate sku; already on line {seen[sku]}."]
+                    if errors:
+                        report.errors.extend((line, sku, message) for message in errors)
+                        continue
+                    seen[sku] = line
+                    valid.append((line, sku, fields, errors))
+            if valid:
+                _apply_batch(vendor, valid, report)
+    finally:
+        if pool:
+            pool.shutdown()
+
+    report.errors.sort(key=lambda error: error[0])
+    if report.created or report.updated:
+        catalog_changed()
+    return report
+
+
+def catalog_changed():
+    """
+    bulk_create/bulk_update skip model signals, so refresh everything the
+    signals would have: facet counts, cached cards and the in-process
+    search/autocomplete indexes (rebuilt lazily by every worker).
+    """
+    def invalidate():
+        bump_version(FACET_VERSION_KEY)
+        bump_card_version()
+        invalidate_all_workers()
+
+    transaction.on_commit(invalidate)
@@ -0,0 +1,263 @@
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import (
+    Case, DecimalField, F, OuterRef, PositiveIntegerField, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from jobs.cleanup import delete_in_batches
+from .alerts import record_changes
+from .caching import FACET_VERSION_KEY, bump_card_versions, bump_version
+from .models import Product, StockHold
+from .search import publish_change
+
+# How long entering checkout reserves the cart's quantities
+HOLD_TTL = timedelta(minutes=15)
+
+SWEEP_BATCH_SIZE = 1000
+
+
+class InsufficientStock(ValueError):
+    """Raised inside a checkout transaction to roll it back."""
+
+    def __init__(self, product):
+        self.product = product
+        super().__init__(f"Not enough stock for {product.name}.")
+
+
+def _live_holds(exclude_user=None):
+    holds = StockHold.objects.filter(expires_at__gt=timezone.now())
+    if exclude_user is not None:
+        holds = holds.exclude(user=exclude_user)
+    return holds
+
+
+def held_quantities(product_ids, exclude_user=None):
+    """{product_id: units under live holds}, one grouped query on the (product, expires_at) index."""
+    return dict(
+        _live_holds(exclude_user).filter(product_id__in=product_ids)
+        .order_by().values('product_id')
+        .annotate(held=Sum('quantity'))
+        .values_list('product_id', 'held')
+    )
+
+
+def available_stock(products, user=None):
+    """{product_id: on-hand stock minus other shoppers' live holds} for the given products."""
+    held = held_quantities([product.pk for product in products], exclude_user=user)
+    return {product.pk: max(product.stock - held.get(product.pk, 0), 0) for product in products}
+
+
+def hold_stock(user, lines):
+    """
+    Reserves (product, quantity) pairs for the user for HOLD_TTL, replacing
+    their previous holds. Product rows are locked in primary-key order so two
+    shoppers cannot reserve the same last units. Lines that do not fit are not
+    held; returns them as [(product, available)].
+    """
+    quantities = {}
+    for product, quantity in lines:
+        quantities[product.pk] = quantities.get(product.pk, 0) + quantity
+
+    expires_at = timezone.now() + HOLD_TTL
+    short = []
+    with transaction.atomic():
+        products = list(Product.objects.select_for_update().filter(pk__in=quantities).order_by('pk'))
+        available = available_stock(products, user=user)
+
+        StockHold.objects.filter(user=user).delete()
+        holds = []
+        for product in products:
+            quantity = quantities[product.pk]
+            if quantity > available[product.pk]:
+                short.append((product, available[product.pk]))
+                continue
+            holds.append(StockHold(user=user, product=product, quantity=quantity, expires_at=expires_at))
+        StockHold.objects.bulk_create(holds)
+    return short
+
+
+def release_holds(user):
+    StockHold.objects.filter(user=user).delete()
+
+
+def expire_holds(batch_size=SWEEP_BATCH_SIZE):
+    """Deletes lapsed holds in primary-key batches so the sweep never locks the whole table."""
+    return delete_in_batches(StockHold.objects.filter(expires_at__lte=timezone.now()), batch_size)
+
+
+def decrement_stock(lines, user=None):
+    """
+    Takes stock for (product, quantity) pairs with one guarded UPDATE per
+    product: UPDATE ... SET stock = stock - q WHERE id = p AND stock - held >= q,
+    where held is other shoppers' live holds (the buyer's own holds are what
+    they are spending). The database evaluates the guard against the live row,
+    so concurrent checkouts cannot oversell. Must run inside
+    transaction.atomic(); raises InsufficientStock so the caller's transaction
+    rolls back.
+    """
+    quantities = {}
+    products = {}
+    for product, quantity in lines:
+        quantities[product.pk] = quantities.get(product.pk, 0) + quantity
+        products[product.pk] = product
+
+    held = Coalesce(
+        Subquery(
+            _live_holds(exclude_user=user).filter(product=OuterRef('pk'))
+            .order_by().values('product').annotate(held=Sum('quantity')).values('held')
+        ),
+        Value(0),
+    )
+
+    # A fixed lock order keeps two multi-item checkouts from deadlocking
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        updated = Product.objects.filter(pk=product_id, stock__gte=held + quantity).update(
+            stock=F('stock') - quantity
+        )
+        if not updated:
+            raise InsufficientStock(products[product_id])
+
+    stock_changed(quantities)
+
+
+def restore_stock(lines):
+    """
+    Puts (product_id, quantity) pairs back on the shelf. Quantities are summed
+    per product and products sharing a quantity are restored together, so a
+    bulk cancellation is a handful of UPDATE ... SET stock = stock + q
+    statements. F() keeps it safe against concurrent checkouts.
+    """
+    quantities = {}
+    for product_id, quantity in lines:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+
+    by_quantity = {}
+    for product_id, quantity in quantities.items():
+        by_quantity.setdefault(quantity, []).append(product_id)
+
+    with transaction.atomic():
+        sold_out = list(
+            Product.objects.select_for_update()
+            .filter(pk__in=sorted(quantities), stock=0).order_by('pk').values_list('pk', flat=True)
+        )
+        for quantity, product_ids in sorted(by_quantity.items()):
+            Product.objects.filter(pk__in=sorted(product_ids)).update(stock=F('stock') + quantity)
+        record_changes((pk, None, None, 0, quantities[pk]) for pk in sold_out)
+        stock_changed(quantities)
+
+
+def stock_changed(product_ids):
+    """Queryset updates skip model signals, so refresh stock-dependent caches after commit."""
+    product_ids = list(product_ids)
+    transaction.on_commit(lambda: catalog_prices_changed(product_ids))
+
+
+# --- VENDOR STOCK SYNC ---
+
+SYNC_MAX_ITEMS = 5000
+SYNC_CHUNK_SIZE = 500
+
+MAX_PRICE = Decimal('99999999.99')
+
+
+def _clean_sync_item(item):
+    """Returns (sku, stock, price, error) for one {sku, stock, price} entry; stock/price may be None."""
+    if not isinstance(item, dict):
+        return None, None, None, "Expected an object."
+    sku = item.get('sku')
+    if not isinstance(sku, str) or not sku.strip():
+        return None, None, None, "sku is required."
+    sku = sku.strip()
+
+    stock = item.get('stock')
+    if stock is not None and (isinstance(stock, bool) or not isinstance(stock, int) or stock < 0):
+        return sku, None, None, "stock must be a whole number of 0 or more."
+
+    price = item.get('price')
+    if price is not None:
+        try:
+            price = Decimal(str(price))
+        except InvalidOperation:
+            return sku, None, None, "price must be a number."
+        if not price.is_finite() or price < 0 or price > MAX_PRICE or price != round(price, 2):
+            return sku, None, None, "price must be between 0 and 99999999.99 with at most 2 decimals."
+
+    if stock is None and price is None:
+        return sku, None, None, "Send stock, price or both."
+    return sku, stock, price, None
+
+
+def sync_vendor_stock(vendor, items):
+    """
+    Applies absolute {sku, stock, price} values to the vendor's products.
+    Each chunk of SKUs is one UPDATE ... SET stock = CASE id WHEN ... END,
+    price = CASE ..., restricted to the vendor's rows. Returns
+    (updated_product_ids, errors) where errors are {index, sku, error}.
+    """
+    errors = []
+    changes = {}
+    positions = []
+    for index, item in enumerate(items):
+        sku, stock, price, error = _clean_sync_item(item)
+        if error:
+            errors.append({'index': index, 'sku': sku, 'error': error})
+            continue
+        positions.append((index, sku))
+        # Later entries for the same SKU win, like a replayed change feed
+        previous_stock, previous_price = changes.get(sku, (None, None))
+        changes[sku] = (
+            stock if stock is not None else previous_stock,
+            price if price is not None else previous_price,
+        )
+
+    updated = []
+    with transaction.atomic():
+        # Locked so the recorded price/stock transitions match what the UPDATE replaces
+        current = {
+            sku: (pk, old_stock, old_price)
+            for sku, pk, old_stock, old_price in Product.objects.select_for_update()
+            .filter(vendor=vendor, sku__in=list(changes)).order_by('pk')
+            .values_list('sku', 'id', 'stock', 'price')
+        }
+        errors.extend(
+            {'index': index, 'sku': sku, 'error': "No product with this SKU."}
+            for index, sku in positions if sku not in current
+        )
+        matched = sorted((current[sku][0], stock, price) for sku, (stock, price) in changes.items() if sku in current)
+
+        for start in range(0, len(matched), SYNC_CHUNK_SIZE):
+            chunk = matched[start:start + SYNC_CHUNK_SIZE]
+            fields = {}
+            stock_whens = [When(pk=pk, then=Value(stock)) for pk, stock, _ in chunk if stock is not None]
+            if stock_whens:
+                fields['stock'] = Case(*stock_whens, default=F('stock'), output_field=PositiveIntegerField())
+            price_whens = [When(pk=pk, then=Value(price)) for pk, _, price in chunk if price is not None]
+            if price_whens:
+                fields['price'] = Case(
+                    *price_whens, default=F('price'), output_field=DecimalField(max_digits=10, decimal_places=2)
+                )
+            Product.objects.filter(vendor=vendor, pk__in=[pk for pk, _, _ in chunk]).update(**fields)
+            updated.extend(pk for pk, _, _ in chunk)
+
+        if updated:
+            # The CASE updates skip post_save, so capture price drops and restocks here
+            record_changes(
+                (pk, old_price, changes[sku][1], old_stock, changes[sku][0])
+                for sku, (pk, old_stock, old_price) in current.items()
+            )
+            transaction.on_commit(lambda: catalog_prices_changed(updated))
+
+    errors.sort(key=lambda error: error['index'])
+    return updated, errors
+
+
+def catalog_prices_changed(product_ids):
+    """One-step invalidation after a bulk stock/price update: facets, search filters and the affected cards."""
+    bump_version(FACET_VERSION_KEY)
+    bump_card_versions(product_ids)
+    publish_change(product_ids=product_ids)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from products.recommendations import build_recommendations, TOP_K
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds the 'frequently bought together' table from order history. "
+        "Use --incremental to fold in only orders placed since the last run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help="Only process orders newer than the last build.")
+        parser.add_argument('--top-k', type=int, default=TOP_K,
+                            help="Neighbours kept per product.")
+
+    def handle(self, *args, **options):
+        orders, products = build_recommendations(
+            incremental=options['incremental'], top_k=options['top_k']
+        )
+        mode = "Incremental" if options['incremental'] else "Full"
+        self.stdout.write(self.style.SUCCESS(
+            f"{mode} build: {orders} orders processed, {products} products refreshed."
+        ))
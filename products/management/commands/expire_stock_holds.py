@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from products.inventory import SWEEP_BATCH_SIZE, expire_holds
+
+
+class Command(BaseCommand):
+    help = "Deletes lapsed checkout stock holds in batches. Run every few minutes from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SWEEP_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        removed = expire_holds(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} expired stock holds."))
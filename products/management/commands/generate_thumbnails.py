@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from products.caching import bump_card_version
+from products.models import Product
+from products.thumbnails import generate_variants
+from users.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Generates resized image variants for existing product and profile images."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        images = [
+            product.image for product in
+            Product.objects.exclude(image='').exclude(image__isnull=True).only('id', 'image').iterator()
+        ] + [
+            profile.profile_image for profile in
+            Profile.objects.exclude(profile_image='').exclude(profile_image__isnull=True).only('id', 'profile_image').iterator()
+        ]
+
+        failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(generate_variants, image.storage, image.name): image.name for image in images}
+            for future, name in futures.items():
+                try:
+                    future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f"{name}: {exc}")
+
+        # Cached product cards need to pick up the new srcset attributes
+        bump_card_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated variants for {len(images) - failed} images ({failed} failed)."
+        ))
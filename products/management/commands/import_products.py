@@ -0,0 +1,39 @@
+import csv
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from products.importing import FORMATS, guess_format, import_products
+
+
+class Command(BaseCommand):
+    help = "Creates or updates a vendor's products from a CSV or JSONL file, matched by SKU."
+
+    def add_arguments(self, parser):
+        parser.add_argument('vendor', help="Vendor username.")
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension.")
+        parser.add_argument('--workers', type=int, default=4, help="Processes used to validate rows.")
+        parser.add_argument('--report', help="Write skipped rows to this CSV file.")
+
+    def handle(self, *args, **options):
+        vendor = User.objects.filter(username=options['vendor']).first()
+        if vendor is None:
+            raise CommandError(f"No user named {options['vendor']!r}.")
+
+        fmt = options['format'] or guess_format(options['path'])
+        with open(options['path'], 'rb') as stream:
+            report = import_products(vendor, stream, fmt=fmt, workers=options['workers'])
+
+        if options['report']:
+            with open(options['report'], 'w', newline='') as handle:
+                writer = csv.writer(handle)
+                writer.writerow(['line', 'sku', 'error'])
+                writer.writerows(report.errors)
+        else:
+            for line, sku, message in report.errors:
+                self.stderr.write(f"line {line} ({sku or 'no sku'}): {message}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report.created}, updated {report.updated}, skipped {len(report.errors)} rows."
+        ))
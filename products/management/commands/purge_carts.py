@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from products.cart import purge_abandoned_carts
+
+
+class Command(BaseCommand):
+    help = "Deletes anonymous carts whose session has expired, in batches. Run daily from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        removed = purge_abandoned_carts(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} abandoned carts."))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products.models import Product
+from products.ratings import aggregate_fields, histograms, STARS
+
+FIELDS = ['avg_rating', 'review_count'] + [f'rating_{stars}_count' for stars in STARS]
+
+
+class Command(BaseCommand):
+    help = "Recomputes Product rating aggregates from the reviews table to repair drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        counts = histograms()
+        checked = repaired = 0
+        pending = []
+
+        with transaction.atomic():
+            for product in Product.objects.only('id', *FIELDS).iterator(chunk_size=batch_size):
+                checked += 1
+                expected = aggregate_fields(counts.get(product.id, {}))
+                if all(getattr(product, name) == value for name, value in expected.items()):
+                    continue
+                for name, value in expected.items():
+                    setattr(product, name, value)
+                pending.append(product)
+                if len(pending) >= batch_size:
+                    Product.objects.bulk_update(pending, FIELDS)
+                    repaired += len(pending)
+                    pending = []
+            if pending:
+                Product.objects.bulk_update(pending, FIELDS)
+                repaired += len(pending)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {checked} products, repaired rating aggregates on {repaired}."
+        ))
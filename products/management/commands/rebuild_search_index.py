@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from products.search import search_index, invalidate_all_workers
+from products.suggest import suggest_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the product search index and autocomplete tries from the "
+        "database and tells every web process (through the shared cache) to "
+        "rebuild its own copy."
+    )
+
+    def handle(self, *args, **options):
+        invalidate_all_workers()
+        search_index.build()
+        suggest_index.build()
+        self.stdout.write(self.style.SUCCESS(
+            f"Search index rebuilt: {len(search_index)} products indexed, "
+            f"{len(suggest_index.products)} products and "
+            f"{len(suggest_index.categories)} categories in autocomplete."
+        ))
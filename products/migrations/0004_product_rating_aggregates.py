@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:00
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    Review = apps.get_model("products", "Review")
+
+    histograms = {}
+    rows = Review.objects.order_by().values("product_id", "rating").annotate(total=Count("id"))
+    for row in rows:
+        histograms.setdefault(row["product_id"], {})[row["rating"]] = row["total"]
+
+    for product_id, histogram in histograms.items():
+        total = sum(histogram.values())
+        average = Decimal(sum(stars * count for stars, count in histogram.items())) / total
+        Product.objects.filter(pk=product_id).update(
+            review_count=total,
+            avg_rating=average.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP),
+            **{f"rating_{stars}_count": histogram.get(stars, 0) for stars in range(1, 6)},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0003_product_vendor_alter_category_slug_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="avg_rating",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_1_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_2_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_3_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_4_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_5_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="review_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
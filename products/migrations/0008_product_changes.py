@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:27
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0007_product_sku"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("price_drop", "Price drop"),
+                            ("back_in_stock", "Back in stock"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "old_price",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=10, null=True
+                    ),
+                ),
+                (
+                    "new_price",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=10, null=True
+                    ),
+                ),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="changes",
+                        to="products.product",
+                    ),
+                ),
+            ],
+        ),
+    ]
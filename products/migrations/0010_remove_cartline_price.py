@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:33
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0009_stored_carts"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="cartline",
+            name="price",
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0010_remove_cartline_price"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="recommendationbuild",
+            name="last_order_id",
+        ),
+        migrations.AddField(
+            model_name="recommendationbuild",
+            name="counted_through",
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name="recommendationbuild",
+            name="recent_order_ids",
+            field=models.JSONField(default=list),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def copy_created_at(apps, schema_editor):
+    StoredCart = apps.get_model("products", "StoredCart")
+    StoredCart.objects.update(updated_at=models.F("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0011_recommendation_build_created_at_watermark"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="storedcart",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, db_index=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_created_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="storedcart",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+    ]
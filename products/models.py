@@ -1,7 +1,18 @@
+import re
+
 from django.db import models
+from django.utils import timezone
 from django.utils.text import slugify
 from django.contrib.auth.models import User
 
+# Room left in the 50-character slug for a "-<n>" collision suffix
+SLUG_BASE_LENGTH = 43
+
+
+def slug_base(name):
+    return slugify(name)[:SLUG_BASE_LENGTH].strip('-')
+
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(unique=True, blank=True) 
@@ -37,6 +48,8 @@ class Product(models.Model):
 
     name = models.CharField(max_length=200)
     slug = models.SlugField(unique=True, blank=True)
+    # Vendor's own stock-keeping unit, used to match rows in bulk imports
+    sku = models.CharField(max_length=64, null=True, blank=True)
 
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -47,17 +60,54 @@ class Product(models.Model):
     image = models.ImageField(upload_to="products/", blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Denormalized review aggregates, maintained by products.ratings
+    avg_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+
     class Meta:
         ordering = ['-created_at']
+        unique_together = ('vendor', 'sku')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._track_price_and_stock()
+        return instance
 
     def save(self, *args, **kwargs):
-        # Standardized: Always re-slugify on name changes
-        self.slug = slugify(self.name)
+        # Standardized: Always re-slugify on name changes, keeping any
+        # "-<n>" suffix a bulk import added to resolve a collision
+        base = slug_base(self.name)
+        if not re.fullmatch(rf'{re.escape(base)}(-\d+)?', self.slug or ''):
+            self.slug = base
         super().save(*args, **kwargs)
+        # post_save receivers have seen the transition by now
+        self._track_price_and_stock()
+
+    def _track_price_and_stock(self):
+        # Values as last loaded/saved, so wishlist alerts can spot price drops and restocks
+        deferred = self.get_deferred_fields()
+        self._tracked_price = None if 'price' in deferred else self.price
+        self._tracked_stock = None if 'stock' in deferred else self.stock
 
     def __str__(self):
         return self.name
 
+    @property
+    def rating_histogram(self):
+        """(stars, count, percent) rows from 5 stars down, for the detail page."""
+        rows = []
+        for stars in range(5, 0, -1):
+            count = getattr(self, f'rating_{stars}_count')
+            percent = round(100 * count / self.review_count) if self.review_count else 0
+            rows.append((stars, count, percent))
+        return rows
+
 
 # Review & Rating Module (Section 7 Database Design)
 class Review(models.Model):
@@ -74,4 +124,117 @@ class Review(models.Model):
         ordering = ['-created_at']
 
     def __str__(self):
-        return f"{self.user.username}'s {self.rating}-star review for {self.product.name}"
\ No newline at end of file
+        return f"{self.user.username}'s {self.rating}-star review for {self.product.name}"
+
+# Recommendation Module ("Frequently bought together")
+class CoPurchase(models.Model):
+    """
+    Sparse item-item co-purchase matrix: how many orders contained both
+    products. Stored in both directions; the diagonal (product == other)
+    holds the number of orders containing the product.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'other')
+
+
+class ProductRecommendation(models.Model):
+    """Precomputed top-K neighbours per product, served with one indexed lookup."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['rank']
+        unique_together = ('product', 'rank')
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.recommended_id} (#{self.rank})"
+
+
+class RecommendationBuild(models.Model):
+    """
+    Watermark of the last recommendation build, for incremental runs: orders
+    are counted through counted_through, and recent_order_ids lists those
+    already counted inside the overlap that the next run rescans.
+    """
+    counted_through = models.DateTimeField(null=True)
+    recent_order_ids = models.JSONField(default=list)
+    built_at = models.DateTimeField(auto_now=True)
+
+# Inventory Module (checkout reservations)
+class StockHold(models.Model):
+    """
+    Stock reserved for a shopper between checkout and place_order. Holds lapse
+    at expires_at; `manage.py expire_stock_holds` sweeps the dead rows.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stock_holds')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='holds')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'product')
+        indexes = [
+            # Live-hold sums per product: WHERE product_id IN (...) AND expires_at > now
+            models.Index(fields=['product', 'expires_at'], name='stockhold_product_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} holds {self.quantity} x {self.product.name}"
+
+
+# Cart Module
+class StoredCart(models.Model):
+    """
+    A cart kept in the database instead of the session. Signed-in shoppers
+    have one cart per user; anonymous carts are referenced by `cart_id` in
+    the session and merged into the user's cart on login.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True, related_name='cart')
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last line change; idle anonymous carts are purged by cart.purge_abandoned_carts
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"Cart #{self.pk} ({self.user.username if self.user_id else 'anonymous'})"
+
+
+class CartLine(models.Model):
+    cart = models.ForeignKey(StoredCart, on_delete=models.CASCADE, related_name='lines')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    # Priced from the live product row when the cart is read
+    quantity = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        unique_together = ('cart', 'product')
+
+    def __str__(self):
+        return f"{self.product_id} x {self.quantity}"
+
+
+# Wishlist Alerts Module
+class ProductChange(models.Model):
+    """
+    A price drop or restock waiting to be sent to the shoppers who wishlisted
+    the product. Rows are consumed by products.alerts.send_wishlist_digests.
+    """
+    PRICE_DROP = 'price_drop'
+    BACK_IN_STOCK = 'back_in_stock'
+    KIND_CHOICES = (
+        (PRICE_DROP, 'Price drop'),
+        (BACK_IN_STOCK, 'Back in stock'),
+    )
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='changes')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    old_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    new_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.product_id}"
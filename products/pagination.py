@@ -0,0 +1,151 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+
+
+class KeysetPage:
+    """One page of results plus the opaque cursor pointing at the next one."""
+
+    def __init__(self, items, next_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+# --- CURSOR ENCODING ---
+
+def encode_cursor(values):
+    """Packs the sort-key values of the last row into a URL-safe token."""
+    raw = json.dumps([str(v) for v in values], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Reverses encode_cursor. Any malformed token simply means 'first page'."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+        return None
+    return values
+
+
+# --- PAGINATORS ---
+
+def _after(ordering, values):
+    """
+    Builds the 'strictly after this row' filter for a multi-column ordering, e.g.
+    for ('-created_at', '-id'): created_at < c OR (created_at = c AND id < i).
+    """
+    condition = Q()
+    equal = {}
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+    return condition
+
+
+def _cursor_values(model, ordering, values):
+    """
+    Converts decoded cursor strings with each ordering field's to_python().
+    A cursor that does not fit the ordering (tampered or stale) returns None,
+    which means 'first page'.
+    """
+    if not values or len(values) != len(ordering):
+        return None
+    try:
+        return [
+            model._meta.get_field(field.lstrip('-')).to_python(value)
+            for field, value in zip(ordering, values)
+        ]
+    except (ValidationError, ValueError, TypeError):
+        return None
+
+
+def keyset_paginate(queryset, cursor, per_page, ordering=('-created_at', '-id')):
+    """
+    Seeks straight to the rows after the cursor instead of counting past an
+    OFFSET, so every page costs the same no matter how deep it is. The
+    ordering must end in a unique column to keep the sequence stable.
+    """
+    queryset = queryset.order_by(*ordering)
+    values = _cursor_values(queryset.model, ordering, decode_cursor(cursor))
+    if values is not None:
+        queryset = queryset.filter(_after(ordering, values))
+
+    # Fetch one extra row to learn whether another page exists
+    rows = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            [getattr(last, field.lstrip('-')) for field in ordering]
+        )
+    return KeysetPage(rows, next_cursor)
+
+
+def ranked_paginate(queryset, ranked_ids, cursor, per_page):
+    """
+    Pages through an externally ranked list of IDs (e.g. search hits). The
+    cursor is a position in that list; rows that the queryset filters out
+    are skipped until the page is full.
+    """
+    values = decode_cursor(cursor)
+    try:
+        position = max(int(values[0]), 0) if values else 0
+    except ValueError:
+        position = 0
+
+    items = []
+    while len(items) < per_page and position < len(ranked_ids):
+        window = ranked_ids[position:position + per_page]
+        found = queryset.in_bulk(window)
+        for pk in window:
+            position += 1
+            if pk in found:
+                items.append(found[pk])
+                if len(items) == per_page:
+                    break
+
+    next_cursor = encode_cursor([position]) if position < len(ranked_ids) else None
+    return KeysetPage(items, next_cursor)
+
+
+def next_page_url(request, page):
+    """Current URL with the cursor swapped for the next page's cursor."""
+    if not page.has_next:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = page.next_cursor
+    return f"{request.path}?{params.urlencode()}"
+
+
+def load_more_response(request, page, template_name, context):
+    """JSON payload for the AJAX 'Load More' button: rendered rows + next URL."""
+    return JsonResponse({
+        'html': render_to_string(template_name, context, request=request),
+        'next_url': next_page_url(request, page),
+    })
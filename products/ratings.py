@@ -0,0 +1,63 @@
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Value, When
+from django.db.models.functions import Cast
+
+from .models import Product, Review
+
+STARS = range(1, 6)
+
+
+def _average_expression():
+    """SQL expression deriving avg_rating from the stored histogram columns."""
+    weighted = sum(F(f'rating_{stars}_count') * stars for stars in STARS)
+    return Case(
+        When(review_count=0, then=Value(0.0)),
+        default=Cast(weighted, FloatField()) / F('review_count'),
+        output_field=FloatField(),
+    )
+
+
+def apply_review_delta(product_id, rating, delta):
+    """
+    Adds (delta=1) or removes (delta=-1) one review from a product's aggregates.
+    Both UPDATEs are relative to the stored values, so concurrent reviews
+    never overwrite each other.
+    """
+    column = f'rating_{rating}_count'
+    with transaction.atomic():
+        Product.objects.filter(pk=product_id).update(**{
+            'review_count': F('review_count') + delta,
+            column: F(column) + delta,
+        })
+        Product.objects.filter(pk=product_id).update(avg_rating=_average_expression())
+
+
+def aggregate_fields(histogram):
+    """Field values for a {stars: count} histogram."""
+    total = sum(histogram.values())
+    fields = {f'rating_{stars}_count': histogram.get(stars, 0) for stars in STARS}
+    fields['review_count'] = total
+    average = Decimal(sum(stars * count for stars, count in histogram.items())) / total if total else Decimal(0)
+    fields['avg_rating'] = average.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    return fields
+
+
+def histograms(product_ids=None):
+    """{product_id: {stars: count}} from the reviews table in one grouped query."""
+    reviews = Review.objects.all()
+    if product_ids is not None:
+        reviews = reviews.filter(product_id__in=product_ids)
+    result = defaultdict(dict)
+    rows = reviews.order_by().values('product_id', 'rating').annotate(total=Count('id'))
+    for row in rows:
+        result[row['product_id']][row['rating']] = row['total']
+    return result
+
+
+def recompute_ratings(product_id):
+    """Recounts one product's aggregates from its reviews."""
+    histogram = histograms([product_id]).get(product_id, {})
+    Product.objects.filter(pk=product_id).update(**aggregate_fields(histogram))
@@ -0,0 +1,204 @@
+import math
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import combinations
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from orders.models import OrderItem
+from .models import CoPurchase, ProductRecommendation, RecommendationBuild
+
+TOP_K = 8
+
+# Very large baskets (bulk/B2B orders) say little about affinity and cost O(n^2)
+MAX_BASKET_SIZE = 50
+
+BATCH_SIZE = 1000
+
+# An order can commit a while after its created_at is stamped (and after
+# orders with higher ids), so every incremental run rescans this far back
+# and skips the orders it already counted there
+COMMIT_LAG = timedelta(minutes=10)
+
+
+def _baskets(since=None, until=None):
+    """
+    Yields (order_id, created_at, distinct product IDs) for each non-cancelled
+    order created in (since, until], streamed in order_id order.
+    """
+    items = OrderItem.objects.exclude(order__status='Cancelled')
+    if since is not None:
+        items = items.filter(order__created_at__gt=since)
+    if until is not None:
+        items = items.filter(order__created_at__lte=until)
+    rows = (
+        items.order_by('order_id')
+        .values_list('order_id', 'order__created_at', 'product_id')
+        .iterator(chunk_size=5000)
+    )
+
+    current, basket = None, set()
+    for order_id, created_at, product_id in rows:
+        if order_id != current:
+            if basket:
+                yield current, placed, basket
+            current, placed, basket = order_id, created_at, set()
+        basket.add(product_id)
+    if basket:
+        yield current, placed, basket
+
+
+def count_pairs(baskets):
+    """
+    Accumulates the sparse co-occurrence matrix as {(a, b): count}, in both
+    directions, with per-product order counts on the diagonal. Returns the
+    matrix and the number of baskets read.
+    """
+    counts = Counter()
+    seen = 0
+    for basket in baskets:
+        seen += 1
+        if len(basket) > MAX_BASKET_SIZE:
+            basket = sorted(basket)[:MAX_BASKET_SIZE]
+        for product_id in basket:
+            counts[(product_id, product_id)] += 1
+        for a, b in combinations(basket, 2):
+            counts[(a, b)] += 1
+            counts[(b, a)] += 1
+    return counts, seen
+
+
+def _merge_counts(deltas):
+    """Adds pair deltas into CoPurchase: bulk_update existing rows, bulk_create new ones."""
+    by_product = defaultdict(dict)
+    for (a, b), count in deltas.items():
+        by_product[a][b] = count
+
+    product_ids = list(by_product)
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        chunk = product_ids[start:start + BATCH_SIZE]
+        existing = {
+            (row.product_id, row.other_id): row
+            for row in CoPurchase.objects.filter(product_id__in=chunk)
+        }
+        changed, created = [], []
+        for a in chunk:
+            for b, count in by_product[a].items():
+                row = existing.get((a, b))
+                if row is None:
+                    created.append(CoPurchase(product_id=a, other_id=b, count=count))
+                else:
+                    row.count += count
+                    changed.append(row)
+        CoPurchase.objects.bulk_update(changed, ['count'], batch_size=BATCH_SIZE)
+        CoPurchase.objects.bulk_create(created, batch_size=BATCH_SIZE)
+
+
+def _with_neighbours(product_ids):
+    """
+    The given products plus every product co-purchased with them: a changed
+    order count moves the cosine score of each pair the product is part of,
+    so their neighbours' lists have to be rescored too.
+    """
+    affected = set(product_ids)
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        affected.update(
+            CoPurchase.objects.filter(product_id__in=product_ids[start:start + BATCH_SIZE])
+            .values_list('other_id', flat=True)
+        )
+    return affected
+
+
+def _rebuild_neighbours(product_ids, top_k):
+    """
+    Recomputes the top-K table for the given products from CoPurchase. Scores
+    are cosine-normalized so best sellers do not dominate every list.
+    """
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        chunk = product_ids[start:start + BATCH_SIZE]
+        rows = list(CoPurchase.objects.filter(product_id__in=chunk).values_list('product_id', 'other_id', 'count'))
+
+        neighbours = defaultdict(list)
+        others = set()
+        for a, b, count in rows:
+            if a != b:
+                neighbours[a].append((b, count))
+                others.add(b)
+        # Diagonal rows hold how many orders contained each product
+        frequency = dict(
+            CoPurchase.objects.filter(product_id__in=others | set(chunk), other_id=F('product_id'))
+            .values_list('product_id', 'count')
+        )
+
+        recommendations = []
+        for a in chunk:
+            scored = [
+                (count / math.sqrt(frequency.get(a, 1) * frequency.get(b, 1)), b)
+                for b, count in neighbours.get(a, ())
+            ]
+            scored.sort(key=lambda pair: (-pair[0], pair[1]))
+            recommendations.extend(
+                ProductRecommendation(product_id=a, recommended_id=b, score=score, rank=rank)
+                for rank, (score, b) in enumerate(scored[:top_k], start=1)
+            )
+
+        ProductRecommendation.objects.filter(product_id__in=chunk).delete()
+        ProductRecommendation.objects.bulk_create(recommendations, batch_size=BATCH_SIZE)
+
+
+def build_recommendations(incremental=False, top_k=TOP_K):
+    """
+    Full mode recounts every order. Incremental mode folds in only orders the
+    stored watermark has not counted yet and refreshes the products they touch
+    along with those products' neighbours. Returns (orders_seen, products_refreshed).
+    """
+    build = RecommendationBuild.objects.first() or RecommendationBuild()
+    # Without a watermark there is nothing to add to
+    incremental = incremental and build.counted_through is not None
+    until = timezone.now()
+    since = build.counted_through - COMMIT_LAG if incremental else None
+    counted = set(build.recent_order_ids) if incremental else set()
+
+    recent = []
+    def baskets():
+        for order_id, created_at, basket in _baskets(since, until):
+            if created_at > until - COMMIT_LAG:
+                recent.append(order_id)
+            if order_id not in counted:
+                yield basket
+
+    deltas, orders = count_pairs(baskets())
+
+    with transaction.atomic():
+        if incremental:
+            _merge_counts(deltas)
+            refreshed = _with_neighbours({a for a, _ in deltas})
+        else:
+            CoPurchase.objects.all().delete()
+            CoPurchase.objects.bulk_create(
+                (CoPurchase(product_id=a, other_id=b, count=count) for (a, b), count in deltas.items()),
+                batch_size=BATCH_SIZE,
+            )
+            ProductRecommendation.objects.all().delete()
+            refreshed = {a for a, _ in deltas}
+
+        _rebuild_neighbours(refreshed, top_k)
+        build.counted_through = until
+        build.recent_order_ids = recent
+        build.save()
+
+    return orders, len(refreshed)
+
+
+def recommendations_for(product, limit=4):
+    """Frequently-bought-together products for the detail page (one indexed query)."""
+    rows = (
+        ProductRecommendation.objects.filter(product=product, recommended__available=True)
+        .select_related('recommended')
+        .order_by('rank')[:limit]
+    )
+    return [row.recommended for row in rows]
@@ -0,0 +1,330 @@
+import heapq
+import math
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Product
+
+# Cache key used to tell every worker process that the index must be rebuilt
+GENERATION_KEY = 'products:search_generation'
+
+# Shared change log: a sequence number plus one entry per committed change,
+# replayed by every process on its next lookup
+CHANGE_SEQ_KEY = 'products:search_changes'
+CHANGE_LOG_TTL = 24 * 60 * 60
+# A process further behind than this rebuilds instead of replaying
+CHANGE_LOG_MAX_REPLAY = 500
+
+# Field weights used when scoring a match (name hits matter most)
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'category': 2.0,
+    'description': 1.0,
+}
+
+# Prefix matches ("head" -> "headphones") score lower than exact tokens
+PREFIX_WEIGHT = 0.5
+MIN_PREFIX_LENGTH = 2
+
+STOP_WORDS = frozenset({
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'is', 'it', 'of', 'on', 'or', 'the', 'to', 'with',
+})
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Columns loaded for indexing: the searchable text plus the listing's filter values
+INDEXED_FIELDS = (
+    'id', 'name', 'description', 'available', 'price', 'stock', 'category__name', 'category__slug',
+)
+
+# What the product listing filters on, kept per document so a search can be
+# filtered and paged without a database round trip
+ProductFacts = namedtuple('ProductFacts', 'available category_id category_slug price stock')
+
+
+def tokenize(text):
+    """Lowercases text and splits it into searchable tokens."""
+    if not text:
+        return []
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOP_WORDS]
+
+
+def _change_key(seq):
+    return f'{CHANGE_SEQ_KEY}:{seq}'
+
+
+def shared_state():
+    """(generation, change sequence) as published through the cache."""
+    state = cache.get_many([GENERATION_KEY, CHANGE_SEQ_KEY])
+    return state.get(GENERATION_KEY), state.get(CHANGE_SEQ_KEY, 0)
+
+
+def publish_change(product_ids=(), category_ids=()):
+    """
+    Appends one entry to the shared change log once the current transaction
+    commits, so every process (this one included) picks it up on its next
+    lookup and nothing rolled back is ever indexed.
+    """
+    entry = (frozenset(product_ids), frozenset(category_ids))
+
+    def publish():
+        try:
+            seq = cache.incr(CHANGE_SEQ_KEY)
+        except ValueError:
+            # The log was evicted, so earlier entries are gone: restart it and rebuild everywhere
+            cache.set(CHANGE_SEQ_KEY, 0, None)
+            invalidate_all_workers()
+            return
+        cache.set(_change_key(seq), entry, CHANGE_LOG_TTL)
+
+    transaction.on_commit(publish)
+
+
+def read_changes(since, until):
+    """
+    Product and category IDs changed by log entries since+1..until, or None
+    when they cannot all be replayed (too many, expired, or not written yet)
+    and the caller has to rebuild instead.
+    """
+    if until < since or until - since > CHANGE_LOG_MAX_REPLAY:
+        return None
+    keys = [_change_key(seq) for seq in range(since + 1, until + 1)]
+    entries = cache.get_many(keys)
+    if len(entries) < len(keys):
+        return None
+    product_ids, category_ids = set(), set()
+    for products, categories in entries.values():
+        product_ids |= products
+        category_ids |= categories
+    return product_ids, category_ids
+
+
+class SearchIndex:
+    """
+    Tokenized inverted index over Product name, description and category name.
+    Lives in process memory: built lazily on the first search, kept current by
+    replaying the shared change log and rebuilt when the shared generation changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = defaultdict(dict)  # token -> {product_id: weight}
+        self._documents = {}                # product_id -> set of tokens
+        self._facts = {}                    # product_id -> ProductFacts
+        self._vocabulary = []               # sorted tokens for prefix lookups
+        self._generation = None
+        self._seq = 0
+        self._built = False
+
+    @property
+    def is_built(self):
+        return self._built
+
+    def __len__(self):
+        return len(self._documents)
+
+    # --- BUILDING ---
+
+    def build(self):
+        """Full rebuild from the database, streamed in chunks."""
+        # Read the shared state first: changes committed while streaming get replayed again
+        generation, seq = shared_state()
+        products = (
+            Product.objects.select_related('category')
+            .only(*INDEXED_FIELDS)
+            .iterator(chunk_size=2000)
+        )
+        postings = defaultdict(dict)
+        documents = {}
+        facts = {}
+        for product in products:
+            weights = self._weigh(product)
+            documents[product.id] = set(weights)
+            facts[product.id] = self._facts_for(product)
+            for token, weight in weights.items():
+                postings[token][product.id] = weight
+
+        with self._lock:
+            self._postings = postings
+            self._documents = documents
+            self._facts = facts
+            self._vocabulary = sorted(postings)
+            self._generation, self._seq = generation, seq
+            self._built = True
+
+    def ensure_current(self):
+        """
+        Builds the index on first use or after a shared rebuild, and otherwise
+        replays the changes published since this process last looked.
+        """
+        generation, seq = shared_state()
+        if not self._built or generation != self._generation:
+            self.build()
+            return
+        if seq == self._seq:
+            return
+        changes = read_changes(self._seq, seq)
+        if changes is None:
+            self.build()
+            return
+        self._replay(*changes)
+        self._seq = seq
+
+    def _replay(self, product_ids, category_ids):
+        # Category names are indexed on every product, so a rename touches them all
+        products = (
+            Product.objects.select_related('category')
+            .only(*INDEXED_FIELDS)
+            .filter(Q(pk__in=product_ids) | Q(category_id__in=category_ids))
+        )
+        found = set()
+        for product in products.iterator(chunk_size=2000):
+            self.add(product)
+            found.add(product.id)
+        for product_id in product_ids - found:
+            self.remove(product_id)
+
+    def add(self, product):
+        """Indexes (or re-indexes) a single product."""
+        weights = self._weigh(product)
+        with self._lock:
+            self._discard(product.id)
+            self._documents[product.id] = set(weights)
+            self._facts[product.id] = self._facts_for(product)
+            for token, weight in weights.items():
+                if token not in self._postings:
+                    self._vocabulary.insert(bisect_left(self._vocabulary, token), token)
+                self._postings[token][product.id] = weight
+
+    def remove(self, product_id):
+        with self._lock:
+            self._discard(product_id)
+
+    def _discard(self, product_id):
+        self._facts.pop(product_id, None)
+        for token in self._documents.pop(product_id, ()):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[token]
+                index = bisect_left(self._vocabulary, token)
+                if index < len(self._vocabulary) and self._vocabulary[index] == token:
+                    del self._vocabulary[index]
+
+    @staticmethod
+    def _facts_for(product):
+        return ProductFacts(
+            product.available, product.category_id,
+            product.category.slug if product.category_id else '', product.price, product.stock,
+        )
+
+    @staticmethod
+    def _weigh(product):
+        weights = defaultdict(float)
+        fields = {
+            'name': product.name,
+            'description': product.description,
+            'category': product.category.name if product.category_id else '',
+        }
+        for field, text in fields.items():
+            for token in tokenize(text):
+                weights[token] += FIELD_WEIGHTS[field]
+        return weights
+
+    # --- QUERYING ---
+
+    def _expand(self, token):
+        """Returns (token, weight) pairs for the exact token and its prefix matches."""
+        matches = []
+        if token in self._postings:
+            matches.append((token, 1.0))
+        if len(token) >= MIN_PREFIX_LENGTH:
+            index = bisect_left(self._vocabulary, token)
+            while index < len(self._vocabulary) and self._vocabulary[index].startswith(token):
+                candidate = self._vocabulary[index]
+                if candidate != token:
+                    matches.append((candidate, PREFIX_WEIGHT))
+                index += 1
+        return matches
+
+    def _score(self, terms):
+        """{product_id: score} for documents matching every term; caller holds the lock."""
+        total = len(self._documents) or 1
+        scores = {}
+        for position, term in enumerate(terms):
+            term_scores = defaultdict(float)
+            for token, match_weight in self._expand(term):
+                postings = self._postings[token]
+                idf = math.log(1 + total / len(postings))
+                for product_id, weight in postings.items():
+                    term_scores[product_id] += weight * idf * match_weight
+
+            if not position:
+                scores = term_scores
+            else:
+                # Every term has to match somewhere in the document
+                scores = {
+                    pid: score + term_scores[pid]
+                    for pid, score in scores.items() if pid in term_scores
+                }
+            if not scores:
+                break
+        return scores
+
+    def search(self, query, limit=None, where=None):
+        """
+        Returns product IDs matching every query term, best match first.
+        Scoring is field-weighted term frequency times inverse document frequency.
+        `where` is a predicate on ProductFacts applied before the limit, so
+        listing filters never lose hits to the cap.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        self.ensure_current()
+
+        with self._lock:
+            scores = self._score(terms)
+            if where is not None:
+                scores = {pid: score for pid, score in scores.items() if where(self._facts[pid])}
+
+        def rank(pid):
+            return -scores[pid], -pid
+
+        if limit:
+            return heapq.nsmallest(limit, scores, key=rank)
+        return sorted(scores, key=rank)
+
+    def hit_facts(self, query, where=None):
+        """ProductFacts of every hit for the query, unranked (for counting facets)."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        self.ensure_current()
+
+        with self._lock:
+            facts = [self._facts[pid] for pid in self._score(terms)]
+        return [f for f in facts if where(f)] if where is not None else facts
+
+
+def invalidate_all_workers():
+    """Forces every process to rebuild its index on its next search."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+
+
+# Process-wide index shared by the views and signal handlers
+search_index = SearchIndex()
@@ -0,0 +1,135 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import m2m_changed, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from users.models import Profile
+
+from .alerts import record_changes
+from .cart import merge_anonymous_cart
+from .caching import FACET_VERSION_KEY, bump_version, bump_card_version
+from .models import Category, Product, Review
+from .ratings import apply_review_delta, recompute_ratings
+from .search import publish_change
+from .thumbnails import schedule_variants
+from .wishlist import Wishlist, invalidate as invalidate_wishlists
+
+
+# --- SEARCH AND AUTOCOMPLETE SYNC ---
+
+@receiver(post_save, sender=Product, dispatch_uid='index_product_on_save')
+@receiver(post_delete, sender=Product, dispatch_uid='unindex_product_on_delete')
+def index_product(sender, instance, **kwargs):
+    # Published through the shared change log so every worker's index follows
+    publish_change(product_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Category, dispatch_uid='index_category_on_save')
+@receiver(post_delete, sender=Category, dispatch_uid='index_category_on_delete')
+def reindex_category(sender, instance, **kwargs):
+    # Category names are indexed on every product and have their own completions
+    publish_change(category_ids=[instance.pk])
+
+
+# --- RATING AGGREGATES ---
+
+@receiver(post_save, sender=Review, dispatch_uid='count_review_on_save')
+def count_review(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        apply_review_delta(instance.product_id, instance.rating, 1)
+    else:
+        # Edited reviews (admin only) may have changed their rating
+        recompute_ratings(instance.product_id)
+
+
+@receiver(post_delete, sender=Review, dispatch_uid='uncount_review_on_delete')
+def uncount_review(sender, instance, **kwargs):
+    apply_review_delta(instance.product_id, instance.rating, -1)
+
+
+# --- CATALOG CACHE INVALIDATION ---
+
+@receiver(post_save, sender=Product, dispatch_uid='invalidate_facets_on_product_save')
+@receiver(post_delete, sender=Product, dispatch_uid='invalidate_facets_on_product_delete')
+@receiver(post_save, sender=Category, dispatch_uid='invalidate_facets_on_category_save')
+@receiver(post_delete, sender=Category, dispatch_uid='invalidate_facets_on_category_delete')
+def invalidate_facets(sender, **kwargs):
+    bump_version(FACET_VERSION_KEY)
+
+
+@receiver(post_save, sender=Product, dispatch_uid='invalidate_card_on_product_save')
+@receiver(post_delete, sender=Product, dispatch_uid='invalidate_card_on_product_delete')
+def invalidate_product_card(sender, instance, **kwargs):
+    bump_card_version(instance.pk)
+
+
+@receiver(post_save, sender=Review, dispatch_uid='invalidate_card_on_review_save')
+@receiver(post_delete, sender=Review, dispatch_uid='invalidate_card_on_review_delete')
+def invalidate_reviewed_product_card(sender, instance, **kwargs):
+    bump_card_version(instance.product_id)
+
+
+@receiver(post_save, sender=Category, dispatch_uid='invalidate_cards_on_category_save')
+@receiver(post_delete, sender=Category, dispatch_uid='invalidate_cards_on_category_delete')
+def invalidate_all_cards(sender, **kwargs):
+    # Category names are baked into every card
+    bump_card_version()
+
+
+# --- IMAGE VARIANTS ---
+
+@receiver(pre_save, sender=Product, dispatch_uid='detect_product_image_upload')
+def detect_image_upload(sender, instance, **kwargs):
+    # A FieldFile is uncommitted only between upload and the model save
+    instance._image_uploaded = bool(instance.image) and not instance.image._committed
+
+
+@receiver(post_save, sender=Product, dispatch_uid='resize_product_image')
+def resize_product_image(sender, instance, **kwargs):
+    if getattr(instance, '_image_uploaded', False):
+        product_id = instance.pk
+        schedule_variants(instance.image, on_done=lambda: bump_card_version(product_id))
+
+
+# --- WISHLIST CACHE ---
+
+@receiver(m2m_changed, sender=Wishlist, dispatch_uid='invalidate_wishlist_cache')
+def invalidate_wishlist_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # profile.wishlist.add/remove/clear
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_wishlists([instance.user_id])
+        return
+
+    # product.wishlisted_by.add/remove/clear: pk_set holds profile IDs
+    if action == 'pre_clear':
+        instance._wishlist_profile_ids = list(instance.wishlisted_by.values_list('pk', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_wishlist_profile_ids', [])
+    elif action not in ('post_add', 'post_remove'):
+        return
+    invalidate_wishlists(Profile.objects.filter(pk__in=pk_set).values_list('user_id', flat=True))
+
+
+# --- WISHLIST ALERTS ---
+
+@receiver(post_save, sender=Product, dispatch_uid='record_wishlist_alerts')
+def record_price_and_stock_change(sender, instance, created, raw=False, **kwargs):
+    # Product.save refreshes the tracked values only after post_save, so they are still the old ones
+    if created or raw:
+        return
+    record_changes([(
+        instance.pk,
+        getattr(instance, '_tracked_price', None), instance.price,
+        getattr(instance, '_tracked_stock', None), instance.stock,
+    )])
+
+
+# --- CART ---
+
+@receiver(user_logged_in, dispatch_uid='merge_cart_on_login')
+def merge_cart_on_login(sender, request, user, **kwargs):
+    if request is not None and hasattr(request, 'session'):
+        merge_anonymous_cart(request.session, user)
@@ -0,0 +1,311 @@
+import heapq
+import re
+import threading
+import time
+
+from django.db.models import Sum
+from django.urls import reverse
+
+from orders.models import OrderItem
+from .models import Category, Product
+from .search import read_changes, shared_state
+
+# Completions kept per trie node; the endpoint never returns more than this
+TOP_K = 8
+
+# Only the first few words of a name start completion terms ("sony wh-1000" is
+# reachable from "sony", "wh" and "1000")
+MAX_WORD_STARTS = 4
+
+# Terms are cut at this length to bound trie size; longer prefixes are walked to
+# this depth and then filtered against the full label
+MAX_TERM_LENGTH = 20
+
+# Orders publish no index changes, so between rebuilds units sold are reloaded
+# this often (seconds); rankings lag new orders by at most that much
+SALES_REFRESH_INTERVAL = 10 * 60
+
+WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize(text):
+    return ' '.join(WORD_RE.findall((text or '').lower()))
+
+
+class _Node:
+    __slots__ = ('children', 'entries', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.entries = None  # {entry_id: score} for terms ending exactly here
+        self.top = ()        # best (score, label, entry_id) in this subtree
+
+
+def _rank(score, label, entry_id):
+    # Highest score first, then alphabetical
+    return (-score, label, entry_id)
+
+
+class SuggestionTrie:
+    """
+    Prefix trie where every node caches the top-K entries of its subtree, so a
+    lookup is a walk down the prefix plus a slice of a precomputed list.
+    """
+
+    def __init__(self, top_k=TOP_K):
+        self.top_k = top_k
+        self.root = _Node()
+        self.labels = {}  # entry_id -> (name, url, score, terms)
+
+    def __len__(self):
+        return len(self.labels)
+
+    @staticmethod
+    def terms_for(label):
+        words = label.split(' ')
+        return {
+            ' '.join(words[i:])[:MAX_TERM_LENGTH]
+            for i in range(min(len(words), MAX_WORD_STARTS))
+        }
+
+    # --- BULK LOADING ---
+
+    def load(self, rows):
+        """Builds the whole trie from (entry_id, name, url, score) rows at once."""
+        for entry_id, name, url, score in rows:
+            for term in self._register(entry_id, name, url, score):
+                self._walk(term, create=True)[-1].entries[entry_id] = score
+        self._refresh_subtree(self.root)
+
+    def _refresh_subtree(self, node):
+        for child in node.children.values():
+            self._refresh_subtree(child)
+        self._refresh_node(node)
+
+    # --- INCREMENTAL UPDATES ---
+
+    def insert(self, entry_id, name, url, score):
+        self.remove(entry_id)
+        for term in self._register(entry_id, name, url, score):
+            path = self._walk(term, create=True)
+            path[-1].entries[entry_id] = score
+            self._refresh_path(path)
+
+    def remove(self, entry_id):
+        existing = self.labels.pop(entry_id, None)
+        if existing is None:
+            return
+        for term in existing[3]:
+            path = self._walk(term)
+            if path is None:
+                continue
+            if path[-1].entries:
+                path[-1].entries.pop(entry_id, None)
+            self._refresh_path(self._prune(term, path))
+
+    @staticmethod
+    def _prune(term, path):
+        """Detaches the nodes a removal left without entries or children; returns what remains of the path."""
+        depth = len(term)
+        while depth and not path[depth].entries and not path[depth].children:
+            del path[depth - 1].children[term[depth - 1]]
+            depth -= 1
+        return path[:depth + 1]
+
+    def _register(self, entry_id, name, url, score):
+        label = normalize(name)
+        terms = self.terms_for(label) if label else set()
+        if terms:
+            self.labels[entry_id] = (name, url, score, terms)
+        return terms
+
+    def _walk(self, term, create=False):
+        node = self.root
+        path = [node]
+        for char in term:
+            child = node.children.get(char)
+            if child is None:
+                if not create:
+                    return None
+                child = node.children[char] = _Node()
+            node = child
+            path.append(node)
+        if create and node.entries is None:
+            node.entries = {}
+        return path
+
+    def _refresh_path(self, path):
+        """Recomputes the cached top-K bottom-up along one root-to-leaf path."""
+        for node in reversed(path):
+            self._refresh_node(node)
+
+    def _refresh_node(self, node):
+        if not node.entries and len(node.children) == 1:
+            # Chains of single-child nodes share their child's list
+            node.top = next(iter(node.children.values())).top
+            return
+        best = {}
+        if node.entries:
+            for entry_id, score in node.entries.items():
+                best[entry_id] = _rank(score, self.labels[entry_id][0].lower(), entry_id)
+        for child in node.children.values():
+            for ranked in child.top:
+                best.setdefault(ranked[2], ranked)
+        node.top = tuple(heapq.nsmallest(self.top_k, best.values()))
+
+    # --- LOOKUP ---
+
+    def complete(self, prefix, limit=TOP_K):
+        prefix = normalize(prefix)
+        path = self._walk(prefix[:MAX_TERM_LENGTH])
+        if path is None:
+            return []
+        results = []
+        for ranked in path[-1].top:
+            name, url, _, _ = self.labels[ranked[2]]
+            if len(prefix) > MAX_TERM_LENGTH and prefix not in normalize(name):
+                continue
+            results.append({'name': name, 'url': url})
+            if len(results) == limit:
+                break
+        return results
+
+
+class SuggestIndex:
+    """Product and category completion tries, ranked by units sold."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.products = SuggestionTrie()
+        self.categories = SuggestionTrie()
+        self.sales = {}
+        self._sales_at = 0
+        self._generation = None
+        self._seq = 0
+        self._built = False
+
+    @property
+    def is_built(self):
+        return self._built
+
+    @staticmethod
+    def _load_sales():
+        """Units sold per product, and per category over its available products."""
+        items = OrderItem.objects.exclude(order__status='Cancelled').order_by()
+        sales = dict(items.values('product_id').annotate(units=Sum('quantity')).values_list('product_id', 'units'))
+        category_sales = dict(
+            items.filter(product__available=True)
+            .values('product__category_id').annotate(units=Sum('quantity'))
+            .values_list('product__category_id', 'units')
+        )
+        return sales, category_sales
+
+    def build(self):
+        generation, seq = shared_state()
+        sales, category_sales = self._load_sales()
+        product_rows = []
+        rows = Product.objects.filter(available=True).only('id', 'name', 'slug')
+        for product in rows.iterator(chunk_size=2000):
+            product_rows.append(
+                (product.id, product.name, reverse('product_detail', args=[product.slug]), sales.get(product.id, 0))
+            )
+
+        products = SuggestionTrie()
+        products.load(product_rows)
+        categories = SuggestionTrie()
+        categories.load(
+            (category.id, category.name,
+             f"{reverse('product_list')}?category={category.slug}",
+             category_sales.get(category.id, 0))
+            for category in Category.objects.all()
+        )
+
+        with self._lock:
+            self.products, self.categories, self.sales = products, categories, sales
+            self._generation, self._seq = generation, seq
+            self._sales_at = time.monotonic()
+            self._built = True
+
+    def refresh_sales(self):
+        """Re-scores only the entries whose units sold changed since the last load."""
+        sales, category_sales = self._load_sales()
+        with self._lock:
+            for trie, scores in ((self.products, sales), (self.categories, category_sales)):
+                for entry_id, (name, url, score, _) in list(trie.labels.items()):
+                    if scores.get(entry_id, 0) != score:
+                        trie.insert(entry_id, name, url, scores.get(entry_id, 0))
+            self.sales = sales
+            self._sales_at = time.monotonic()
+
+    def ensure_current(self):
+        """Same protocol as the search index: rebuild on a new generation, else replay the change log."""
+        generation, seq = shared_state()
+        if not self._built or generation != self._generation:
+            self.build()
+            return
+        if seq != self._seq:
+            changes = read_changes(self._seq, seq)
+            if changes is None:
+                self.build()
+                return
+            self._replay(*changes)
+            self._seq = seq
+        if time.monotonic() - self._sales_at >= SALES_REFRESH_INTERVAL:
+            self.refresh_sales()
+
+    def _replay(self, product_ids, category_ids):
+        products = {
+            product.id: product
+            for product in Product.objects.filter(pk__in=product_ids).only('id', 'name', 'slug', 'available')
+        }
+        categories = {category.id: category for category in Category.objects.filter(pk__in=category_ids)}
+        for product_id in product_ids:
+            if product_id in products:
+                self.add_product(products[product_id])
+            else:
+                self.remove_product(product_id)
+        for category_id in category_ids:
+            if category_id in categories:
+                self.add_category(categories[category_id])
+            else:
+                self.remove_category(category_id)
+
+    def add_product(self, product):
+        with self._lock:
+            if not product.available:
+                self.products.remove(product.id)
+                return
+            self.products.insert(
+                product.id, product.name,
+                reverse('product_detail', args=[product.slug]),
+                self.sales.get(product.id, 0),
+            )
+
+    def remove_product(self, product_id):
+        with self._lock:
+            self.products.remove(product_id)
+
+    def add_category(self, category):
+        with self._lock:
+            score = self.categories.labels.get(category.id, (None, None, 0))[2]
+            self.categories.insert(
+                category.id, category.name,
+                f"{reverse('product_list')}?category={category.slug}",
+                score,
+            )
+
+    def remove_category(self, category_id):
+        with self._lock:
+            self.categories.remove(category_id)
+
+    def suggest(self, prefix, limit=TOP_K):
+        self.ensure_current()
+        with self._lock:
+            return {
+                'products': self.products.complete(prefix, limit),
+                'categories': self.categories.complete(prefix, limit),
+            }
+
+
+# Process-wide index shared by the suggest endpoint and signal handlers
+suggest_index = SuggestIndex()
@@ -0,0 +1,15 @@
+from jobs.queue import task
+from .alerts import send_wishlist_digests
+from .recommendations import build_recommendations
+
+
+@task('products.refresh_recommendations')
+def refresh_recommendations():
+    # Watermarked, so a repeated run only folds in orders it has not seen
+    build_recommendations(incremental=True)
+
+
+@task('products.wishlist_digest')
+def wishlist_digest():
+    # Consumes the recorded changes, so a repeated run finds nothing left to send
+    send_wishlist_digests()
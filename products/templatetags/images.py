@@ -0,0 +1,34 @@
+from django import template
+
+from products.thumbnails import variant_info, variant_name
+
+register = template.Library()
+
+
+@register.filter
+def srcset(image):
+    """
+    srcset value listing the resized variants of an ImageField file, e.g.
+    <img src="{{ product.image.url }}" srcset="{{ product.image|srcset }}" sizes="...">
+    """
+    if not image:
+        return ''
+    widths, original_width = variant_info(image)
+    if not widths:
+        return ''
+    candidates = [f"{image.storage.url(variant_name(image.name, width))} {width}w" for width in widths]
+    if original_width:
+        candidates.append(f"{image.url} {original_width}w")
+    return ', '.join(candidates)
+
+
+@register.filter
+def thumbnail(image, width):
+    """URL of the smallest variant at least `width` px wide, else the original."""
+    if not image:
+        return ''
+    width = int(width)
+    for candidate in variant_info(image)[0]:
+        if candidate >= width:
+            return image.storage.url(variant_name(image.name, candidate))
+    return image.url
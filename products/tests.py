@@ -1,3 +1,967 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from jobs.models import Job, OutboundEmail
+from orders.models import Order, OrderItem
+from .alerts import send_wishlist_digests
+from .caching import FACET_VERSION_KEY, attach_card_versions, bump_card_versions, bump_version, card_version_key, get_version
+from .facets import facet_counts, search_facet_counts
+from .cart import purge_abandoned_carts
+from .inventory import restore_stock, sync_vendor_stock
+from .models import CartLine, Category, CoPurchase, Product, ProductChange, ProductRecommendation, RecommendationBuild, Review, StoredCart
+from .pagination import encode_cursor, keyset_paginate
+from .recommendations import COMMIT_LAG, build_recommendations, recommendations_for
+from .search import SearchIndex, invalidate_all_workers, search_index, tokenize
+from .suggest import SALES_REFRESH_INTERVAL, SuggestIndex, SuggestionTrie
+from .templatetags.images import srcset
+from .thumbnails import CACHE_PREFIX, generate_variants, variant_info
+
+
+class ProductListQueryCountTests(TestCase):
+    """product_list must not issue per-card queries (category, wishlist)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('shopper', password='pass12345')
+        cls.categories = [Category.objects.create(name=f'Category {i}') for i in range(4)]
+
+    def add_products(self, count):
+        for i in range(count):
+            product = Product.objects.create(
+                category=self.categories[i % len(self.categories)],
+                name=f'Product {Product.objects.count()}',
+                description='Test product',
+                price='9.99',
+                stock=5,
+            )
+            if i % 2:
+                self.user.profile.wishlist.add(product)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('product_list'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_constant_for_anonymous_users(self):
+        self.add_products(3)
+        small_page = self.count_queries()
+        self.add_products(15)
+        self.assertEqual(self.count_queries(), small_page)
+
+    def test_query_count_is_constant_for_logged_in_users(self):
+        self.client.force_login(self.user)
+        self.add_products(3)
+        small_page = self.count_queries()
+        self.add_products(15)
+        self.assertEqual(self.count_queries(), small_page)
+
+    def test_wishlisted_cards_are_highlighted(self):
+        self.client.force_login(self.user)
+        self.add_products(2)
+        response = self.client.get(reverse('product_list'))
+        self.assertEqual(response.context['wishlist_ids'], {Product.objects.get(name='Product 1').id})
+        self.assertContains(response, 'fill="#ef4444"', count=1)
+
+
+class ProductCardCacheTests(TestCase):
+    """Card fragments are shared across visitors but never go stale."""
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Audio')
+        self.product = Product.objects.create(
+            category=self.category, name='Studio Monitor', description='Speaker', price='120.00', stock=2
+        )
+
+    def test_card_is_rerendered_after_product_change(self):
+        self.assertContains(self.client.get(reverse('product_list')), 'Studio Monitor')
+        self.product.name = 'Studio Monitor MkII'
+        self.product.save()
+        self.assertContains(self.client.get(reverse('product_list')), 'Studio Monitor MkII')
+
+    def test_card_is_rerendered_after_category_rename(self):
+        self.client.get(reverse('product_list'))
+        self.category.name = 'Pro Audio'
+        self.category.save()
+        self.assertContains(self.client.get(reverse('product_list')), 'Pro Audio', count=2)
+
+    def test_wishlist_heart_is_per_user(self):
+        fan = User.objects.create_user('fan', password='pass12345')
+        fan.profile.wishlist.add(self.product)
+        other = User.objects.create_user('other', password='pass12345')
+
+        self.client.force_login(fan)
+        self.assertContains(self.client.get(reverse('product_list')), 'fill="#ef4444"', count=1)
+        self.client.force_login(other)
+        self.assertNotContains(self.client.get(reverse('product_list')), 'fill="#ef4444"')
+
+
+class InlineExecutor:
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+class ThumbnailTests(TestCase):
+    """Templates read variant info from the cache; misses are resolved off the request thread."""
+
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        buffer = BytesIO()
+        Image.new('RGB', (800, 600), 'teal').save(buffer, 'PNG')
+        self.product = Product.objects.create(
+            category=Category.objects.create(name='Shoes'), name='Runner', description='-',
+            price='50.00', stock=1, image=SimpleUploadedFile('runner.png', buffer.getvalue()),
+        )
+        self.image = self.product.image
+
+    def test_a_miss_touches_no_storage_and_is_not_cached(self):
+        executor = mock.Mock()
+        with mock.patch('products.thumbnails._get_executor', return_value=executor), \
+                mock.patch.object(FileSystemStorage, 'exists') as exists, \
+                mock.patch.object(FileSystemStorage, 'open') as opened:
+            self.assertEqual(variant_info(self.image), ([], None))
+            self.assertEqual(variant_info(self.image), ([], None))
+        exists.assert_not_called()
+        opened.assert_not_called()
+        self.assertEqual(executor.submit.call_count, 1)
+        self.assertIsNone(cache.get(CACHE_PREFIX + self.image.name))
+
+    def test_background_check_generates_variants_and_refreshes_the_card(self):
+        card_version = cache.get(card_version_key(self.product.pk))
+        with mock.patch('products.thumbnails._get_executor', return_value=InlineExecutor()):
+            self.assertEqual(srcset(self.image), '')
+        self.assertEqual(variant_info(self.image), ([160, 320, 640], 800))
+        self.assertEqual(cache.get(card_version_key(self.product.pk)), card_version + 1)
+        self.assertIn(' 320w, ', srcset(self.image))
+
+    def test_existing_variants_are_found_again_after_eviction(self):
+        generate_variants(self.image.storage, self.image.name)
+        cache.clear()
+        with mock.patch('products.thumbnails._get_executor', return_value=InlineExecutor()), \
+                mock.patch('products.thumbnails.generate_variants') as regenerate:
+            variant_info(self.image)
+        regenerate.assert_not_called()
+        self.assertEqual(variant_info(self.image), ([160, 320, 640], 800))
+
+
+class FacetCountTests(TestCase):
+    """Each facet counts with the other active filters; cached counts follow catalog changes."""
+
+    def setUp(self):
+        cache.clear()
+        self.books = Category.objects.create(name='Books')
+        self.games = Category.objects.create(name='Games')
+        self.novel = Product.objects.create(category=self.books, name='Novel', description='-', price='20.00', stock=4)
+        Product.objects.create(category=self.books, name='Atlas', description='-', price='120.00', stock=0)
+        Product.objects.create(category=self.games, name='Chess', description='-', price='45.00', stock=2)
+        Product.objects.create(category=self.games, name='Console', description='-', price='499.00', stock=1)
+
+    def counts(self, category=None, price=None, in_stock=False):
+        filters = {'category': category, 'price': price, 'in_stock': in_stock}
+        return facet_counts(Product.objects.filter(available=True), filters)
+
+    def test_counts_without_filters(self):
+        counts = self.counts()
+        self.assertEqual(counts['categories'], {self.books.id: 2, self.games.id: 2})
+        self.assertEqual(counts['prices'], {'under-50': 2, '50-200': 1, '200-500': 1, '500-plus': 0})
+        self.assertEqual(counts['in_stock'], 3)
+
+    def test_each_facet_ignores_only_its_own_filter(self):
+        counts = self.counts(category='books', in_stock=True)
+        # Other categories still show what picking them would give (in stock only)
+        self.assertEqual(counts['categories'], {self.books.id: 1, self.games.id: 2})
+        self.assertEqual(counts['prices'], {'under-50': 1, '50-200': 0, '200-500': 0, '500-plus': 0})
+        self.assertEqual(counts['in_stock'], 1)
+
+        counts = self.counts(price='under-50')
+        self.assertEqual(counts['categories'], {self.books.id: 1, self.games.id: 1})
+        self.assertEqual(counts['prices']['200-500'], 1)
+
+    def test_search_counts_match_the_database_counts(self):
+        index = SearchIndex()
+        index.build()
+        # Category names are indexed, so these two queries hit every product
+        hits = index.hit_facts('books') + index.hit_facts('games')
+        for filters in [{}, {'category': 'books', 'in_stock': True}, {'price': 'under-50'}, {'price': '200-500'}]:
+            filters = {'category': None, 'price': None, 'in_stock': False, **filters}
+            self.assertEqual(search_facet_counts(hits, filters), self.counts(**filters))
+
+    def test_cached_counts_follow_stock_and_category_changes(self):
+        version = get_version(FACET_VERSION_KEY)
+        self.assertEqual(self.counts()['in_stock'], 3)
+
+        # Writes that skip the signals are not seen: the counts come from the cache
+        Product.objects.filter(pk=self.novel.pk).update(stock=0)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.counts()['in_stock'], 3)
+
+        self.novel.refresh_from_db()
+        self.novel.save()
+        self.assertGreater(get_version(FACET_VERSION_KEY), version)
+        self.assertEqual(self.counts()['in_stock'], 2)
+
+        version = get_version(FACET_VERSION_KEY)
+        self.games.delete()
+        self.assertGreater(get_version(FACET_VERSION_KEY), version)
+        self.assertEqual(self.counts()['categories'], {self.books.id: 2})
+
+
+class VersionStampTests(TestCase):
+    """Stamps only move forward: increments are atomic and an evicted stamp restarts above its old value."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_evicted_stamps_restart_above_their_old_value(self):
+        version = get_version(FACET_VERSION_KEY)
+        bump_version(FACET_VERSION_KEY)
+        bump_version(FACET_VERSION_KEY)
+        self.assertEqual(get_version(FACET_VERSION_KEY), version + 2)
+
+        cache.delete(FACET_VERSION_KEY)
+        self.assertGreater(get_version(FACET_VERSION_KEY), version + 2)
+        cache.delete(FACET_VERSION_KEY)
+        bump_version(FACET_VERSION_KEY)
+        self.assertGreater(get_version(FACET_VERSION_KEY), version + 2)
+
+    def test_card_bumps_increment_each_stamp_in_place(self):
+        product = mock.Mock(pk=7)
+        attach_card_versions([product])
+        stamp = cache.get(card_version_key(7))
+        # Increments apply to the stored stamp, so a bump made by another process is kept
+        cache.incr(card_version_key(7))
+        bump_card_versions([7, 8])
+        self.assertEqual(cache.get(card_version_key(7)), stamp + 2)
+        self.assertIsNotNone(cache.get(card_version_key(8)))
+
+        before = product.card_version
+        attach_card_versions([product])
+        self.assertNotEqual(product.card_version, before)
+
+
+class WishlistCacheTests(TestCase):
+    """Wishlist membership comes from a per-user cached ID set kept in step with the M2M rows."""
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Cameras')
+        self.products = [
+            Product.objects.create(category=category, name=f'Camera {i}', description='Lens', price='50.00', stock=3)
+            for i in range(3)
+        ]
+        self.user = User.objects.create_user('collector', password='pass12345')
+        self.client.force_login(self.user)
+
+    def state(self, ids):
+        url = reverse('wishlist_state') + '?ids=' + ','.join(str(i) for i in ids)
+        return self.client.get(url).json()['wishlisted']
+
+    def test_toggle_adds_then_removes(self):
+        product = self.products[0]
+        url = reverse('toggle_wishlist', args=[product.id])
+        ajax = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        self.assertTrue(self.client.get(url, **ajax).json()['added'])
+        self.assertEqual(list(self.user.profile.wishlist.all()), [product])
+        self.assertFalse(self.client.get(url, **ajax).json()['added'])
+        self.assertFalse(self.user.profile.wishlist.exists())
+
+    def test_batch_state_is_served_from_the_cache(self):
+        self.user.profile.wishlist.add(self.products[1])
+        ids = [product.id for product in self.products]
+        expected = {str(ids[0]): False, str(ids[1]): True, str(ids[2]): False}
+        self.assertEqual(self.state(ids), expected)
+        with self.assertNumQueries(2):  # session and user only
+            self.assertEqual(self.state(ids), expected)
+
+    def test_cache_follows_m2m_changes_from_either_side(self):
+        first, second, _ = self.products
+        self.assertEqual(self.state([first.id])[str(first.id)], False)
+
+        first.wishlisted_by.add(self.user.profile)
+        self.assertTrue(self.state([first.id])[str(first.id)])
+        self.user.profile.wishlist.add(second)
+        self.assertTrue(self.state([second.id])[str(second.id)])
+
+        first.wishlisted_by.clear()
+        self.assertFalse(self.state([first.id])[str(first.id)])
+        self.user.profile.wishlist.clear()
+        self.assertFalse(self.state([second.id])[str(second.id)])
+
+    def test_toggle_refreshes_the_cached_set(self):
+        product = self.products[2]
+        self.state([product.id])
+        self.client.get(reverse('toggle_wishlist', args=[product.id]))
+        self.assertTrue(self.state([product.id])[str(product.id)])
+
+    def test_anonymous_visitors_get_all_false(self):
+        self.client.logout()
+        self.assertEqual(self.state([self.products[0].id, 'x']), {str(self.products[0].id): False})
+
+    def test_non_ascii_digits_are_ignored(self):
+        response = self.client.get(reverse('wishlist_state') + f'?ids={self.products[0].id},%C2%B2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()['wishlisted']), [str(self.products[0].id)])
+
+
+class RatingAggregateTests(TestCase):
+    """Stored review aggregates follow review inserts/deletes and can be rebuilt."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(
+            category=Category.objects.create(name='Keyboards'),
+            name='Mech Board', description='Clicky', price='80.00', stock=4,
+        )
+        cls.users = [User.objects.create_user(f'reviewer{i}', password='pass12345') for i in range(3)]
+
+    def review(self, user, rating):
+        return Review.objects.create(product=self.product, user=user, rating=rating, comment='Nice')
+
+    def test_aggregates_follow_reviews(self):
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 4)
+        doomed = self.review(self.users[2], 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.review_count, 3)
+        self.assertEqual(str(self.product.avg_rating), '3.33')
+        self.assertEqual(self.product.rating_1_count, 1)
+
+        doomed.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.review_count, 2)
+        self.assertEqual(str(self.product.avg_rating), '4.50')
+        self.assertEqual(self.product.rating_1_count, 0)
+
+    def test_rebuild_command_repairs_drift(self):
+        self.review(self.users[0], 2)
+        Product.objects.filter(pk=self.product.pk).update(review_count=9, avg_rating=5, rating_2_count=0)
+        call_command('rebuild_rating_aggregates', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.review_count, str(self.product.avg_rating), self.product.rating_2_count), (1, '2.00', 1))
+
+    def test_detail_page_reviews_are_paginated(self):
+        for user in self.users:
+            self.review(user, 3)
+        response = self.client.get(reverse('product_detail', args=[self.product.slug]))
+        self.assertEqual(len(response.context['reviews']), 3)
+        self.assertContains(response, 'reviewer0')
+
+
+class SearchIndexTests(TestCase):
+    """The in-memory index ranks by weighted field hits and follows committed changes in every process."""
+
+    def setUp(self):
+        cache.clear()
+        self.audio = Category.objects.create(name='Audio')
+        self.garden = Category.objects.create(name='Garden')
+        self.headphones = Product.objects.create(
+            category=self.audio, name='Wireless Headphones', description='Over-ear', price='80.00', stock=3
+        )
+        self.speaker = Product.objects.create(
+            category=self.audio, name='Desk Speaker', description='Pairs with wireless headphones', price='40.00', stock=0
+        )
+        self.hose = Product.objects.create(
+            category=self.garden, name='Garden Hose', description='Wireless-free watering', price='15.00', stock=8
+        )
+        # Test fixtures never commit, so nothing is published: start the views' index from these rows
+        search_index.build()
+
+    def search(self, **params):
+        response = self.client.get(reverse('product_list'), params)
+        return [product.name for product in response.context['products']]
+
+    def test_tokenize_lowercases_and_drops_stop_words(self):
+        self.assertEqual(tokenize('The Sony WH-1000 and a Case'), ['sony', 'wh', '1000', 'case'])
+        self.assertEqual(tokenize(''), [])
+
+    def test_name_hits_outrank_description_hits_and_every_term_must_match(self):
+        index = SearchIndex()
+        self.assertEqual(index.search('wireless headphones'), [self.headphones.id, self.speaker.id])
+        self.assertEqual(index.search('headph'), [self.headphones.id, self.speaker.id])
+        self.assertEqual(index.search('wireless garden'), [self.hose.id])
+        self.assertEqual(index.search('the'), [])
+
+    def test_filters_apply_before_paging_the_ranked_hits(self):
+        # Equal description hits tie-break newest first
+        self.assertEqual(self.search(q='wireless'), ['Wireless Headphones', 'Garden Hose', 'Desk Speaker'])
+        self.assertEqual(self.search(q='wireless', category='garden'), ['Garden Hose'])
+        self.assertEqual(self.search(q='wireless', in_stock='1'), ['Wireless Headphones', 'Garden Hose'])
+
+        response = self.client.get(reverse('product_list'), {'q': 'wireless', 'price': 'under-50'})
+        self.assertEqual([p.name for p in response.context['products']], ['Garden Hose', 'Desk Speaker'])
+        facets = response.context['facets']
+        self.assertEqual({c['name']: c['count'] for c in facets['categories']}, {'Audio': 1, 'Garden': 1})
+        self.assertEqual(facets['in_stock']['count'], 1)
+
+    def test_search_facets_do_not_query_the_hits(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('product_list'), {'q': 'wireless', 'category': 'audio'})
+        product_table = connection.ops.quote_name(Product._meta.db_table)
+        # Just the page's rows; the counts come from the index
+        self.assertEqual(sum(product_table in query['sql'] for query in queries), 1)
+
+    def test_search_pages_fetch_only_the_page_rows(self):
+        ajax = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('product_list'), {'q': 'wireless', 'in_stock': '1'}, **ajax)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('Wireless Headphones', response.json()['html'])
+        self.assertNotIn('Desk Speaker', response.json()['html'])
+
+    def test_hits_are_capped_after_filtering(self):
+        with mock.patch('products.views.SEARCH_MAX_HITS', 1):
+            self.assertEqual(self.search(q='wireless', price='under-50'), ['Garden Hose'])
+            self.assertEqual(self.search(q='wireless', category='audio'), ['Wireless Headphones'])
+
+    def test_stock_updates_reach_the_search_filters(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            restore_stock([(self.speaker.id, 2)])
+        self.assertEqual(self.search(q='wireless', in_stock='1'), ['Wireless Headphones', 'Garden Hose', 'Desk Speaker'])
+
+    def test_other_processes_replay_committed_changes(self):
+        other = SearchIndex()
+        self.assertEqual(other.search('hose'), [self.hose.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hose.name = 'Garden Sprinkler'
+            self.hose.save()
+            self.speaker.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.garden.name = 'Outdoor'
+            self.garden.save()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(other.search('sprinkler outdoor'), [self.hose.id])
+        self.assertEqual(other.search('hose'), [])
+        self.assertEqual(other.search('speaker'), [])
+
+    def test_uncommitted_changes_are_not_published(self):
+        other = SearchIndex()
+        other.search('hose')
+        self.hose.name = 'Garden Sprinkler'
+        self.hose.save()
+        self.assertEqual(other.search('sprinkler'), [])
+
+    def test_lost_change_log_entries_force_a_rebuild(self):
+        other = SearchIndex()
+        other.search('hose')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hose.name = 'Garden Sprinkler'
+            self.hose.save()
+        cache.delete('products:search_changes:1')
+        self.assertEqual(other.search('sprinkler'), [self.hose.id])
+
+
+class SuggestEndpointTests(TestCase):
+    """Prefix completions come from the in-memory trie, best sellers first."""
+
+    def setUp(self):
+        invalidate_all_workers()
+        self.category = Category.objects.create(name='Headphones')
+        self.quiet = Product.objects.create(
+            category=self.category, name='Head Strap', description='Spare', price='5.00', stock=9
+        )
+        self.popular = Product.objects.create(
+            category=self.category, name='Headset Pro', description='Gaming', price='99.00', stock=9
+        )
+        buyer = User.objects.create_user('buyer', password='pass12345')
+        order = Order.objects.create(user=buyer, full_name='B', email='b@example.com', address='X', total_price='297.00')
+        OrderItem.objects.create(order=order, product=self.popular, price='99.00', quantity=3)
+
+    def suggest(self, q):
+        return self.client.get(reverse('suggest'), {'q': q}).json()
+
+    def test_ranks_by_units_sold(self):
+        data = self.suggest('hea')
+        self.assertEqual([p['name'] for p in data['products']], ['Headset Pro', 'Head Strap'])
+        self.assertEqual([c['name'] for c in data['categories']], ['Headphones'])
+
+    def test_matches_later_words_and_follows_saves(self):
+        self.assertEqual(self.suggest('pro')['products'][0]['name'], 'Headset Pro')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.popular.name = 'Headset Max'
+            self.popular.save()
+        self.assertEqual(self.suggest('pro')['products'], [])
+        self.assertEqual(self.suggest('max')['products'][0]['url'], reverse('product_detail', args=['headset-max']))
+
+    def test_other_processes_replay_committed_changes(self):
+        other = SuggestIndex()
+        self.assertEqual(other.suggest('hea')['categories'][0]['name'], 'Headphones')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.quiet.available = False
+            self.quiet.save()
+            Category.objects.create(name='Heaters')
+        self.assertEqual([p['name'] for p in other.suggest('hea')['products']], ['Headset Pro'])
+        self.assertEqual([c['name'] for c in other.suggest('hea')['categories']], ['Headphones', 'Heaters'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.delete()
+        data = other.suggest('hea')
+        self.assertEqual(data['products'], [])
+        self.assertEqual(data['categories'], [{'name': 'Heaters', 'url': f"{reverse('product_list')}?category=heaters"}])
+
+    def test_rankings_follow_new_sales_after_the_refresh_interval(self):
+        index = SuggestIndex()
+        self.assertEqual(index.suggest('hea')['products'][0]['name'], 'Headset Pro')
+
+        buyer = User.objects.create_user('regular', password='pass12345')
+        order = Order.objects.create(user=buyer, full_name='R', email='r@example.com', address='X', total_price='25.00')
+        OrderItem.objects.create(order=order, product=self.quiet, price='5.00', quantity=5)
+        self.assertEqual(index.suggest('hea')['products'][0]['name'], 'Headset Pro')
+
+        later = time.monotonic() + SALES_REFRESH_INTERVAL
+        with mock.patch('products.suggest.time.monotonic', return_value=later):
+            self.assertEqual(index.suggest('hea')['products'][0]['name'], 'Head Strap')
+        self.assertEqual(index.sales[self.quiet.id], 5)
+
+    def test_removing_entries_prunes_their_branches(self):
+        trie = SuggestionTrie()
+        trie.insert(1, 'Headset', '/headset', 3)
+        trie.insert(2, 'Head', '/head', 1)
+        trie.remove(1)
+        self.assertIsNone(trie._walk('heads'))
+        self.assertEqual(trie.complete('he'), [{'name': 'Head', 'url': '/head'}])
+        trie.remove(2)
+        self.assertEqual(trie.root.children, {})
+        self.assertEqual(trie.root.top, ())
+
+
+class RecommendationTests(TestCase):
+    """Incremental builds must leave the same tables as a full rebuild over the same orders."""
+
+    def setUp(self):
+        self.buyer = User.objects.create_user('buyer', password='pass12345')
+        category = Category.objects.create(name='Kitchen')
+        self.products = [
+            Product.objects.create(category=category, name=f'Item {i}', description='-', price='1.00', stock=99)
+            for i in range(6)
+        ]
+
+    def order(self, *indexes, status='Pending'):
+        order = Order.objects.create(
+            user=self.buyer, full_name='B', email='b@example.com', address='X', total_price='1.00', status=status
+        )
+        for i in indexes:
+            OrderItem.objects.create(order=order, product=self.products[i], price='1.00', quantity=1)
+        return order
+
+    def snapshot(self):
+        return (
+            sorted(CoPurchase.objects.values_list('product_id', 'other_id', 'count')),
+            [
+                (a, b, rank, round(score, 9))
+                for a, b, rank, score in ProductRecommendation.objects.order_by('product_id', 'rank')
+                .values_list('product_id', 'recommended_id', 'rank', 'score')
+            ],
+        )
+
+    def test_incremental_build_matches_a_full_build(self):
+        self.order(0, 1)
+        self.order(0, 2)
+        self.order(1, 2, 3)
+        build_recommendations()
+
+        # Product 0 appears in no new order, but its neighbours' order counts change
+        self.order(1, 4)
+        self.order(2, 4)
+        self.order(1)
+        self.order(0, 5, status='Cancelled')
+        self.assertEqual(build_recommendations(incremental=True), (3, 5))
+        incremental = self.snapshot()
+
+        build_recommendations()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_late_committed_orders_are_counted_once(self):
+        self.order(0, 1)
+        build_recommendations()
+        watermark = RecommendationBuild.objects.get().counted_through
+
+        # Stamped before the watermark, committed after the last run read the table
+        late = self.order(0, 2)
+        Order.objects.filter(pk=late.pk).update(created_at=watermark - COMMIT_LAG / 2)
+        self.assertEqual(build_recommendations(incremental=True)[0], 1)
+        self.assertEqual(build_recommendations(incremental=True)[0], 0)
+        incremental = self.snapshot()
+
+        build_recommendations()
+        self.assertEqual(self.snapshot(), incremental)
+        self.assertEqual(CoPurchase.objects.get(product=self.products[0], other=self.products[0]).count, 2)
+
+    def test_keeps_the_top_k_neighbours_by_cosine_score(self):
+        for _ in range(3):
+            self.order(0, 1)
+        self.order(0, 2)
+        self.order(0, 3)
+        self.order(3)
+        self.order(3)
+        build_recommendations(top_k=2)
+
+        rows = ProductRecommendation.objects.filter(product=self.products[0]).order_by('rank')
+        self.assertEqual([row.recommended_id for row in rows], [self.products[1].id, self.products[2].id])
+        self.assertAlmostEqual(rows[0].score, 3 / (5 * 3) ** 0.5)
+
+        self.products[1].available = False
+        self.products[1].save()
+        self.assertEqual(recommendations_for(self.products[0]), [self.products[2]])
+
+
+class BulkImportTests(TestCase):
+    """Vendor CSV/JSONL imports upsert by SKU in batches and report bad rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user('seller', password='pass12345')
+        cls.vendor.profile.role = 'Vendor'
+        cls.vendor.profile.save()
+        cls.category = Category.objects.create(name='Garden Tools')
+        cls.existing = Product.objects.create(
+            category=cls.category, vendor=cls.vendor, sku='RAKE-1', name='Rake', description='Metal', price='19.00', stock=3,
+        )
+        # Owned by someone else but holding the slug an import will want
+        Product.objects.create(category=cls.category, name='Shovel', description='Steel', price='25.00', stock=1)
+
+    def upload(self, content, name='products.csv'):
+        self.client.force_login(self.vendor)
+        upload = SimpleUploadedFile(name, content if isinstance(content, bytes) else content.encode())
+        return self.client.post(reverse('vendor_import_products'), {'file': upload})
+
+    def test_lines_that_are_not_utf8_are_reported_not_fatal(self):
+        response = self.upload(
+            "sku,name,price,stock,category\n"
+            "HOE-1,Hoe,9.00,1,Garden Tools\n".encode()
+            + "RAKE-2,Râteau,9.00,1,Garden Tools\n".encode('latin-1')
+            + "TROWEL-1,Trowel,4.00,1,Garden Tools\n".encode()
+        )
+        self.assertEqual(response.status_code, 200)
+        report = response.context['report']
+        self.assertEqual(report.created, 2)
+        self.assertEqual([(line, message[:30]) for line, _, message in report.errors], [(3, 'This line is not valid UTF-8; ')])
+
+    def test_jsonl_objects_and_lists_are_rejected(self):
+        response = self.upload(
+            '{"sku": "HOE-1", "name": {"a": 1}, "price": 5, "category": "garden-tools"}\n'
+            '{"sku": ["X"], "name": "Hoe"}\n',
+            name='products.jsonl',
+        )
+        report = response.context['report']
+        self.assertEqual(report.created, 0)
+        self.assertEqual([(line, sku) for line, sku, _ in report.errors], [(1, 'HOE-1'), (2, '')])
+        self.assertIn('name must be a single value', report.errors[0][2])
+        self.assertFalse(Product.objects.filter(sku='HOE-1').exists())
+
+    def test_csv_creates_updates_and_reports(self):
+        response = self.upload(
+            "sku,name,price,stock,category\n"
+            "RAKE-1,,21.50,10,\n"
+            "SHOV-1,Shovel,30.00,5,garden-tools\n"
+            "SHOV-2,Shovel,31.00,5,Garden Tools\n"
+            "BAD-1,Hoe,abc,1,Garden Tools\n"
+            "NEW-1,,5.00,1,Garden Tools\n"
+            "SHOV-1,Shovel,30.00,5,garden-tools\n"
+        )
+        report = response.context['report']
+        self.assertEqual((report.created, report.updated), (2, 1))
+        self.assertEqual([line for line, _, _ in report.errors], [5, 6, 7])
+
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.price, self.existing.stock, self.existing.name), (Decimal('21.50'), 10, 'Rake'))
+        self.assertEqual(
+            sorted(Product.objects.filter(name='Shovel').values_list('slug', flat=True)),
+            ['shovel', 'shovel-2', 'shovel-3'],
+        )
+
+    def test_jsonl_import_is_searchable_and_renames_keep_unique_slugs(self):
+        self.upload('{"sku": "RAKE-1", "name": "Shovel"}\n{"sku": "X"\n', name='products.jsonl')
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.slug, 'shovel-2')
+        response = self.client.get(reverse('product_list'), {'q': 'shovel'})
+        self.assertEqual(len(response.context['products']), 2)
+
+        # A normal save keeps the disambiguated slug
+        self.existing.description = 'Renamed'
+        self.existing.save()
+        self.assertEqual(self.existing.slug, 'shovel-2')
+
+    def test_command_validates_in_worker_processes(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as handle:
+            handle.write("sku,name,price,category\n")
+            for i in range(50):
+                handle.write(f"TRW-{i},Trowel {i},{i}.99,Garden Tools\n")
+        try:
+            call_command('import_products', 'seller', handle.name, '--workers', '2', stdout=StringIO())
+        finally:
+            os.unlink(handle.name)
+        self.assertEqual(Product.objects.filter(vendor=self.vendor, sku__startswith='TRW-').count(), 50)
+
+
+class VendorStockSyncTests(TestCase):
+    """The stock-sync endpoint applies a batch of SKU changes to the vendor's own products only."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user('warehouse', password='pass12345')
+        cls.vendor.profile.role = 'Vendor'
+        cls.vendor.profile.save()
+        other = User.objects.create_user('rival', password='pass12345')
+        category = Category.objects.create(name='Paint')
+        cls.red = Product.objects.create(category=category, vendor=cls.vendor, sku='RED', name='Red Paint', description='1L', price='9.00', stock=1)
+        cls.blue = Product.objects.create(category=category, vendor=cls.vendor, sku='BLUE', name='Blue Paint', description='1L', price='9.00', stock=1)
+        cls.foreign = Product.objects.create(category=category, vendor=other, sku='GREEN', name='Green Paint', description='1L', price='9.00', stock=1)
+
+    def sync(self, items):
+        self.client.force_login(self.vendor)
+        return self.client.post(reverse('vendor_stock_sync'), json.dumps({'items': items}), content_type='application/json')
+
+    def test_batch_updates_in_few_queries(self):
+        items = [
+            {'sku': 'RED', 'stock': 40, 'price': '7.50'},
+            {'sku': 'BLUE', 'stock': 0},
+            {'sku': 'GREEN', 'stock': 99},
+            {'sku': 'RED', 'stock': -1},
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.sync(items).json()
+        self.assertEqual(data['updated'], 2)
+        self.assertEqual([(e['index'], e['sku']) for e in data['errors']], [(2, 'GREEN'), (3, 'RED')])
+        self.assertEqual(len([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "products_product"')]), 1)
+
+        stock = dict(Product.objects.values_list('sku', 'stock'))
+        self.assertEqual(stock, {'RED': 40, 'BLUE': 0, 'GREEN': 1})
+        self.red.refresh_from_db()
+        self.assertEqual(self.red.price, Decimal('7.50'))
+
+    def test_price_change_refreshes_cached_card(self):
+        self.assertContains(self.client.get(reverse('product_list')), '9.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sync([{'sku': 'RED', 'price': 12.25}])
+        self.assertContains(self.client.get(reverse('product_list')), '12.25')
+
+    def test_rejects_malformed_bodies(self):
+        self.client.force_login(self.vendor)
+        response = self.client.post(reverse('vendor_stock_sync'), 'nope', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_requires_a_vendor_session_and_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        body = json.dumps({'items': [{'sku': 'RED', 'stock': 5}]})
+        url = reverse('vendor_stock_sync')
+        self.assertEqual(client.post(url, body, content_type='application/json').status_code, 403)
+
+        client.force_login(self.vendor)
+        self.assertEqual(client.post(url, body, content_type='application/json').status_code, 403)
+
+        client.get(reverse('login'))
+        token = client.cookies['csrftoken'].value
+        response = client.post(url, body, content_type='application/json', HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.json()['updated'], 1)
+
+
+class WishlistAlertTests(TestCase):
+    """Price drops and restocks on wishlisted products become one digest email per shopper."""
+
+    def setUp(self):
+        self.vendor = User.objects.create_user('lamps', password='pass12345')
+        category = Category.objects.create(name='Lighting')
+        self.lamp = Product.objects.create(category=category, vendor=self.vendor, sku='LAMP', name='Desk Lamp', description='LED', price='40.00', stock=5)
+        self.bulb = Product.objects.create(category=category, vendor=self.vendor, sku='BULB', name='Smart Bulb', description='E27', price='15.00', stock=0)
+        self.ignored = Product.objects.create(category=category, vendor=self.vendor, sku='CORD', name='Cord', description='2m', price='5.00', stock=0)
+        self.fans = [User.objects.create_user(f'fan{i}', f'fan{i}@example.com', 'pass12345') for i in range(2)]
+        for fan in self.fans:
+            fan.profile.wishlist.add(self.lamp, self.bulb)
+
+    def test_saves_and_bulk_paths_record_only_wishlisted_drops_and_restocks(self):
+        lamp = Product.objects.get(pk=self.lamp.pk)
+        lamp.price = '35.00'
+        lamp.save()
+        lamp.price = '50.00'  # rises are not news
+        lamp.save()
+        sync_vendor_stock(self.vendor, [{'sku': 'BULB', 'stock': 12}, {'sku': 'CORD', 'stock': 3}])
+        self.assertEqual(
+            sorted(ProductChange.objects.values_list('product__sku', 'kind', 'old_price')),
+            [('BULB', ProductChange.BACK_IN_STOCK, None), ('LAMP', ProductChange.PRICE_DROP, Decimal('40.00'))],
+        )
+        self.assertTrue(Job.objects.filter(unique_key='products:wishlist_digest').exists())
+
+    def test_cancelled_order_restocking_a_sold_out_product_is_recorded(self):
+        restore_stock([(self.bulb.pk, 2), (self.lamp.pk, 1)])
+        self.assertEqual(list(ProductChange.objects.values_list('product_id', 'kind')), [(self.bulb.pk, ProductChange.BACK_IN_STOCK)])
+
+    def test_digest_groups_every_alert_for_a_user_into_one_email(self):
+        sync_vendor_stock(self.vendor, [{'sku': 'LAMP', 'price': '30.00'}, {'sku': 'BULB', 'stock': 4}])
+        # changes, products, wishlist join, email insert and delete, inside one savepoint
+        with self.assertNumQueries(7):
+            self.assertEqual(send_wishlist_digests(), 2)
+
+        emails = OutboundEmail.objects.order_by('to')
+        self.assertEqual([email.to for email in emails], [['fan0@example.com'], ['fan1@example.com']])
+        self.assertIn('Desk Lamp: now $30.00 (was $40.00)', emails[0].body)
+        self.assertIn('Smart Bulb: back in stock', emails[0].body)
+        self.assertFalse(ProductChange.objects.exists())
+        self.assertEqual(send_wishlist_digests(), 0)
+
+    def test_changes_undone_before_the_digest_are_dropped(self):
+        lamp = Product.objects.get(pk=self.lamp.pk)
+        lamp.price = '20.00'
+        lamp.save()
+        Product.objects.filter(pk=lamp.pk).update(price='45.00')
+        self.assertEqual(send_wishlist_digests(), 0)
+        self.assertFalse(OutboundEmail.objects.exists())
+
+
+class StoredCartTests(TestCase):
+    """Carts live in their own tables; the session only points at an anonymous cart."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Tea')
+        cls.green = Product.objects.create(category=category, name='Green Tea', description='Loose', price='6.00', stock=20)
+        cls.black = Product.objects.create(category=category, name='Black Tea', description='Bags', price='4.00', stock=20)
+        cls.user = User.objects.create_user('sipper', password='pass12345')
+
+    def add(self, product):
+        return self.client.get(reverse('add_to_cart', args=[product.id]), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_adding_writes_only_the_line(self):
+        self.add(self.green)
+        self.assertEqual(set(self.client.session.keys()), {'cart_id'})
+
+        touched = StoredCart.objects.get().updated_at
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.add(self.green).json()['cart_count'], 2)
+        writes = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith(('UPDATE', 'INSERT', 'DELETE'))]
+        self.assertEqual(len(writes), 2)
+        self.assertTrue(writes[0].startswith('UPDATE "products_cartline"'))
+        # The activity stamp was refreshed moments ago, so its guarded UPDATE matches nothing
+        self.assertIn('"updated_at" < ', writes[1])
+        self.assertEqual(StoredCart.objects.get().updated_at, touched)
+
+    def test_anonymous_cart_is_merged_on_login(self):
+        self.add(self.green)
+        self.add(self.green)
+        self.add(self.black)
+        cart = StoredCart.objects.create(user=self.user)
+        CartLine.objects.create(cart=cart, product=self.green, quantity=1)
+
+        self.client.login(username='sipper', password='pass12345')
+        self.assertEqual(
+            dict(CartLine.objects.filter(cart__user=self.user).values_list('product__name', 'quantity')),
+            {'Green Tea': 3, 'Black Tea': 1},
+        )
+        self.assertEqual(StoredCart.objects.count(), 1)
+        self.assertNotIn('cart_id', self.client.session)
+
+        # The cart follows the user to a new session
+        self.client.logout()
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(reverse('cart')), 'Black Tea')
+
+    def test_update_and_remove_touch_one_line(self):
+        self.client.force_login(self.user)
+        self.add(self.green)
+        self.add(self.black)
+        self.client.post(reverse('update_cart', args=[self.green.id]), {'quantity': 5})
+        self.client.get(reverse('remove_from_cart', args=[self.black.id]))
+        self.assertEqual(list(CartLine.objects.values_list('product__name', 'quantity')), [('Green Tea', 5)])
+        self.assertContains(self.client.get(reverse('product_list')), '<span class="badge rounded-pill cart-badge">5</span>')
+
+    def test_idle_anonymous_carts_are_purged(self):
+        self.add(self.green)
+        StoredCart.objects.update(created_at=timezone.now() - timedelta(days=30))
+        # Old but still in use: the add refreshes the stale activity stamp
+        StoredCart.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        self.add(self.black)
+        self.assertEqual(purge_abandoned_carts(), 0)
+
+        StoredCart.objects.update(updated_at=timezone.now() - timedelta(days=30))
+        self.assertEqual(purge_abandoned_carts(), 1)
+        self.assertFalse(CartLine.objects.exists())
+
+        # A session still pointing at the purged cart gets a fresh one
+        self.assertEqual(self.add(self.green).json()['cart_count'], 1)
+
+    def test_cart_is_read_once_per_request_at_live_prices(self):
+        self.client.force_login(self.user)
+        cheap = Product.objects.create(category=self.green.category, name='Sample', description='Tin', price='0.10', stock=20)
+        for product in (cheap, cheap, cheap, self.green):
+            self.add(product)
+        Product.objects.filter(pk=self.green.pk).update(price='5.55')
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('checkout'))
+        cart_reads = [q['sql'] for q in ctx.captured_queries if 'FROM "products_cartline"' in q['sql']]
+        self.assertEqual(len(cart_reads), 1)
+        self.assertIn('"products_product"', cart_reads[0])
+        self.assertEqual(response.context['total_price'], Decimal('5.85'))
+        self.assertEqual([item['price'] for item in response.context['cart']], [Decimal('0.10'), Decimal('5.55')])
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages walk the catalog in order without gaps, repeats or crashes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Books')
+        cls.products = [
+            Product.objects.create(category=category, name=f'Book {i}', description='Paper', price='10.00', stock=1)
+            for i in range(5)
+        ]
+        # Three rows share one created_at, so the id tiebreak decides their order
+        same = timezone.now()
+        Product.objects.filter(pk__in=[p.pk for p in cls.products[1:4]]).update(created_at=same)
+
+    def walk(self, per_page):
+        seen, cursor = [], None
+        while True:
+            page = keyset_paginate(Product.objects.all(), cursor, per_page)
+            seen.extend(product.pk for product in page)
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    def test_first_and_next_pages(self):
+        expected = list(Product.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+        first = keyset_paginate(Product.objects.all(), None, 2)
+        self.assertEqual([p.pk for p in first], expected[:2])
+        second = keyset_paginate(Product.objects.all(), first.next_cursor, 2)
+        self.assertEqual([p.pk for p in second], expected[2:4])
+
+    def test_ties_on_the_sort_key_are_neither_skipped_nor_repeated(self):
+        expected = list(Product.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+        for per_page in (1, 2, 3):
+            self.assertEqual(self.walk(per_page), expected)
+
+    def test_bad_or_tampered_cursors_fall_back_to_the_first_page(self):
+        first = [p.pk for p in keyset_paginate(Product.objects.all(), None, 2)]
+        for cursor in ('not-base64!', encode_cursor(['x', 'y']), encode_cursor(['1']), 'WyJ4IiwieSJd'):
+            self.assertEqual([p.pk for p in keyset_paginate(Product.objects.all(), cursor, 2)], first)
+        response = self.client.get(reverse('product_list'), {'cursor': 'WyJ4IiwieSJd'})
+        self.assertEqual(response.status_code, 200)
+        self.client.force_login(User.objects.create_user('reader', password='pass12345'))
+        self.assertEqual(self.client.get(reverse('wishlist'), {'cursor': encode_cursor(['x'])}).status_code, 200)
@@ -0,0 +1,134 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .caching import bump_card_version
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+# Widths generated for every uploaded product/profile image
+VARIANT_WIDTHS = (160, 320, 640, 1024)
+VARIANT_FORMAT = 'WEBP'
+VARIANT_EXTENSION = 'webp'
+VARIANT_QUALITY = 80
+
+# Generated variant widths (and the original's width) per image name, so
+# templates skip storage lookups. Only written once the variants exist.
+CACHE_PREFIX = 'thumbnails:'
+
+# At most one background check per uncached image in this window
+PROBE_PREFIX = 'thumbnails-probe:'
+PROBE_INTERVAL = 10 * 60
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='thumbnails')
+    return _executor
+
+
+def variant_name(name, width):
+    """'products/shoe.jpg' -> 'products/shoe_320w.webp' (stored next to the original)."""
+    root, _ = os.path.splitext(name)
+    return f"{root}_{width}w.{VARIANT_EXTENSION}"
+
+
+def generate_variants(storage, name):
+    """Resizes and re-encodes one stored image into every smaller width. Returns the widths."""
+    with storage.open(name, 'rb') as original:
+        image = Image.open(original)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    widths = []
+    for width in VARIANT_WIDTHS:
+        if width >= image.width:
+            break
+        height = round(image.height * width / image.width)
+        resized = image.resize((width, height), Image.LANCZOS)
+        buffer = BytesIO()
+        resized.save(buffer, VARIANT_FORMAT, quality=VARIANT_QUALITY, method=4)
+
+        target = variant_name(name, width)
+        if storage.exists(target):
+            storage.delete(target)
+        storage.save(target, ContentFile(buffer.getvalue()))
+        widths.append(width)
+
+    cache.set(CACHE_PREFIX + name, (widths, image.width), None)
+    return widths
+
+
+def _run(storage, name, on_done):
+    try:
+        generate_variants(storage, name)
+    except Exception:
+        logger.exception("Thumbnail generation failed for %s", name)
+        return
+    if on_done:
+        on_done()
+
+
+def schedule_variants(fieldfile, on_done=None):
+    """
+    Queues variant generation on the worker pool once the upload's transaction
+    commits, keeping image processing off the request thread.
+    """
+    storage, name = fieldfile.storage, fieldfile.name
+    transaction.on_commit(lambda: _get_executor().submit(_run, storage, name, on_done))
+
+
+def _probe(storage, name, on_done):
+    """Caches the variants an image already has, or generates them if there are none."""
+    widths = [width for width in VARIANT_WIDTHS if storage.exists(variant_name(name, width))]
+    if not widths:
+        _run(storage, name, on_done)
+        return
+    try:
+        with storage.open(name, 'rb') as original:
+            original_width = Image.open(original).width
+    except (OSError, ValueError):
+        original_width = None
+    cache.set(CACHE_PREFIX + name, (widths, original_width), None)
+    if on_done:
+        on_done()
+
+
+def _run_probe(storage, name, on_done):
+    try:
+        _probe(storage, name, on_done)
+    except Exception:
+        logger.exception("Thumbnail check failed for %s", name)
+
+
+def variant_info(fieldfile):
+    """
+    (variant widths, original width) for an image, as cached by the worker.
+    A miss is answered with ([], None) without touching storage, so templates
+    fall back to the original, and queues a background check that caches the
+    real answer (generating the variants if they are missing).
+    """
+    info = cache.get(CACHE_PREFIX + fieldfile.name)
+    if info is None:
+        if cache.add(PROBE_PREFIX + fieldfile.name, True, PROBE_INTERVAL):
+            on_done = None
+            if isinstance(fieldfile.instance, Product) and fieldfile.instance.pk:
+                # Cached product cards embed the srcset, so they need the news too
+                product_id = fieldfile.instance.pk
+                on_done = lambda: bump_card_version(product_id)
+            _get_executor().submit(_run_probe, fieldfile.storage, fieldfile.name, on_done)
+        return [], None
+    return info
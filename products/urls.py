@@ -5,6 +5,7 @@ urlpatterns = [
     # Public Catalog
     path('', views.product_list, name='product_list'),
     path('product/<slug:slug>/', views.product_detail, name='product_detail'),
+    path('suggest/', views.suggest, name='suggest'),
 
     # Shopping Cart
     path('cart/', views.cart_view, name='cart'),
@@ -15,10 +16,13 @@ urlpatterns = [
     # Wishlist Module 
     path('wishlist/', views.wishlist_view, name='wishlist'),
     path('wishlist/toggle/<int:product_id>/', views.toggle_wishlist, name='toggle_wishlist'),
+    path('wishlist/state/', views.wishlist_state, name='wishlist_state'),
 
     # Vendor Module
     path('vendor/dashboard/', views.vendor_dashboard, name='vendor_dashboard'),
     path('vendor/add-product/', views.vendor_add_product, name='vendor_add_product'),
+    path('vendor/import/', views.vendor_import_products, name='vendor_import_products'),
+    path('vendor/stock-sync/', views.vendor_stock_sync, name='vendor_stock_sync'),
     path('vendor/edit-product/<slug:slug>/', views.vendor_edit_product, name='vendor_edit_product'),
     path('vendor/delete-product/<slug:slug>/', views.vendor_delete_product, name='vendor_delete_product'),
 ]
\ No newline at end of file
@@ -1,13 +1,27 @@
+import json
+
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.http import JsonResponse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import F, Sum
+from django.core.paginator import Paginator
+from django.db import transaction
 
 from .models import Product, Category, Review
-from .cart import Cart
+from .cart import get_cart
 from .forms import ReviewForm, ProductForm
-from orders.models import OrderItem
+from .recommendations import recommendations_for
+from .search import search_index
+from .suggest import suggest_index
+from .caching import attach_card_versions
+from .facets import apply_filters, listing_predicate, facet_counts, search_facet_counts, build_facets
+from .importing import FIELDS as IMPORT_FIELDS, guess_format, import_products
+from .inventory import SYNC_MAX_ITEMS, sync_vendor_stock
+from .wishlist import toggle_wishlist_item, wishlist_ids
+from .pagination import keyset_paginate, ranked_paginate, next_page_url, load_more_response
+from orders.idempotency import idempotent, release_key
+from orders.rollups import vendor_summary
 
 # --- PERMISSION DECORATOR ---
 
@@ -23,34 +37,64 @@ def vendor_required(function):
 
 # --- PUBLIC CATALOG VIEWS ---
 
+PRODUCTS_PER_PAGE = 24
+REVIEWS_PER_PAGE = 10
+SUGGEST_LIMIT = 8
+# Deepest a shopper can page into one search's results
+SEARCH_MAX_HITS = 1000
+
 def product_list(request):
-    """Displays available products with category and search filtering."""
+    """Displays available products with search, faceted filtering and facet counts."""
     products = Product.objects.filter(available=True)
     categories = Category.objects.all()
 
-    category_slug = request.GET.get("category")
     query = request.GET.get("q")
+    cursor = request.GET.get("cursor")
+    filters = {
+        "category": request.GET.get("category"),
+        "price": request.GET.get("price"),
+        "in_stock": request.GET.get("in_stock") == "1",
+    }
 
-    if category_slug:
-        products = products.filter(category__slug=category_slug)
-
+    listing = apply_filters(products.select_related('category'), filters)
     if query:
-        products = products.filter(name__icontains=query) | products.filter(description__icontains=query)
+        # The index ranks and filters the hits in memory, so only the rows of
+        # this page are fetched; the queryset still re-checks them
+        ranked_ids = search_index.search(query, limit=SEARCH_MAX_HITS, where=listing_predicate(filters))
+        page = ranked_paginate(listing, ranked_ids, cursor, PRODUCTS_PER_PAGE)
+    else:
+        page = keyset_paginate(listing, cursor, PRODUCTS_PER_PAGE)
+    attach_card_versions(page.items)
 
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return load_more_response(request, page, "products/includes/product_cards.html", {
+            "products": page,
+            "wishlist_ids": wishlist_ids(request.user)
+        })
+
+    if query:
+        # Counted from the index's copy of the hits, so no hit list is sent to the database
+        hits = search_index.hit_facts(query, where=lambda facts: facts.available)
+        counts = search_facet_counts(hits, filters)
+    else:
+        counts = facet_counts(products, filters)
     context = {
-        "products": products,
-        "categories": categories
+        "products": page,
+        "facets": build_facets(request, counts, categories),
+        "wishlist_ids": wishlist_ids(request.user),
+        "next_url": next_page_url(request, page)
     }
     return render(request, "products/product_list.html", context)
 
 def product_detail(request, slug):
-    """Displays product details and handles review submissions."""
-    product = get_object_or_404(Product, slug=slug, available=True)
-    reviews = product.reviews.all().order_by('-created_at')
+    """Displays product details, stored rating aggregates and paginated reviews."""
+    product = get_object_or_404(Product.objects.select_related('category'), slug=slug, available=True)
+    reviews = product.reviews.select_related('user').order_by('-created_at', '-id')
+    reviews_page = Paginator(reviews, REVIEWS_PER_PAGE).get_page(request.GET.get('reviews_page'))
     
-    user_review = None
+    user_review = False
     if request.user.is_authenticated:
-        user_review = reviews.filter(user=request.user).first()
+        user_review = product.reviews.filter(user=request.user).exists()
 
     if request.method == 'POST':
         if not request.user.is_authenticated:
@@ -62,7 +106,9 @@ def product_detail(request, slug):
             review = form.save(commit=False)
             review.product = product
             review.user = request.user
-            review.save()
+            # The review row and the product's aggregates commit together
+            with transaction.atomic():
+                review.save()
             messages.success(request, "Review posted successfully!")
             return redirect('product_detail', slug=slug)
     else:
@@ -70,27 +116,37 @@ def product_detail(request, slug):
 
     return render(request, 'products/product_detail.html', {
         'product': product,
-        'reviews': reviews,
+        'reviews': reviews_page,
         'form': form,
-        'user_review': user_review
+        'user_review': user_review,
+        'bought_together': recommendations_for(product)
     })
 
+def suggest(request):
+    """JSON prefix completions for the navbar search box."""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'products': [], 'categories': []})
+    try:
+        limit = min(int(request.GET.get('limit', SUGGEST_LIMIT)), SUGGEST_LIMIT)
+    except ValueError:
+        limit = SUGGEST_LIMIT
+    return JsonResponse(suggest_index.suggest(query, limit))
+
 # --- WISHLIST MODULE ---
 
+WISHLIST_PER_PAGE = 24
+WISHLIST_STATE_MAX_IDS = 200
+
 @login_required
 def toggle_wishlist(request, product_id):
     """AJAX view to add or remove a product from the user's wishlist."""
-    product = get_object_or_404(Product, id=product_id)
-    profile = request.user.profile
-    
-    if product in profile.wishlist.all():
-        profile.wishlist.remove(product)
-        added = False
-        message = f"{product.name} removed from wishlist."
-    else:
-        profile.wishlist.add(product)
-        added = True
+    product = get_object_or_404(Product.objects.only('id', 'name'), id=product_id)
+    added = toggle_wishlist_item(request.user, product.id)
+    if added:
         message = f"{product.name} added to wishlist."
+    else:
+        message = f"{product.name} removed from wishlist."
         
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
         return JsonResponse({
@@ -102,24 +158,55 @@ def toggle_wishlist(request, product_id):
     messages.success(request, message)
     return redirect(request.META.get('HTTP_REFERER', 'product_list'))
 
+def wishlist_state(request):
+    """
+    JSON heart state for a batch of product IDs (?ids=1,2,3), so a page can
+    hydrate every card in one request. Anonymous visitors get all false.
+    """
+    ids = []
+    for raw in request.GET.get('ids', '').split(','):
+        # isdecimal, not isdigit: superscripts like '²' are digits that int() rejects
+        if raw.strip().isdecimal():
+            ids.append(int(raw))
+        if len(ids) == WISHLIST_STATE_MAX_IDS:
+            break
+    saved = wishlist_ids(request.user)
+    return JsonResponse({'wishlisted': {str(product_id): product_id in saved for product_id in ids}})
+
 @login_required
 def wishlist_view(request):
     """Displays the user's saved items."""
-    wishlist_items = request.user.profile.wishlist.all()
+    # Page over the M2M rows themselves, newest first, joined to their products
+    saved = (
+        request.user.profile.wishlist.through.objects
+        .filter(profile=request.user.profile)
+        .select_related('product__category')
+    )
+    page = keyset_paginate(saved, request.GET.get('cursor'), WISHLIST_PER_PAGE, ordering=('-id',))
+    page.items = attach_card_versions([row.product for row in page.items])
+
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return load_more_response(request, page, 'products/includes/wishlist_cards.html', {
+            'wishlist_items': page
+        })
+
     return render(request, 'products/wishlist.html', {
-        'wishlist_items': wishlist_items
+        'wishlist_items': page,
+        'next_url': next_page_url(request, page)
     })
 
 # --- CART OPERATIONS ---
 
+@idempotent('add_to_cart')
 def add_to_cart(request, product_id):
     """Handles cart additions via AJAX or standard Redirect."""
-    cart = Cart(request)
+    cart = get_cart(request)
     product = get_object_or_404(Product, id=product_id)
     
     if product.stock < 1:
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
             return JsonResponse({'status': 'error', 'message': 'Out of stock'}, status=400)
+        release_key(request)
         messages.error(request, "Sorry, this item is out of stock.")
         return redirect('product_list')
 
@@ -137,14 +224,14 @@ def add_to_cart(request, product_id):
 
 def cart_view(request):
     """Displays cart contents."""
-    cart = Cart(request)
+    cart = get_cart(request)
     return render(request, 'products/cart.html', {
         'cart': cart,
         'total_price': cart.get_total_price()
     })
 
 def remove_from_cart(request, product_id):
-    cart = Cart(request)
+    cart = get_cart(request)
     product = get_object_or_404(Product, id=product_id)
     cart.remove(product)
     messages.info(request, f"{product.name} removed from your collection.")
@@ -154,7 +241,7 @@ def update_cart(request, product_id):
     if request.method == "POST":
         try:
             quantity = int(request.POST.get("quantity", 1))
-            cart = Cart(request)
+            cart = get_cart(request)
             product = get_object_or_404(Product, id=product_id)
             
             if 0 < quantity <= product.stock:
@@ -168,32 +255,28 @@ def update_cart(request, product_id):
 
 # --- VENDOR MODULE ---
 
+DASHBOARD_DAYS = 30
+IMPORT_ERRORS_SHOWN = 200
+
 @vendor_required
 def vendor_dashboard(request):
     """
-    Dashboard for vendors with database-level revenue aggregation.
+    Dashboard for vendors backed by the daily sales rollups.
     Orders products by most recent to ensure new data appears at the top.
     """
-    my_products = Product.objects.filter(vendor=request.user).order_by('-id')
-    my_sales = OrderItem.objects.filter(product__vendor=request.user)
-    
-    # Calculate revenue using Sum and F expressions for efficiency
-    stats = my_sales.aggregate(
-        total_revenue=Sum(F('price') * F('quantity'))
-    )
-    total_revenue = stats['total_revenue'] or 0
+    my_products = Product.objects.filter(vendor=request.user).select_related('category').order_by('-id')
 
+    # Revenue, units and trends come from the daily rollup table, not the order history
     return render(request, 'products/vendor_dashboard.html', {
         'products': my_products,
-        'total_revenue': total_revenue,
-        'sales_count': my_sales.count()
+        **vendor_summary(request.user, days=DASHBOARD_DAYS),
     })
 
 @vendor_required
 def vendor_add_product(request):
     """Vendor-facing form to add new inventory. Automatically sets product to available."""
     if request.method == 'POST':
-        form = ProductForm(request.POST, request.FILES)
+        form = ProductForm(request.POST, request.FILES, vendor=request.user)
         if form.is_valid():
             product = form.save(commit=False)
             product.vendor = request.user
@@ -202,7 +285,7 @@ def vendor_add_product(request):
             messages.success(request, f"Product '{product.name}' listed successfully!")
             return redirect('vendor_dashboard')
     else:
-        form = ProductForm()
+        form = ProductForm(vendor=request.user)
     
     return render(request, 'products/vendor_product_form.html', {
         'form': form, 
@@ -214,7 +297,7 @@ def vendor_edit_product(request, slug):
     """Vendor-facing form to edit their own inventory."""
     product = get_object_or_404(Product, slug=slug, vendor=request.user)
     if request.method == 'POST':
-        form = ProductForm(request.POST, request.FILES, instance=product)
+        form = ProductForm(request.POST, request.FILES, instance=product, vendor=request.user)
         if form.is_valid():
             product = form.save(commit=False)
             product.available = True # ENSURE EDITED PRODUCTS REMAIN VISIBLE
@@ -222,13 +305,65 @@ def vendor_edit_product(request, slug):
             messages.success(request, f"Product '{product.name}' updated successfully.")
             return redirect('vendor_dashboard')
     else:
-        form = ProductForm(instance=product)
+        form = ProductForm(instance=product, vendor=request.user)
     
     return render(request, 'products/vendor_product_form.html', {
         'form': form, 
         'title': 'Edit Product'
     })
 
+@vendor_required
+def vendor_import_products(request):
+    """Bulk create/update of the vendor's products from a CSV or JSONL upload, matched by SKU."""
+    report = None
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        if upload is None:
+            messages.error(request, "Choose a CSV or JSONL file to import.")
+        else:
+            report = import_products(
+                request.user, upload, fmt=guess_format(upload.name), workers=settings.PRODUCT_IMPORT_WORKERS
+            )
+            if report.ok:
+                messages.success(request, f"Imported {report.created} new and {report.updated} updated products.")
+            else:
+                messages.warning(request, f"Imported {report.created + report.updated} products; {len(report.errors)} rows were skipped.")
+
+    return render(request, 'products/vendor_import.html', {
+        'report': report,
+        'errors': report.errors[:IMPORT_ERRORS_SHOWN] if report else [],
+        'columns': IMPORT_FIELDS,
+    })
+
+@login_required
+def vendor_stock_sync(request):
+    """
+    JSON endpoint for warehouse systems: POST {"items": [{"sku", "stock", "price"}, ...]}
+    sets stock and/or price on the vendor's products in a few set-based UPDATEs.
+    Clients authenticate like a browser: log in as the vendor to get session
+    and csrftoken cookies, then send both cookies plus an X-CSRFToken header.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'POST required'}, status=405)
+    if request.user.profile.role != 'Vendor':
+        return JsonResponse({'status': 'error', 'message': 'Vendor account required'}, status=403)
+
+    try:
+        items = json.loads(request.body).get('items')
+    except (ValueError, AttributeError):
+        items = None
+    if not isinstance(items, list):
+        return JsonResponse({'status': 'error', 'message': 'Body must be {"items": [...]}'}, status=400)
+    if len(items) > SYNC_MAX_ITEMS:
+        return JsonResponse({'status': 'error', 'message': f'At most {SYNC_MAX_ITEMS} items per request'}, status=400)
+
+    updated, errors = sync_vendor_stock(request.user, items)
+    return JsonResponse({
+        'status': 'success' if not errors else 'partial',
+        'updated': len(updated),
+        'errors': errors,
+    })
+
 @vendor_required
 def vendor_delete_product(request, slug):
     """Secure deletion of vendor-owned products."""
@@ -0,0 +1,52 @@
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+from .models import Product
+
+# Per-user set of wishlisted product IDs, dropped whenever the M2M rows change
+WISHLIST_TTL = 24 * 60 * 60
+
+Wishlist = Product.wishlisted_by.through
+
+
+def _key(user_id):
+    return f'products:wishlist:{user_id}'
+
+
+def wishlist_ids(user):
+    """The user's wishlisted product IDs: one cache get, or one indexed query on a miss."""
+    if not user.is_authenticated:
+        return set()
+    ids = cache.get(_key(user.pk))
+    if ids is None:
+        ids = set(Wishlist.objects.filter(profile__user_id=user.pk).values_list('product_id', flat=True))
+        cache.set(_key(user.pk), ids, WISHLIST_TTL)
+    return ids
+
+
+def invalidate(user_ids):
+    keys = [_key(user_id) for user_id in user_ids]
+    # Drop now and again after commit, so a concurrent read cannot re-cache the old rows
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def toggle_wishlist_item(user, product_id):
+    """
+    Adds or removes one product on the wishlist by writing the M2M row
+    directly: a DELETE on the (profile, product) unique index, then an INSERT
+    only if nothing was deleted. Returns True if the product is now wishlisted.
+    """
+    profile_id = user.profile.pk
+    rows = Wishlist.objects.filter(profile_id=profile_id, product_id=product_id)
+    added = False
+    if not rows.delete()[0]:
+        try:
+            with transaction.atomic():
+                Wishlist.objects.create(profile_id=profile_id, product_id=product_id)
+        except IntegrityError:
+            pass  # a concurrent toggle got there first; the product is on the list either way
+        added = True
+    # Direct through-table writes skip m2m_changed
+    invalidate([user.pk])
+    return added
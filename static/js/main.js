@@ -14,41 +14,87 @@ document.addEventListener("DOMContentLoaded", function () {
 
 
 // ===============================
-// BASIC FORM VALIDATION
+//  LOAD MORE (CURSOR PAGINATION)
 // ===============================
 
-document.addEventListener("submit", function (e) {
+document.addEventListener("click", function (e) {
 
-    const requiredFields = e.target.querySelectorAll("[required]");
-    let valid = true;
+    const button = e.target.closest(".btn-load-more");
+    if (!button) return;
 
-    requiredFields.forEach(field => {
-        if (!field.value.trim()) {
-            field.classList.add("is-invalid");
-            valid = false;
-        } else {
-            field.classList.remove("is-invalid");
-        }
-    });
+    // Without JS the button is a plain link to the next page
+    e.preventDefault();
+    if (button.classList.contains("disabled")) return;
+    button.classList.add("disabled");
+
+    fetch(button.getAttribute("href"), { headers: { "X-Requested-With": "XMLHttpRequest" } })
+        .then(res => res.json())
+        .then(data => {
+            document.getElementById(button.dataset.target).insertAdjacentHTML("beforeend", data.html);
+            if (data.next_url) {
+                button.setAttribute("href", data.next_url);
+                button.classList.remove("disabled");
+            } else {
+                button.remove();
+            }
+        })
+        .catch(() => button.classList.remove("disabled"));
 
-    if (!valid) {
-        e.preventDefault();
-        alert("Please fill in all required fields.");
-    }
 });
 
 
 // ===============================
-//  AUTO UPDATE CART QUANTITY
+//  SEARCH AUTOCOMPLETE
 // ===============================
 
-document.addEventListener("change", function (e) {
+document.addEventListener("DOMContentLoaded", function () {
+
+    const input = document.querySelector("[data-suggest-url]");
+    if (!input) return;
 
-    if (e.target.name === "quantity") {
-        const form = e.target.closest("form");
-        if (form) {
-            form.submit();
+    const panel = input.closest("form").querySelector(".search-suggestions");
+    let timer = null;
+    let latest = 0;
+
+    function escapeHtml(text) {
+        const div = document.createElement("div");
+        div.textContent = text;
+        return div.innerHTML;
+    }
+
+    function render(data) {
+        let html = "";
+        if (data.categories.length) {
+            html += '<div class="suggestion-heading">Categories</div>';
+            data.categories.forEach(c => html += `<a class="suggestion-item" href="${c.url}">${escapeHtml(c.name)}</a>`);
+        }
+        if (data.products.length) {
+            html += '<div class="suggestion-heading">Products</div>';
+            data.products.forEach(p => html += `<a class="suggestion-item" href="${p.url}">${escapeHtml(p.name)}</a>`);
         }
+        panel.innerHTML = html;
+        panel.classList.toggle("d-none", !html);
     }
 
+    input.addEventListener("input", function () {
+        clearTimeout(timer);
+        const query = input.value.trim();
+        if (!query) {
+            panel.classList.add("d-none");
+            return;
+        }
+        // Debounce keystrokes and ignore responses that arrive out of order
+        timer = setTimeout(function () {
+            const request = ++latest;
+            fetch(`${input.dataset.suggestUrl}?q=${encodeURIComponent(query)}`)
+                .then(res => res.json())
+                .then(data => { if (request === latest) render(data); })
+                .catch(() => panel.classList.add("d-none"));
+        }, 120);
+    });
+
+    document.addEventListener("click", function (e) {
+        if (!e.target.closest(".search-wrapper")) panel.classList.add("d-none");
+    });
+
 });
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:22
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0006_profile_is_verified_profile_otp"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="profile",
+            name="otp",
+        ),
+    ]
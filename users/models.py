@@ -1,8 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save
 from django.dispatch import receiver
-import random
 
 class Profile(models.Model):
     # Role-based access (Admin, Vendor, Customer)
@@ -36,14 +35,39 @@ class Profile(models.Model):
 
     wishlist = models.ManyToManyField('products.Product', blank=True, related_name='wishlisted_by')
 
-    # OTP and Verification fields..
-
-    otp = models.CharField(max_length=6, blank=True, null=True)
+    # Verification status; OTP codes themselves are kept hashed in the cache (users.otp)
     is_verified = models.BooleanField(default=False)
 
     def __str__(self):
         return f"{self.user.username} ({self.role})"
 
+    # Dirty-field tracking: remember what was loaded so saves can skip untouched rows
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_state = instance._field_state()
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_state = self._field_state()
+
+    def _field_state(self):
+        deferred = self.get_deferred_fields()
+        return {
+            field.name: field.get_prep_value(field.value_from_object(self))
+            for field in self._meta.concrete_fields
+            if field.attname not in deferred
+        }
+
+    def get_dirty_fields(self):
+        """Names of fields changed since the row was loaded or saved, or None for an unsaved profile."""
+        loaded = getattr(self, '_loaded_state', None)
+        if loaded is None:
+            return None
+        current = self._field_state()
+        return [name for name, value in current.items() if name in loaded and loaded[name] != value]
+
     # Helper properties for easy role checking in views/templates
     @property
     def is_vendor(self):
@@ -52,12 +76,6 @@ class Profile(models.Model):
     @property
     def is_customer(self):
         return self.role == 'Customer'
-    
-    # OTP Generation
-    def generate_otp(self):
-        self.otp = str(random.randint(100000,999999))
-        self.save()
-        return self.otp 
 
 # --- CONSOLIDATED SIGNALS ---
 
@@ -67,6 +85,26 @@ def manage_user_profile(sender, instance, created, **kwargs):
         # Using get_or_create to prevent IntegrityErrors if a profile was somehow created via another process (like admin)
         Profile.objects.get_or_create(user=instance)
     else:
-        # Only save the profile if it already exists
-        if hasattr(instance, 'profile'):
-            instance.profile.save()
\ No newline at end of file
+        # Only a profile already loaded on this user can hold unsaved edits; looking
+        # it up otherwise (e.g. for login()'s last_login update) would cost a query
+        profile = Profile.user.field.remote_field.get_cached_value(instance, default=None)
+        if profile is None:
+            return
+        dirty = profile.get_dirty_fields()
+        if dirty is None:
+            profile.save()
+        elif dirty:
+            profile.save(update_fields=dirty)
+
+
+@receiver(pre_save, sender=Profile, dispatch_uid='detect_profile_image_upload')
+def detect_profile_image_upload(sender, instance, **kwargs):
+    instance._image_uploaded = bool(instance.profile_image) and not instance.profile_image._committed
+
+
+@receiver(post_save, sender=Profile, dispatch_uid='resize_profile_image')
+def resize_profile_image(sender, instance, **kwargs):
+    if getattr(instance, '_image_uploaded', False):
+        # Resized variants are generated off the request thread
+        from products.thumbnails import schedule_variants
+        schedule_variants(instance.profile_image)
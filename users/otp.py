@@ -0,0 +1,109 @@
+import secrets
+import time
+
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+# One-time passwords live only in the cache: a keyed hash of the code plus an
+# attempt counter, both expiring after OTP_TTL. Nothing is written to the
+# profile row, and a leaked cache entry does not reveal the code.
+OTP_TTL = 10 * 60
+OTP_MAX_ATTEMPTS = 5
+
+# Token buckets as (capacity, seconds per refilled token)
+ISSUE_PER_EMAIL = (3, 60)
+ISSUE_PER_IP = (10, 30)
+VERIFY_PER_EMAIL = (10, 30)
+VERIFY_PER_IP = (20, 10)
+
+VALID = 'valid'
+INVALID = 'invalid'
+EXPIRED = 'expired'
+LOCKED = 'locked'
+
+
+def _code_key(user_id):
+    return f'users:otp:{user_id}'
+
+
+def _attempts_key(user_id):
+    return f'users:otp-attempts:{user_id}'
+
+
+def _digest(user_id, code):
+    return salted_hmac('users.otp', f'{user_id}:{code}', algorithm='sha256').hexdigest()
+
+
+def issue(user_id):
+    """Creates a fresh code for the user, replacing any earlier one, and returns it."""
+    code = f'{secrets.randbelow(1000000):06d}'
+    cache.set_many({_code_key(user_id): _digest(user_id, code), _attempts_key(user_id): 0}, OTP_TTL)
+    return code
+
+
+def verify(user_id, code):
+    """
+    Checks a submitted code against the cache only. A correct code is
+    consumed; OTP_MAX_ATTEMPTS wrong guesses burn the code so it cannot be
+    brute-forced within its lifetime. Returns VALID, INVALID, EXPIRED or LOCKED.
+    """
+    digest = cache.get(_code_key(user_id))
+    if digest is None:
+        return EXPIRED
+    try:
+        attempts = cache.incr(_attempts_key(user_id))
+    except ValueError:
+        # Counter evicted ahead of the code; treat as exhausted rather than reset it
+        attempts = OTP_MAX_ATTEMPTS + 1
+    if attempts > OTP_MAX_ATTEMPTS:
+        discard(user_id)
+        return LOCKED
+    if not constant_time_compare(digest, _digest(user_id, code)):
+        return INVALID
+    discard(user_id)
+    return VALID
+
+
+def discard(user_id):
+    cache.delete_many([_code_key(user_id), _attempts_key(user_id)])
+
+
+# --- RATE LIMITING ---
+
+def take_token(bucket, capacity, refill_seconds):
+    """
+    Token bucket kept in the cache: holds up to `capacity` tokens and regains
+    one every `refill_seconds`. Returns False when the bucket is empty. The
+    read-modify-write is not atomic, so concurrent requests may occasionally
+    both win the last token; that slack is fine for throttling.
+    """
+    key = f'users:bucket:{bucket}'
+    now = time.time()
+    tokens, updated_at = cache.get(key, (capacity, now))
+    tokens = min(capacity, tokens + (now - updated_at) / refill_seconds)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    # Once full again the entry carries no information, so let it lapse
+    cache.set(key, (tokens, now), int((capacity - tokens) * refill_seconds) + 1)
+    return allowed
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def allow_issue(request, email):
+    """Throttles OTP sends per address and per client."""
+    return (
+        take_token(f'otp-issue:ip:{client_ip(request)}', *ISSUE_PER_IP)
+        and take_token(f'otp-issue:email:{email.lower()}', *ISSUE_PER_EMAIL)
+    )
+
+
+def allow_verify(request, email):
+    """Throttles OTP guesses per address and per client, on top of the per-code attempt limit."""
+    return (
+        take_token(f'otp-verify:ip:{client_ip(request)}', *VERIFY_PER_IP)
+        and take_token(f'otp-verify:email:{email.lower()}', *VERIFY_PER_EMAIL)
+    )
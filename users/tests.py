@@ -1,3 +1,134 @@
+import re
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from jobs.models import OutboundEmail
+
+from . import otp as otp_codes
+
+
+def sent_code():
+    return re.search(r'\b(\d{6})\b', OutboundEmail.objects.latest('pk').body).group(1)
+
+
+class OTPTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'pw-123456')
+
+    def request_otp(self, email='alice@example.com', **extra):
+        return self.client.post(reverse('login'), {'login_type': 'otp', 'email': email}, **extra)
+
+    def test_codes_are_hashed_single_use_and_burn_after_max_attempts(self):
+        code = otp_codes.issue(self.user.id)
+        self.assertNotIn(code, str(cache.get(otp_codes._code_key(self.user.id))))
+        self.assertEqual(otp_codes.verify(self.user.id, code), otp_codes.VALID)
+        self.assertEqual(otp_codes.verify(self.user.id, code), otp_codes.EXPIRED)
+
+        code = otp_codes.issue(self.user.id)
+        wrong = f'{(int(code) + 1) % 1000000:06d}'
+        for _ in range(otp_codes.OTP_MAX_ATTEMPTS):
+            self.assertEqual(otp_codes.verify(self.user.id, wrong), otp_codes.INVALID)
+        self.assertEqual(otp_codes.verify(self.user.id, code), otp_codes.LOCKED)
+        self.assertEqual(otp_codes.verify(self.user.id, code), otp_codes.EXPIRED)
+
+    def test_otp_login_verifies_from_the_cache_and_marks_the_profile_verified(self):
+        self.assertRedirects(self.request_otp(), reverse('verify_otp'), fetch_redirect_response=False)
+        code = sent_code()
+
+        # A wrong guess is answered from the cache and session alone
+        with self.assertNumQueries(1):  # the session lookup
+            self.client.post(reverse('verify_otp'), {'otp': '000000' if code != '000000' else '111111'})
+
+        response = self.client.post(reverse('verify_otp'), {'otp': code})
+        self.assertRedirects(response, reverse('product_list'), fetch_redirect_response=False)
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.user.id)
+        self.user.profile.refresh_from_db()
+        self.assertTrue(self.user.profile.is_verified)
+
+    def test_issuing_is_rate_limited_per_email(self):
+        capacity = otp_codes.ISSUE_PER_EMAIL[0]
+        for _ in range(capacity):
+            self.assertEqual(self.request_otp().status_code, 302)
+        self.assertEqual(self.request_otp().status_code, 429)
+        self.assertEqual(OutboundEmail.objects.count(), capacity)
+
+        # Other addresses from the same client still get through
+        User.objects.create_user('bob', 'bob@example.com', 'pw-123456')
+        self.assertEqual(self.request_otp('bob@example.com').status_code, 302)
+
+    def test_issuing_is_rate_limited_per_ip(self):
+        capacity = otp_codes.ISSUE_PER_IP[0]
+        for n in range(capacity):
+            self.request_otp(f'nobody{n}@example.com', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(self.request_otp(REMOTE_ADDR='10.0.0.1').status_code, 429)
+        self.assertEqual(self.request_otp(REMOTE_ADDR='10.0.0.2').status_code, 302)
+
+    def test_verification_is_rate_limited(self):
+        self.request_otp()
+        capacity = otp_codes.VERIFY_PER_EMAIL[0]
+        for _ in range(capacity):
+            self.client.post(reverse('verify_otp'), {'otp': '999999'})
+        response = self.client.post(reverse('verify_otp'), {'otp': sent_code()})
+        self.assertEqual(response.status_code, 429)
+
+
+class ProfileWriteTests(TestCase):
+    """login() saves the user for last_login; that must not cascade into a profile UPDATE."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('carol', 'carol@example.com', 'pw-123456')
+
+    def writes(self, queries, table, statement='UPDATE'):
+        prefix = f'{statement} {connection.ops.quote_name(table)}'
+        return [q['sql'] for q in queries if q['sql'].startswith(prefix)]
+
+    def assertNoProfileWrites(self, queries):
+        self.assertEqual(self.writes(queries, 'users_profile') + self.writes(queries, 'users_profile', 'INSERT INTO'), [])
+
+    def test_password_login_writes_only_last_login(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('login'), {'username': 'carol', 'password': 'pw-123456'})
+        self.assertRedirects(response, reverse('product_list'), fetch_redirect_response=False)
+        self.assertNoProfileWrites(ctx.captured_queries)
+        self.assertEqual(len(self.writes(ctx.captured_queries, 'auth_user')), 1)
+
+    def test_otp_verify_flips_is_verified_once(self):
+        self.client.post(reverse('login'), {'login_type': 'otp', 'email': 'carol@example.com'})
+        code = sent_code()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('verify_otp'), {'otp': code})
+        self.assertRedirects(response, reverse('product_list'), fetch_redirect_response=False)
+        profile_updates = self.writes(ctx.captured_queries, 'users_profile')
+        self.assertEqual(len(profile_updates), 1)
+        self.assertIn(f"SET {connection.ops.quote_name('is_verified')} = ", profile_updates[0])
+        self.assertEqual(len(self.writes(ctx.captured_queries, 'auth_user')), 1)
+
+        # Once verified, later OTP logins leave the profile alone
+        self.client.logout()
+        self.client.post(reverse('login'), {'login_type': 'otp', 'email': 'carol@example.com'})
+        code = sent_code()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse('verify_otp'), {'otp': code})
+        self.assertNoProfileWrites(ctx.captured_queries)
+        self.assertEqual(len(self.writes(ctx.captured_queries, 'auth_user')), 1)
+
+    def test_saving_a_user_writes_only_changed_profile_fields(self):
+        user = User.objects.select_related('profile').get(pk=self.user.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            user.save()
+        self.assertNoProfileWrites(ctx.captured_queries)
 
-# Create your tests here.
+        user.profile.phone = '555-0100'
+        with CaptureQueriesContext(connection) as ctx:
+            user.save()
+        profile_updates = self.writes(ctx.captured_queries, 'users_profile')
+        self.assertEqual(len(profile_updates), 1)
+        self.assertIn(f"SET {connection.ops.quote_name('phone')} = ", profile_updates[0])
+        self.assertNotIn(connection.ops.quote_name('address'), profile_updates[0])
@@ -2,11 +2,12 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.contrib.auth.models import User
-import random
 from django import forms 
 
+from jobs.outbox import queue_email
+
+from . import otp as otp_codes
 from .forms import (
     UserRegisterForm,
     UserLoginForm,
@@ -18,19 +19,28 @@ from .forms import (
 # --- HELPER FUNCTIONS ---
 
 def send_otp_email(user):
-    otp = str(random.randint(100000, 999999))
-    profile = user.profile
-    profile.otp = otp
-    profile.save()
+    # The code only lives hashed in the cache; nothing is written to the profile
+    otp = otp_codes.issue(user.id)
 
-    send_mail(
+    # Delivered by the outbox worker; the request does not wait on SMTP
+    queue_email(
+        user.email,
         "ShopX Secure Access - Your OTP",
         f'Hello {user.username}, \n\nYour One-Time Password (OTP) is: {otp}\n\nPlease enter this code to finalize your access.\n\nStay Secure,\nShopX Team',
-        'noreply@shopx.com',
-        [user.email],
-        fail_silently=False,
+        from_email='noreply@shopx.com',
     )
 
+
+def start_otp_session(request, user):
+    # verify_otp reads these instead of loading the user on every attempt
+    request.session['temp_user_id'] = user.id
+    request.session['temp_user_email'] = user.email
+
+
+def rate_limited(request, template, context):
+    messages.error(request, "Too many attempts. Please wait a minute and try again.")
+    return render(request, template, context, status=429)
+
 # --- FORMS ---
 
 class OTPform(forms.Form):
@@ -55,6 +65,8 @@ def register(request):
     if request.method == "POST":
         form = UserRegisterForm(request.POST)
         if form.is_valid():
+            if not otp_codes.allow_issue(request, form.cleaned_data['email']):
+                return rate_limited(request, "users/register.html", {"form": form})
             user = form.save() 
             
             # Update the profile with the selected role from the POST data
@@ -66,7 +78,7 @@ def register(request):
             # Registration still uses OTP for email verification
             send_otp_email(user)
             messages.success(request, f'Account created! A verification OTP has been sent to {user.email}.')
-            request.session['temp_user_id'] = user.id
+            start_otp_session(request, user)
             return redirect('verify_otp')
     else:
         form = UserRegisterForm()
@@ -86,10 +98,16 @@ def login_view(request):
             otp_login_form = PasswordlessLoginForm(request.POST)
             if otp_login_form.is_valid():
                 email = otp_login_form.cleaned_data.get('email')
+                # Throttle before touching the database
+                if not otp_codes.allow_issue(request, email):
+                    return rate_limited(request, 'users/login.html', {
+                        'form': form,
+                        'otp_login_form': otp_login_form
+                    })
                 try:
                     user = User.objects.get(email=email)
                     send_otp_email(user)
-                    request.session['temp_user_id'] = user.id
+                    start_otp_session(request, user)
                     messages.info(request, "OTP sent for passwordless login.")
                     return redirect('verify_otp')
                 except User.DoesNotExist:
@@ -122,24 +140,31 @@ def login_view(request):
 
 
 def verify_otp(request):
-    """Verifies OTP for Registration and Passwordless Login paths."""
+    """
+    Verifies OTP for Registration and Passwordless Login paths. Codes are
+    checked against the cache; the user is only loaded once the code matches.
+    """
     user_id = request.session.get('temp_user_id')
     if not user_id:
         return redirect('login')
-    
-    user = User.objects.get(id=user_id)
+    user_email = request.session.get('temp_user_email', '')
     
     if request.method == 'POST':
         form = OTPform(request.POST)
         if form.is_valid():
-            entered_otp = form.cleaned_data.get('otp')
-            if user.profile.otp == entered_otp:
-                user.profile.is_verified = True
-                user.profile.otp = None 
-                user.profile.save()
+            if not otp_codes.allow_verify(request, user_email):
+                return rate_limited(request, 'users/verify_otp.html', {'form': form, 'user_email': user_email})
+
+            result = otp_codes.verify(user_id, form.cleaned_data.get('otp'))
+            if result == otp_codes.VALID:
+                user = User.objects.select_related('profile').get(id=user_id)
+                if not user.profile.is_verified:
+                    user.profile.is_verified = True
+                    user.profile.save(update_fields=['is_verified'])
                 
                 login(request, user)
                 del request.session['temp_user_id']
+                request.session.pop('temp_user_email', None)
                 
                 messages.success(request, f"Welcome, {user.username}!")
 
@@ -150,12 +175,14 @@ def verify_otp(request):
                     return redirect('/admin/')
                 
                 return redirect('product_list')
-            else:
+            elif result == otp_codes.INVALID:
                 messages.error(request, "Invalid OTP. Please try again.")
+            else:
+                messages.error(request, "This OTP has expired or had too many wrong attempts. Please request a new one.")
     else:
         form = OTPform()
     
-    return render(request, 'users/verify_otp.html', {'form': form, 'user_email': user.email})
+    return render(request, 'users/verify_otp.html', {'form': form, 'user_email': user_email})
 
 # --- REMAINDER OF VIEWS (Logout, Profile) UNCHANGED ---
 def logout_view(request):
@@ -174,8 +201,9 @@ def profile_edit(request):
         p_form = ProfileUpdateForm(request.POST, request.FILES, instance=request.user.profile)
 
         if u_form.is_valid() and p_form.is_valid():
-            u_form.save()
+            # Profile first, so the User post_save signal finds nothing left to write
             p_form.save()
+            u_form.save()
             messages.success(request, "Profile updated!")
             return redirect('profile')
     else: